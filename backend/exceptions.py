@@ -1,3 +1,11 @@
 class AttendanceValidationError(Exception):
     """Custom exception for attendance validation errors"""
-    pass 
\ No newline at end of file
+    pass 
+
+class RecordedTimeError(AttendanceValidationError):
+    """A client-supplied ``recorded_at`` that cannot be used; carries the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400, error_type='invalid_recorded_at'):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_type = error_type
@@ -11,12 +11,12 @@ from flask import Flask, current_app
 from extensions import db
 from models import FaceEncoding, InstructorFaceEncoding, Student, User
 from config import Config
+from utils.face_gallery_format import write_face_gallery, gallery_path_for
+from utils.face_gallery_index import write_face_index, index_path_for
+from utils.face_cache_meta import cache_state_lock, file_sha256, journal_file_lock
+from utils.face_cache_journal import pending_stale_marks, pending_stale_people, publish_gallery_changes
+from utils.embedding_backend import backend_available, get_backend
 import numpy as np
-try:
-    from deepface import DeepFace
-    DEEPFACE_AVAILABLE = True
-except ImportError as e:
-    DEEPFACE_AVAILABLE = False
 DEEPFACE_MODEL = 'Facenet512'
 DEEPFACE_DETECTOR = 'opencv'
 DEEPFACE_DISTANCE_METRIC = 'cosine'
@@ -49,33 +49,59 @@ def load_existing_face_data(cache_file):
     except Exception as e:
         return data
 
+def person_fingerprints(face_data):
+    """Map ``(person_type, person_id)`` to the bytes of that person's cached rows."""
+    fingerprints = {}
+    for prefix, person_type in (('student', 'Student'), ('instructor', 'Instructor')):
+        for embedding, name, person_id in zip(face_data[f'{prefix}_embeddings'], face_data[f'{prefix}_names'], face_data[f'{prefix}_ids']):
+            key = (person_type, str(person_id))
+            row = np.asarray(embedding, dtype=np.float32).tobytes() + str(name).encode('utf-8')
+            fingerprints[key] = fingerprints.get(key, b'') + row
+    return fingerprints
+
+def drop_people(face_data, people):
+    """Remove every cached row belonging to the given ``(person_type, person_id)`` keys."""
+    for prefix, person_type in (('student', 'Student'), ('instructor', 'Instructor')):
+        keep = [index for index, person_id in enumerate(face_data[f'{prefix}_ids']) if (person_type, str(person_id)) not in people]
+        for suffix in ('embeddings', 'names', 'ids'):
+            values = face_data[f'{prefix}_{suffix}']
+            face_data[f'{prefix}_{suffix}'] = [values[index] for index in keep]
+
+def write_gallery_files(cache_file, face_data):
+    """Write the binary gallery and its IVF index for ``face_data``.
+
+    Returns False when either write fails. The index is then removed, so
+    nothing built for an older gallery is served, and the run must stop
+    before publishing a generation the kiosks would pair with stale files.
+    """
+    try:
+        write_face_gallery(gallery_path_for(cache_file), face_data)
+        write_face_index(index_path_for(cache_file), gallery_path_for(cache_file))
+        return True
+    except Exception:
+        try:
+            os.remove(index_path_for(cache_file))
+        except OSError:
+            pass
+        return False
+
 def generate_face_embedding(image_path):
-    """Generate face embedding using DeepFace with FaceNet-512"""
-    if not DEEPFACE_AVAILABLE:
+    """Generate a FaceNet-512 face embedding with the configured embedding backend"""
+    if not backend_available():
         return np.zeros(512, dtype=np.float32)
     try:
+        backend = get_backend()
         detectors_to_try = [DEEPFACE_DETECTOR]
         for alt in ('retinaface', 'mtcnn'):
             if alt not in detectors_to_try:
                 detectors_to_try.append(alt)
+        detectors_to_try = [detector for detector in detectors_to_try if backend.supports_detector(detector)]
         for detector in detectors_to_try:
             try:
-                faces = DeepFace.extract_faces(img_path=image_path, detector_backend=detector, enforce_detection=True, align=True)
-                if not faces or len(faces) == 0:
-                    continue
-            except Exception as detect_error:
-                continue
-            try:
-                embedding_result = DeepFace.represent(img_path=image_path, model_name=DEEPFACE_MODEL, detector_backend=detector, enforce_detection=True, align=True)
+                face_embedding = backend.embed_image(image_path, detector=detector, enforce_detection=True, align=True)
             except Exception as rep_error:
                 continue
-            if embedding_result and len(embedding_result) > 0:
-                first = embedding_result[0]
-                if isinstance(first, dict) and 'embedding' in first:
-                    emb = first['embedding']
-                else:
-                    emb = first
-                face_embedding = np.array(emb, dtype=np.float32)
+            if face_embedding is not None:
                 return face_embedding
         return None
     except Exception as e:
@@ -153,7 +179,7 @@ def main(mode='all'):
     mode = (mode or 'all').lower()
     if mode not in {'all', 'new'}:
         mode = 'all'
-    if not DEEPFACE_AVAILABLE:
+    if not backend_available():
         return False
     app = create_app()
     with app.app_context():
@@ -161,8 +187,11 @@ def main(mode='all'):
             cache_dir = Path(__file__).parent / '..' / 'cache'
             cache_dir.mkdir(exist_ok=True)
             cache_file = cache_dir / 'face_encodings.pkl'
+            previous_data = load_existing_face_data(cache_file)
+            stale_marks = pending_stale_marks(cache_file)
             if mode == 'new':
                 face_data_seed = load_existing_face_data(cache_file)
+                drop_people(face_data_seed, pending_stale_people(cache_file, stale_marks))
             else:
                 face_data_seed = empty_face_data()
             student_embeddings = face_data_seed['student_embeddings']
@@ -176,8 +205,19 @@ def main(mode='all'):
             process_student_encodings(student_embeddings, student_names, student_ids, skip_ids=student_skip_ids)
             process_instructor_encodings(instructor_embeddings, instructor_names, instructor_ids, skip_ids=instructor_skip_ids)
             face_data = {'student_embeddings': student_embeddings, 'student_names': student_names, 'student_ids': student_ids, 'instructor_embeddings': instructor_embeddings, 'instructor_names': instructor_names, 'instructor_ids': instructor_ids}
-            with open(cache_file, 'wb') as f:
+            before = person_fingerprints(previous_data)
+            after = person_fingerprints(face_data)
+            changed = [key for key, fingerprint in after.items() if before.get(key) != fingerprint]
+            removed = [key for key in before if key not in after]
+            if not write_gallery_files(cache_file, face_data):
+                return False
+            temp_file = cache_file.with_name(cache_file.name + '.tmp')
+            with open(temp_file, 'wb') as f:
                 pickle.dump(face_data, f)
+            with cache_state_lock, journal_file_lock(cache_file):
+                publish_gallery_changes(cache_file, changed, removed, file_sha256(temp_file), processed_stale=stale_marks)
+                os.replace(temp_file, cache_file)
+            os.utime(gallery_path_for(cache_file))
             return True
         except Exception as e:
             return False
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
 from extensions import db
 from models import ClassSession, User, Class, Student, Enrollment, AttendanceRecord, InstructorAttendance, Course, FaceEncoding, InstructorFaceEncoding, AttendanceStatus, SystemSettings
 from datetime import datetime, time, date, timedelta
@@ -11,14 +11,27 @@ import time as time_module
 from utils.timezone import get_pst_now, pst_now_naive
 from utils.system_settings_helper import DEFAULT_ROOM_NUMBERS, load_room_numbers
 from utils.attendance_manager import AttendanceTimeValidator
+from utils.attendance_batch import MAX_BATCH_ITEMS, ingest_attendance_batch, resolve_recorded_time
+from exceptions import RecordedTimeError
 from utils.schedule_parser import resolve_schedule_window
+from utils.face_cache_meta import describe_face_cache
+from utils.face_cache_journal import changes_since, mark_person_stale
+from utils.face_gallery_index import INDEX_FILENAME, index_path_for
+from utils.live_events import event_stream
+from utils.response_cache import CachedPayload, conditional_json
+from utils.embedding_backend import backend_available, get_backend
 from flask_login import login_required
 from werkzeug.utils import secure_filename
 import uuid
+import json
 import os
+import pickle
+import threading
 from flask import url_for
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 DEFAULT_AUTO_TIMEOUT_MINUTES = 60
+ACTIVE_SESSIONS_PAYLOAD = CachedPayload(ClassSession, Class)
+_face_cache_rows_memo = {}
 from config import Config
 limiter = Limiter(key_func=get_remote_address, default_limits=['100 per minute'], storage_uri=Config.RATELIMIT_STORAGE_URL)
 
@@ -36,6 +49,18 @@ def _payload_value(payload, *keys, default=None):
             return payload[key]
     return default
 
+def _client_recorded_time(payload):
+    """PST-naive time a kiosk journaled a write at; now when the payload has no ``recorded_at``.
+
+    Kiosks queue check-ins and checkouts while the backend is unreachable and
+    send ``recorded_at`` so a late delivery keeps the real scan time. Raises
+    :class:`RecordedTimeError` for values the shared policy rejects.
+    """
+    return resolve_recorded_time(_payload_value(payload, 'recorded_at', 'recordedAt'))
+
+def _recorded_time_error(exc):
+    return (jsonify({'success': False, 'error': str(exc), 'message': str(exc), 'error_type': exc.error_type}), exc.status_code)
+
 def _status_enum(raw_status, default=AttendanceStatus.LATE):
     if isinstance(raw_status, AttendanceStatus):
         return raw_status
@@ -52,23 +77,10 @@ def before_request_api():
     if request.endpoint and request.endpoint.startswith('api.') and (request.endpoint not in ['api.get_instructors', 'api.health_check', 'api.upload_instructor_images_api']):
         return require_api_key()
 import re
-DEEPFACE_AVAILABLE = False
 DEEPFACE_MODEL = 'Facenet512'
 DEEPFACE_DETECTOR = 'opencv'
 DEEPFACE_DISTANCE_METRIC = 'cosine'
 
-def get_deepface():
-    """Lazy import of DeepFace to avoid startup issues"""
-    global DEEPFACE_AVAILABLE
-    if not DEEPFACE_AVAILABLE:
-        try:
-            import deepface
-            DEEPFACE_AVAILABLE = True
-            return deepface
-        except ImportError:
-            return None
-    return __import__('deepface')
-
 @api_bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -100,38 +112,136 @@ def get_room_numbers_api():
     except Exception as exc:
         return (jsonify({'success': False, 'message': 'Unable to load room numbers'}), 500)
 
-@api_bp.route('/face-encodings', methods=['GET'])
-def download_face_encodings():
-    """Stream the latest face encoding cache so kiosks can stay in sync."""
+def _face_encodings_cache_path():
     cache_path = current_app.config.get('FACE_ENCODINGS_CACHE')
     if not cache_path:
         cache_path = os.path.abspath(os.path.join(current_app.root_path, '..', 'cache', 'face_encodings.pkl'))
+    return cache_path
+
+@api_bp.route('/face-encodings', methods=['GET'])
+def download_face_encodings():
+    """Stream the latest face encoding cache so kiosks can stay in sync.
+
+    Honors If-None-Match / If-Modified-Since so unchanged caches return 304.
+    """
+    cache_path = _face_encodings_cache_path()
     if not os.path.exists(cache_path):
         return (jsonify({'success': False, 'message': 'Face encoding cache not found'}), 404)
     try:
-        return send_file(cache_path, mimetype='application/octet-stream', as_attachment=True, download_name='face_encodings.pkl')
+        meta = describe_face_cache(cache_path)
+        response = send_file(cache_path, mimetype='application/octet-stream', as_attachment=True, download_name='face_encodings.pkl', etag=meta['hash'], last_modified=meta['last_modified'], max_age=0, conditional=True)
+        response.headers['X-Face-Cache-Generation'] = str(meta['generation'])
+        return response
     except Exception as exc:
         return (jsonify({'success': False, 'message': 'Unable to load face encodings'}), 500)
 
+@api_bp.route('/face-encodings/index', methods=['GET'])
+def download_face_encodings_index():
+    """Stream the IVF index built for the current gallery; 404 when the gallery is too small to need one."""
+    index_path = index_path_for(_face_encodings_cache_path())
+    if not os.path.exists(index_path):
+        return (jsonify({'success': False, 'message': 'Face gallery index not found'}), 404)
+    try:
+        return send_file(index_path, mimetype='application/octet-stream', as_attachment=True, download_name=INDEX_FILENAME, max_age=0, conditional=True)
+    except Exception as exc:
+        return (jsonify({'success': False, 'message': 'Unable to load face gallery index'}), 500)
+
+@api_bp.route('/face-encodings/meta', methods=['GET'])
+def face_encodings_meta():
+    """Describe the face encoding cache so kiosks can skip unchanged downloads."""
+    cache_path = _face_encodings_cache_path()
+    if not os.path.exists(cache_path):
+        return (jsonify({'success': False, 'message': 'Face encoding cache not found'}), 404)
+    try:
+        meta = describe_face_cache(cache_path)
+        response = jsonify({'success': True, 'hash': meta['hash'], 'generation': meta['generation'], 'size': meta['size'], 'entry_count': meta['entry_count'], 'mtime': meta['mtime']})
+        response.set_etag(meta['hash'])
+        return response.make_conditional(request)
+    except Exception as exc:
+        return (jsonify({'success': False, 'message': 'Unable to describe face encodings'}), 500)
+
+def _face_cache_rows(cache_path, generation):
+    """Gallery rows grouped by ``(person_type, str(person_id))``, loaded once per cache generation."""
+    cached = _face_cache_rows_memo.get(cache_path)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    with open(cache_path, 'rb') as cache_file:
+        face_data = pickle.load(cache_file)
+    rows = {}
+    for prefix, person_type in (('student', 'Student'), ('instructor', 'Instructor')):
+        for embedding, name, person_id in zip(face_data.get(f'{prefix}_embeddings') or [], face_data.get(f'{prefix}_names') or [], face_data.get(f'{prefix}_ids') or []):
+            entry = rows.setdefault((person_type, str(person_id)), {'person_type': person_type, 'person_id': person_id, 'name': name, 'embeddings': []})
+            entry['embeddings'].append([float(value) for value in embedding])
+    _face_cache_rows_memo.clear()
+    _face_cache_rows_memo[cache_path] = (generation, rows)
+    return rows
+
+@api_bp.route('/face-encodings/delta', methods=['GET'])
+def face_encodings_delta():
+    """Return the gallery rows added, replaced or removed since a generation.
+
+    Kiosks replace every row of each ``upserts`` person and drop each
+    ``removed`` person. A 410 means the journal no longer reaches back to
+    ``since`` and a full download is required.
+    """
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return (jsonify({'success': False, 'message': 'Query parameter since must be a non-negative generation number'}), 400)
+    cache_path = _face_encodings_cache_path()
+    if not os.path.exists(cache_path):
+        return (jsonify({'success': False, 'message': 'Face encoding cache not found'}), 404)
+    try:
+        meta = describe_face_cache(cache_path)
+        changes = changes_since(cache_path, since)
+        if changes is None:
+            return (jsonify({'success': False, 'full_sync_required': True, 'generation': meta['generation'], 'hash': meta['hash'], 'message': 'Change journal does not cover the requested generation'}), 410)
+        upserts = {}
+        if any((op == 'upsert' for op in changes.values())):
+            rows = _face_cache_rows(cache_path, meta['generation'])
+            upserts = {key: rows[key] for key, op in changes.items() if op == 'upsert' and key in rows}
+        removed = [{'person_type': person_type, 'person_id': person_id} for (person_type, person_id), op in changes.items() if op == 'remove' or (op == 'upsert' and (person_type, person_id) not in upserts)]
+        return jsonify({'success': True, 'since': since, 'generation': meta['generation'], 'hash': meta['hash'], 'upserts': list(upserts.values()), 'removed': removed})
+    except Exception as exc:
+        return (jsonify({'success': False, 'message': 'Unable to build face encoding delta'}), 500)
+
+@api_bp.route('/events', methods=['GET'])
+def stream_live_events():
+    """Stream session, view-lock, class and gallery changes to kiosks as Server-Sent Events."""
+    cache_path = _face_encodings_cache_path()
+
+    def gallery_generation():
+        return describe_face_cache(cache_path)['generation'] if os.path.exists(cache_path) else None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(stream_with_context(event_stream(last_event_id, gallery_generation)), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @api_bp.route('/sessions/active', methods=['GET'])
 def get_active_class_sessions():
-    """Return class sessions that are currently running so every kiosk stays in sync."""
+    """Return class sessions that are currently running so every kiosk stays in sync.
+
+    The body is cached until a class or session changes, and kiosks revalidate with ``If-None-Match``.
+    """
     try:
         now = pst_now_naive()
-        today = now.date()
         max_age_hours = current_app.config.get('SESSION_ACTIVE_WINDOW_HOURS', 6)
-        min_allowed_start = now - timedelta(hours=max_age_hours)
-        sessions = ClassSession.query.filter(ClassSession.date == today, ClassSession.start_time.isnot(None), ClassSession.is_attendance_processed == False).all()
-        active_sessions = []
-        for session in sessions:
-            if session.start_time and session.start_time < min_allowed_start:
-                continue
-            cls = Class.query.get(session.class_id)
-            scheduled_end = session.scheduled_end_time
-            if not scheduled_end and session.start_time:
-                scheduled_end = session.start_time + timedelta(minutes=DEFAULT_AUTO_TIMEOUT_MINUTES)
-            active_sessions.append({'class_session_id': session.id, 'class_id': session.class_id, 'start_time': session.start_time.isoformat() if session.start_time else None, 'room_number': session.session_room_number or (cls.room_number if cls else None), 'class_code': cls.class_code if cls else None, 'description': cls.description if cls else None, 'instructor_id': session.instructor_id, 'scheduled_end_time': scheduled_end.isoformat() if scheduled_end else None, 'timeout_deadline': scheduled_end.isoformat() if scheduled_end else None, 'is_attendance_processed': bool(session.is_attendance_processed), 'view_lock_owner': session.view_lock_owner, 'view_lock_acquired_at': session.view_lock_acquired_at.isoformat() if session.view_lock_acquired_at else None})
-        return (jsonify({'success': True, 'sessions': active_sessions}), 200)
+
+        def build():
+            now = pst_now_naive()
+            min_allowed_start = now - timedelta(hours=max_age_hours)
+            sessions = ClassSession.query.filter(ClassSession.date == now.date(), ClassSession.start_time.isnot(None), ClassSession.is_attendance_processed == False).all()
+            active_sessions = []
+            expires_at = None
+            for session in sessions:
+                if session.start_time and session.start_time < min_allowed_start:
+                    continue
+                ages_out = time_module.time() + (session.start_time - min_allowed_start).total_seconds()
+                expires_at = ages_out if expires_at is None else min(expires_at, ages_out)
+                cls = Class.query.get(session.class_id)
+                scheduled_end = session.scheduled_end_time
+                if not scheduled_end and session.start_time:
+                    scheduled_end = session.start_time + timedelta(minutes=DEFAULT_AUTO_TIMEOUT_MINUTES)
+                active_sessions.append({'class_session_id': session.id, 'class_id': session.class_id, 'start_time': session.start_time.isoformat() if session.start_time else None, 'room_number': session.session_room_number or (cls.room_number if cls else None), 'class_code': cls.class_code if cls else None, 'description': cls.description if cls else None, 'instructor_id': session.instructor_id, 'scheduled_end_time': scheduled_end.isoformat() if scheduled_end else None, 'timeout_deadline': scheduled_end.isoformat() if scheduled_end else None, 'is_attendance_processed': bool(session.is_attendance_processed), 'view_lock_owner': session.view_lock_owner, 'view_lock_acquired_at': session.view_lock_acquired_at.isoformat() if session.view_lock_acquired_at else None})
+            return ({'success': True, 'sessions': active_sessions}, expires_at)
+        return conditional_json(ACTIVE_SESSIONS_PAYLOAD, (now.date(), max_age_hours), build)
     except Exception as exc:
         return (jsonify({'success': False, 'message': 'Failed to load active class sessions'}), 500)
 
@@ -241,6 +351,19 @@ def get_instructor_class_students_api(instructor_id, class_id):
     except Exception as e:
         return (jsonify({'success': False, 'message': 'Failed to load class students'}), 500)
 
+@api_bp.route('/classes/<int:class_id>/roster', methods=['GET'])
+def get_class_roster(class_id):
+    """Return the people a kiosk should match for a class: enrolled students plus its instructors."""
+    try:
+        cls = Class.query.get(class_id)
+        if not cls:
+            return (jsonify({'success': False, 'message': 'Class not found'}), 404)
+        student_ids = [row.student_id for row in Enrollment.query.with_entities(Enrollment.student_id).filter_by(class_id=class_id).all()]
+        instructor_ids = [instructor_id for instructor_id in (cls.instructor_id, cls.substitute_instructor_id) if instructor_id is not None]
+        return jsonify({'success': True, 'class_id': class_id, 'student_ids': sorted(set(student_ids)), 'instructor_ids': instructor_ids, 'primary_instructor_id': cls.instructor_id, 'substitute_instructor_id': cls.substitute_instructor_id})
+    except Exception as e:
+        return (jsonify({'success': False, 'message': 'Failed to load class roster'}), 500)
+
 def sanitize_name_for_folder(name):
     """
     Sanitize a name to be safe for use as a folder name.
@@ -256,13 +379,11 @@ def sanitize_name_for_folder(name):
 
 def generate_face_embedding(image_path):
     try:
-        deepface = get_deepface()
-        if not deepface:
+        if not backend_available():
             return None
-        embedding = deepface.DeepFace.represent(img_path=image_path, model_name=DEEPFACE_MODEL, detector_backend=DEEPFACE_DETECTOR, enforce_detection=False)
-        if embedding and len(embedding) > 0:
-            embedding_array = embedding[0]['embedding']
-            return embedding_array
+        embedding = get_backend().embed_image(image_path, detector=DEEPFACE_DETECTOR, enforce_detection=False)
+        if embedding is not None:
+            return embedding.tolist()
         else:
             return None
     except Exception as e:
@@ -443,7 +564,11 @@ def instructor_checkout():
         instructor = User.query.filter_by(id=instructor_id, role='instructor').first()
         if not instructor:
             return (jsonify({'error': f'Instructor with ID {instructor_id} not found'}), 404)
-        today = date.today()
+        try:
+            checkout_time = _client_recorded_time(data)
+        except RecordedTimeError as exc:
+            return _recorded_time_error(exc)
+        today = checkout_time.date()
         class_sessions = []
         if class_session_id is not None:
             class_session = ClassSession.query.get(class_session_id)
@@ -474,7 +599,7 @@ def instructor_checkout():
         total_absent_count = 0
         session_results = []
         for class_session in class_sessions:
-            session_checkout_time = pst_now_naive()
+            session_checkout_time = checkout_time
             enrollments = Enrollment.query.filter_by(class_id=class_session.class_id).all()
             enrolled_student_ids = [e.student_id for e in enrollments]
             existing_attendance = AttendanceRecord.query.filter_by(class_session_id=class_session.id).all()
@@ -592,6 +717,63 @@ def health_check():
     except Exception as e:
         return (jsonify({'status': 'unhealthy', 'error': str(e)}), 500)
 
+KIOSK_METRICS_LOG_MAX_BYTES = 5 * 1024 * 1024
+KIOSK_METRICS_MAX_KIOSKS = 500
+_KIOSK_METRICS = {}
+_kiosk_metrics_lock = threading.Lock()
+
+def _kiosk_metrics_log_path():
+    log_path = current_app.config.get('KIOSK_METRICS_LOG')
+    if not log_path:
+        log_path = os.path.join(os.path.dirname(_face_encodings_cache_path()), 'kiosk_metrics.jsonl')
+    return log_path
+
+def _append_kiosk_metrics(log_path, line):
+    """Append ``line`` to the metrics log, first moving a log past ``KIOSK_METRICS_LOG_MAX_BYTES`` to ``<log>.1``.
+
+    Only the current log and one rotated file are kept, so the log never
+    grows past about twice the limit.
+    """
+    max_bytes = current_app.config.get('KIOSK_METRICS_LOG_MAX_BYTES', KIOSK_METRICS_LOG_MAX_BYTES)
+    with _kiosk_metrics_lock:
+        try:
+            if max_bytes and os.path.getsize(log_path) + len(line) > max_bytes:
+                os.replace(log_path, log_path + '.1')
+        except OSError:
+            pass
+        with open(log_path, 'a', encoding='utf-8') as log_file:
+            log_file.write(line)
+
+@api_bp.route('/kiosk-metrics', methods=['POST'])
+def report_kiosk_metrics():
+    """Accept a kiosk's rolling per-stage latency summary (p50/p95/p99 in ms) and append it to the size-capped metrics log."""
+    payload = request.get_json(silent=True) or {}
+    kiosk_id = str(payload.get('kiosk_id') or '').strip()
+    stages = payload.get('stages')
+    if not kiosk_id or not isinstance(stages, dict):
+        return (jsonify({'success': False, 'message': 'kiosk_id and stages are required'}), 400)
+    try:
+        entry = {'kiosk_id': kiosk_id[:128], 'room': payload.get('room'), 'timestamp': payload.get('timestamp'), 'received_at': get_pst_now().isoformat(), 'stages': stages}
+        log_path = _kiosk_metrics_log_path()
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        _append_kiosk_metrics(log_path, json.dumps(entry) + '\n')
+        if entry['kiosk_id'] in _KIOSK_METRICS or len(_KIOSK_METRICS) < KIOSK_METRICS_MAX_KIOSKS:
+            _KIOSK_METRICS[entry['kiosk_id']] = entry
+        return (jsonify({'success': True}), 200)
+    except Exception as exc:
+        return (jsonify({'success': False, 'message': 'Unable to store kiosk metrics'}), 500)
+
+@api_bp.route('/kiosk-metrics', methods=['GET'])
+def list_kiosk_metrics():
+    """Return the latest latency summary reported by each kiosk since this server process started.
+
+    The summaries are kept in this worker's memory. Under a multi-worker
+    server each worker only lists the kiosks whose reports it received; the
+    metrics log on disk has every report.
+    """
+    kiosks = sorted(_KIOSK_METRICS.values(), key=lambda entry: (str(entry.get('room') or ''), entry['kiosk_id']))
+    return (jsonify({'success': True, 'kiosks': kiosks}), 200)
+
 @api_bp.route('/class/<int:class_id>/session/<date_str>', methods=['GET'])
 def get_class_session_info(class_id, date_str):
     """
@@ -765,7 +947,10 @@ def mark_instructor_attendance():
                 existing_attendance.class_session_id = class_session.id
                 db.session.commit()
             return (jsonify({'success': True, 'message': 'Instructor attendance already recorded for today', 'status': existing_attendance.status, 'recorded_at': existing_attendance.created_at.isoformat() if hasattr(existing_attendance, 'created_at') else None, 'time_in': existing_attendance.time_in.isoformat() if existing_attendance.time_in else None, 'scheduled_class': scheduled_class_info, 'recorded_instructor_id': attendance_instructor_id, 'recorded_instructor_name': attendance_instructor_name, 'proxy_instructor_id': proxy_instructor_id}), 200)
-        current_time = get_pst_now()
+        try:
+            current_time = _client_recorded_time(data)
+        except RecordedTimeError as exc:
+            return _recorded_time_error(exc)
         attendance_record = InstructorAttendance(instructor_id=attendance_instructor_id, class_id=class_id, class_session_id=class_session.id if class_session else None, date=attendance_date, status=status, notes=f'Marked by facial recognition system for {class_obj.class_code}' + (f' via substitute instructor ID {proxy_instructor_id}' if proxy_instructor_id is not None else ''), time_in=current_time)
         db.session.add(attendance_record)
         try:
@@ -947,6 +1132,7 @@ def upload_instructor_images_api():
         if uploaded_files:
             try:
                 db.session.commit()
+                mark_person_stale('Instructor', instructor_id)
                 return jsonify({'success': True, 'message': f'Successfully uploaded {len(uploaded_files)} images', 'images': uploaded_files, 'errors': errors if errors else None})
             except Exception as db_error:
                 db.session.rollback()
@@ -1008,13 +1194,17 @@ def record_student_attendance():
         if not class_obj:
             return (jsonify({'success': False, 'message': 'Class not found'}), 404)
         from models import ClassSession
-        today = date.today()
+        try:
+            current_time = _client_recorded_time(data)
+        except RecordedTimeError as exc:
+            return _recorded_time_error(exc)
+        today = current_time.date()
         class_session = ClassSession.query.filter_by(class_id=class_id, date=today).first()
         if class_session and (not class_session.start_time):
-            class_session.start_time = pst_now_naive()
+            class_session.start_time = current_time
             db.session.commit()
         if not class_session:
-            now = pst_now_naive()
+            now = current_time
             scheduled_start_datetime = None
             scheduled_end_datetime = None
             try:
@@ -1050,7 +1240,6 @@ def record_student_attendance():
             class_session = ClassSession(class_id=class_id, instructor_id=class_obj.instructor_id, date=today, start_time=now, scheduled_start_time=scheduled_start_datetime, scheduled_end_time=scheduled_end_datetime, is_attendance_processed=False, session_room_number=getattr(class_obj, 'room_number', None))
             db.session.add(class_session)
             db.session.flush()
-        current_time = pst_now_naive()
         determined_status = AttendanceStatus.LATE
         if class_session.start_time:
             status_str = AttendanceTimeValidator.determine_attendance_status(class_session.start_time, current_time)
@@ -1060,7 +1249,7 @@ def record_student_attendance():
             determined_status = attendance_status
         existing_record = AttendanceRecord.query.filter_by(class_session_id=class_session.id, student_id=student_id).first()
         if existing_record:
-            if existing_record.status == AttendanceStatus.LATE:
+            if existing_record.status != AttendanceStatus.ABSENT:
                 return (jsonify({'success': False, 'message': f'Attendance already recorded for {first_name} {last_name} today', 'existing_record': {'id': existing_record.id, 'student_id': existing_record.student_id, 'time_in': existing_record.time_in.isoformat() if existing_record.time_in else None, 'date': existing_record.date.isoformat() if existing_record.date else None, 'status': existing_record.status.value if existing_record.status else 'Absent'}}), 409)
             elif existing_record.status == AttendanceStatus.ABSENT:
                 existing_record.status = determined_status
@@ -1077,6 +1266,26 @@ def record_student_attendance():
         db.session.rollback()
         return (jsonify({'success': False, 'message': f'Error recording attendance: {str(e)}'}), 500)
 
+@api_bp.route('/attendance/batch', methods=['POST'])
+@limiter.limit('30 per minute')
+def record_attendance_batch():
+    """Record many student check-ins in one transaction with a result per item"""
+    try:
+        data = request.get_json(silent=True)
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return (jsonify({'success': False, 'message': 'Provide a non-empty list of check-ins in "items"'}), 400)
+        if len(items) > MAX_BATCH_ITEMS:
+            return (jsonify({'success': False, 'message': f'At most {MAX_BATCH_ITEMS} check-ins per batch'}), 413)
+        results = ingest_attendance_batch(items, client=request.headers.get('X-Kiosk-Id') or request.remote_addr)
+        summary = {}
+        for result in results:
+            summary[result['result']] = summary.get(result['result'], 0) + 1
+        return (jsonify({'success': True, 'results': results, 'summary': summary}), 200)
+    except Exception as e:
+        db.session.rollback()
+        return (jsonify({'success': False, 'message': f'Error recording attendance batch: {str(e)}'}), 500)
+
 @api_bp.route('/attendance/check', methods=['POST'])
 def check_attendance_status():
     """Check if attendance is already marked for a student in a class session"""
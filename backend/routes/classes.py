@@ -10,6 +10,7 @@ from werkzeug.utils import secure_filename
 from sqlalchemy import or_, func
 from models import User, Class, Student, Enrollment, AttendanceRecord, InstructorAttendance, AttendanceLog, FaceEncoding, ClassSession, Course, SystemSettings
 from extensions import db
+from utils.response_cache import CachedPayload, conditional_json
 from forms import ClassForm, EnrollmentForm
 from decorators import admin_required
 from exceptions import AttendanceValidationError
@@ -19,6 +20,7 @@ from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Alignment
 from io import BytesIO
 classes_bp = Blueprint('classes', __name__, url_prefix='/classes')
+CLASS_LIST_PAYLOAD = CachedPayload(Class, User, Enrollment, Course)
 
 def _get_payload_value(payload, *keys, default=None):
     if not payload:
@@ -378,17 +380,17 @@ def debug_info():
 
 @classes_bp.route('/api/list', methods=['GET'])
 def get_classes():
+    """List classes with course and instructor names; kiosks revalidate with ``If-None-Match``."""
     api_key = request.headers.get('X-API-Key')
     if api_key and api_key == current_app.config.get('API_KEY'):
-        classes = Class.query.all()
+        scope = ('all',)
     elif current_user.is_authenticated:
-        if current_user.role == 'instructor':
-            classes = Class.query.filter_by(instructor_id=current_user.id).all()
-        else:
-            classes = Class.query.all()
+        scope = ('instructor', current_user.id) if current_user.role == 'instructor' else ('all',)
     else:
         return (jsonify({'success': False, 'message': 'Unauthorized'}), 401)
-    try:
+
+    def build():
+        classes = Class.query.filter_by(instructor_id=scope[1]).all() if scope[0] == 'instructor' else Class.query.all()
         class_list = []
         for cls in classes:
             try:
@@ -420,7 +422,9 @@ def get_classes():
                 class_list.append(class_data)
             except Exception as e:
                 pass
-        return jsonify(class_list)
+        return (class_list, None)
+    try:
+        return conditional_json(CLASS_LIST_PAYLOAD, scope, build)
     except Exception as e:
         import traceback
         return (jsonify({'error': str(e)}), 500)
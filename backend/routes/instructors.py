@@ -20,11 +20,8 @@ from forms import RegisterForm, StudentForm, EnrollmentForm, ProfilePictureForm
 from decorators import admin_required, instructor_required
 from extensions import db
 from utils.schedule_parser import resolve_schedule_window
-try:
-    from deepface import DeepFace
-    DEEPFACE_AVAILABLE = True
-except ImportError as e:
-    DEEPFACE_AVAILABLE = False
+from utils.face_cache_journal import mark_person_stale
+from utils.embedding_backend import backend_available, get_backend
 DEEPFACE_MODEL = 'Facenet512'
 DEEPFACE_DETECTOR = 'opencv'
 DEEPFACE_DISTANCE_METRIC = 'cosine'
@@ -144,6 +141,7 @@ def upload_pictures():
         try:
             if uploaded_images:
                 db.session.commit()
+                mark_person_stale('Student', student_id)
                 return jsonify({'success': True, 'message': f'Successfully uploaded {len(uploaded_images)} image(s).' + (f' Failed to upload {len(errors)} image(s).' if errors else ''), 'images': uploaded_images, 'errors': errors if errors else []})
             else:
                 return (jsonify({'success': False, 'message': 'No images were uploaded successfully.', 'errors': errors}), 400)
@@ -672,22 +670,20 @@ def sanitize_name_for_folder(name):
     return sanitized.lower()
 
 def generate_face_embedding(image_path):
-    """Generate face embedding using DeepFace with FaceNet-512"""
-    if not DEEPFACE_AVAILABLE:
+    """Generate a FaceNet-512 face embedding with the configured embedding backend"""
+    if not backend_available():
         return bytes([0] * 512)
     try:
-        embedding_result = DeepFace.represent(img_path=image_path, model_name=DEEPFACE_MODEL, detector_backend=DEEPFACE_DETECTOR, enforce_detection=True, align=True)
-        if embedding_result and len(embedding_result) > 0:
-            face_embedding = np.array(embedding_result[0]['embedding'], dtype=np.float32)
+        face_embedding = get_backend().embed_image(image_path, detector=DEEPFACE_DETECTOR, enforce_detection=True, align=True)
+        if face_embedding is not None:
             embedding_bytes = face_embedding.tobytes()
             return embedding_bytes
         else:
             return None
     except Exception as e:
         try:
-            embedding_result = DeepFace.represent(img_path=image_path, model_name=DEEPFACE_MODEL, detector_backend=DEEPFACE_DETECTOR, enforce_detection=False, align=True)
-            if embedding_result and len(embedding_result) > 0:
-                face_embedding = np.array(embedding_result[0]['embedding'], dtype=np.float32)
+            face_embedding = get_backend().embed_image(image_path, detector=DEEPFACE_DETECTOR, enforce_detection=False, align=True)
+            if face_embedding is not None:
                 embedding_bytes = face_embedding.tobytes()
                 return embedding_bytes
             else:
@@ -760,6 +756,7 @@ def upload_student_image(student_id):
             face_encoding = FaceEncoding(student_id=student_id, encoding=bytes([0] * 128), image_path=image_path, created_at=pst_now_naive())
             db.session.add(face_encoding)
             db.session.commit()
+            mark_person_stale('Student', student_id)
             return jsonify({'success': True, 'message': 'Image uploaded successfully. Please process this image on the Raspberry Pi device.', 'image': {'id': face_encoding.id, 'path': url_for('static', filename=image_path), 'created_at': face_encoding.created_at.strftime('%Y-%m-%d %H:%M:%S')}})
         except Exception as db_error:
             if image_path:
@@ -899,6 +896,7 @@ def upload_instructor_images(instructor_id):
         if uploaded_files:
             try:
                 db.session.commit()
+                mark_person_stale('Instructor', instructor_id)
                 return jsonify({'success': True, 'message': f'Successfully uploaded {len(uploaded_files)} images', 'images': uploaded_files, 'errors': errors if errors else None})
             except Exception as db_error:
                 db.session.rollback()
@@ -943,6 +941,7 @@ def delete_instructor_image(image_id):
                 os.remove(file_path)
         db.session.delete(face_encoding)
         db.session.commit()
+        mark_person_stale('Instructor', face_encoding.instructor_id)
         remaining_images = InstructorFaceEncoding.query.filter_by(instructor_id=face_encoding.instructor_id).count()
         return jsonify({'success': True, 'message': 'Image deleted successfully', 'remaining_images': remaining_images})
     except Exception as e:
@@ -1048,6 +1047,7 @@ def delete_student_image(image_id):
         image_path = face_encoding.image_path
         db.session.delete(face_encoding)
         db.session.commit()
+        mark_person_stale('Student', face_encoding.student_id)
         if image_path:
             file_path = os.path.join(current_app.static_folder, image_path)
             if os.path.exists(file_path):
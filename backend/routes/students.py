@@ -18,6 +18,7 @@ from models import User, Class, Student, Enrollment, AttendanceRecord, Instructo
 from forms import StudentForm, EnrollmentForm
 from decorators import admin_required
 from exceptions import AttendanceValidationError
+from utils.face_cache_journal import mark_person_stale
 students_bp = Blueprint('students', __name__, url_prefix='/students')
 ALLOWED_DEPARTMENTS = {'BSIT'}
 
@@ -196,6 +197,7 @@ def upload_student_images():
         try:
             if uploaded_images:
                 db.session.commit()
+                mark_person_stale('Student', student_id)
                 return jsonify({'success': True, 'message': f'Successfully uploaded {len(uploaded_images)} image(s).' + (f' Failed to upload {len(errors)} image(s).' if errors else ''), 'images': uploaded_images, 'errors': errors if errors else []})
             else:
                 return (jsonify({'success': False, 'message': 'No images were uploaded successfully.', 'errors': errors}), 400)
@@ -239,6 +241,7 @@ def upload_student_image():
                 db.session.add(face_encoding)
                 face_encoding.encoding_data = placeholder_encoding
                 db.session.commit()
+                mark_person_stale('Student', student_id)
                 return jsonify({'success': True, 'message': 'Image uploaded successfully', 'image': {'id': face_encoding.id, 'filename': filename, 'path': url_for('static', filename=relative_image_path)}})
             except Exception as db_error:
                 db.session.rollback()
@@ -277,8 +280,10 @@ def delete_student_image(image_id):
             file_path = os.path.join(current_app.static_folder, face_encoding.image_path)
             if os.path.exists(file_path):
                 os.remove(file_path)
+        student_id = face_encoding.student_id
         db.session.delete(face_encoding)
         db.session.commit()
+        mark_person_stale('Student', student_id)
         return jsonify({'success': True, 'message': 'Image deleted successfully'})
     except Exception as e:
         db.session.rollback()
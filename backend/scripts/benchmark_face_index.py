@@ -0,0 +1,78 @@
+"""Compare the IVF face index against the exact matcher on synthetic galleries.
+
+Builds a gallery of clustered Facenet512-like embeddings for each size, writes
+it with the same writers ``extract_embeddings`` uses, loads it through the
+kiosk ``FaceGallery`` and reports per-query latency and recall@1 against the
+exact scan for each ``nprobe``.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CLIENT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..', 'client'))
+for path in (BASE_DIR, CLIENT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+import numpy as np
+from utils.face_gallery_format import write_face_gallery, gallery_path_for
+from utils.face_gallery_index import write_face_index, index_path_for
+from face_gallery import load_face_gallery
+SAMPLES_PER_PERSON = 3
+EMBEDDING_NOISE = 0.35
+
+def synthetic_face_data(rows, dim, rng):
+    """Return a cache dictionary of ``rows`` embeddings, ``SAMPLES_PER_PERSON`` per identity."""
+    people = max(1, rows // SAMPLES_PER_PERSON)
+    identities = rng.standard_normal((people, dim)).astype(np.float32)
+    identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+    owners = np.arange(rows) % people
+    embeddings = identities[owners] + rng.standard_normal((rows, dim)).astype(np.float32) * (EMBEDDING_NOISE / np.sqrt(dim))
+    face_data = {'student_embeddings': list(embeddings), 'student_names': [f'Student {owner}' for owner in owners], 'student_ids': [int(owner) for owner in owners], 'instructor_embeddings': [], 'instructor_names': [], 'instructor_ids': []}
+    return (face_data, identities)
+
+def time_queries(gallery, queries, exact):
+    results = []
+    started = time.perf_counter()
+    for query in queries:
+        results.append(gallery.match(query, k=1, exact=exact))
+    elapsed = time.perf_counter() - started
+    return (elapsed * 1000.0 / len(queries), [found[0].person_id if found else None for found in results])
+
+def benchmark(rows, dim, queries_count, nprobes, seed):
+    rng = np.random.default_rng(seed)
+    face_data, identities = synthetic_face_data(rows, dim, rng)
+    picked = rng.integers(0, len(identities), size=queries_count)
+    queries = identities[picked] + rng.standard_normal((queries_count, dim)).astype(np.float32) * (EMBEDDING_NOISE / np.sqrt(dim))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_file = os.path.join(temp_dir, 'face_encodings.pkl')
+        write_face_gallery(gallery_path_for(cache_file), face_data)
+        started = time.perf_counter()
+        nlist = write_face_index(index_path_for(cache_file), gallery_path_for(cache_file), min_rows=0)
+        build_seconds = time.perf_counter() - started
+        gallery = load_face_gallery(cache_file)
+        exact_ms, exact_ids = time_queries(gallery, queries, exact=True)
+        print(f'rows={rows} nlist={nlist} build={build_seconds:.2f}s exact={exact_ms:.3f}ms/query')
+        for nprobe in nprobes:
+            gallery.index.nprobe = nprobe
+            ivf_ms, ivf_ids = time_queries(gallery, queries, exact=False)
+            recall = sum((1 for expected, found in zip(exact_ids, ivf_ids) if expected == found)) / len(queries)
+            print(f'  nprobe={nprobe:<4} {ivf_ms:.3f}ms/query speedup={exact_ms / ivf_ms if ivf_ms else 0:.1f}x recall@1={recall:.3f}')
+        del gallery
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the IVF face gallery index against exact matching.')
+    parser.add_argument('--sizes', type=str, default='1000,10000,100000', help='Comma-separated gallery sizes (default 1000,10000,100000)')
+    parser.add_argument('--nprobe', type=str, default='1,4,8,16,32', help='Comma-separated nprobe values to try (default 1,4,8,16,32)')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per gallery size (default 200)')
+    parser.add_argument('--dim', type=int, default=512, help='Embedding dimension (default 512, Facenet512)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default 0)')
+    args = parser.parse_args()
+    sizes = [int(value) for value in args.sizes.split(',') if value.strip()]
+    nprobes = [int(value) for value in args.nprobe.split(',') if value.strip()]
+    for rows in sizes:
+        benchmark(rows, args.dim, max(1, args.queries), nprobes, args.seed)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+import pytest
+
+from extensions import db
+from models import AttendanceRecord, Class, ClassSession, Course, Enrollment, Student
+from utils import attendance_batch
+from utils.attendance_batch import ingest_attendance_batch
+from utils.timezone import pst_now_naive
+
+
+@pytest.fixture
+def roster(app):
+    course = Course(code='BSIT')
+    db.session.add(course)
+    db.session.flush()
+    class_obj = Class(class_code='IT101', course_id=course.id)
+    other_class = Class(class_code='IT102', course_id=course.id)
+    db.session.add_all([class_obj, other_class])
+    db.session.flush()
+    for student_id in ('24-00001', '24-00002'):
+        db.session.add(Student(id=student_id, first_name='Test', last_name=student_id, year_level='1'))
+    db.session.add(Enrollment(student_id='24-00001', class_id=class_obj.id))
+    db.session.commit()
+    return {'class_id': class_obj.id, 'other_class_id': other_class.id}
+
+
+@pytest.fixture(autouse=True)
+def fresh_processed_keys(monkeypatch):
+    monkeypatch.setattr(attendance_batch, 'processed_keys', attendance_batch.ProcessedKeys())
+
+
+def _item(key, class_id, student_id='24-00001', recorded_at=None):
+    item = {'idempotency_key': key, 'student_id': student_id, 'class_id': class_id}
+    if recorded_at is not None:
+        item['recorded_at'] = recorded_at.isoformat()
+    return item
+
+
+def test_batch_splits_invalid_duplicate_and_stale_items(roster):
+    now = pst_now_naive()
+    results = ingest_attendance_batch([
+        _item('a', roster['class_id'], recorded_at=now - timedelta(minutes=1)),
+        _item('b', roster['class_id'], recorded_at=now),
+        {'idempotency_key': 'c', 'student_id': '24-00001'},
+        _item('d', roster['class_id'], recorded_at=now + timedelta(hours=1)),
+        _item('e', roster['class_id'], recorded_at=now - timedelta(days=2)),
+        _item('f', roster['other_class_id'], student_id='24-00002'),
+        _item('a', roster['class_id']),
+    ])
+    codes = [(result['index'], result['code']) for result in results]
+    assert codes == [(0, 201), (1, 409), (2, 400), (3, 400), (4, 422), (5, 403), (6, 201)]
+    assert results[4]['error_type'] == 'stale_recorded_at'
+    assert AttendanceRecord.query.count() == 1
+    assert ClassSession.query.filter_by(class_id=roster['class_id']).count() == 1
+
+
+def test_resent_batch_returns_remembered_results(roster):
+    batch = [_item('k1', roster['class_id'])]
+    first = ingest_attendance_batch(batch, client='kiosk-1')
+    replay = ingest_attendance_batch(batch, client='kiosk-1')
+    other_kiosk = ingest_attendance_batch(batch, client='kiosk-2')
+    assert first[0]['code'] == replay[0]['code'] == 201
+    assert replay[0]['record_id'] == first[0]['record_id']
+    assert other_kiosk[0]['code'] == 409
+    assert AttendanceRecord.query.count() == 1
+
+
+def test_processed_keys_expire_and_stay_bounded():
+    keys = attendance_batch.ProcessedKeys(capacity=2)
+    keys.remember('kiosk', 'a', {'code': 201}, ttl=10, now=0)
+    assert keys.get('kiosk', 'a', now=5) == {'code': 201}
+    assert keys.get('kiosk', 'a', now=11) is None
+    for key in ('b', 'c', 'd'):
+        keys.remember('kiosk', key, {'code': 201}, ttl=10, now=20)
+    assert keys.get('kiosk', 'b', now=21) is None
+    assert keys.get('kiosk', 'd', now=21) == {'code': 201}
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import pytest
+
+from utils import embedding_backend
+
+SERVER_COPY = Path(embedding_backend.__file__).resolve()
+KIOSK_COPY = SERVER_COPY.parents[2] / 'client' / 'embedding_backend.py'
+
+
+@pytest.mark.skipif(not KIOSK_COPY.exists(), reason='client folder is not deployed here')
+def test_server_copy_matches_kiosk_copy():
+    assert SERVER_COPY.read_bytes() == KIOSK_COPY.read_bytes(), 'backend/utils/embedding_backend.py and client/embedding_backend.py diverged'
+
+
+def test_local_backends_reject_unsupported_detectors():
+    backend = embedding_backend.OpenCVDNNBackend(model_path='unused.onnx')
+    assert backend.supports_detector('opencv')
+    assert not backend.supports_detector('retinaface')
+    with pytest.raises(embedding_backend.EmbeddingBackendError):
+        backend.embed_image('missing.jpg', detector='retinaface')
+
+
+def test_unknown_backend_is_reported_unavailable():
+    assert not embedding_backend.backend_available('no-such-backend')
+    with pytest.raises(embedding_backend.EmbeddingBackendError):
+        embedding_backend.get_backend('no-such-backend')
@@ -0,0 +1,68 @@
+import pickle
+import threading
+
+import pytest
+
+from utils import face_cache_journal
+from utils.face_cache_journal import changes_since, mark_person_stale, pending_stale_marks, pending_stale_people, publish_gallery_changes, read_journal
+from utils.face_cache_meta import cache_state_lock, describe_face_cache, file_sha256, journal_file_lock, load_cache_state
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    path = tmp_path / 'face_encodings.pkl'
+    path.write_bytes(pickle.dumps({'student_ids': []}))
+    return path
+
+
+def test_changes_since_merges_generations(cache_file):
+    publish_gallery_changes(cache_file, [('Student', '1'), ('Student', '2')], [], 'h1')
+    publish_gallery_changes(cache_file, [('Student', '1')], [('Student', '2')], 'h2')
+    assert changes_since(cache_file, 0) == {('Student', '1'): 'upsert', ('Student', '2'): 'remove'}
+    assert changes_since(cache_file, 1) == {('Student', '1'): 'upsert', ('Student', '2'): 'remove'}
+    assert changes_since(cache_file, 2) == {}
+    assert changes_since(cache_file, 3) is None
+
+
+def test_compaction_forces_full_sync_behind_it(cache_file, monkeypatch):
+    monkeypatch.setattr(face_cache_journal, 'MAX_PUBLISHED_ENTRIES', 2)
+    publish_gallery_changes(cache_file, [('Student', '1')], [], 'h1')
+    publish_gallery_changes(cache_file, [('Student', '2')], [], 'h2')
+    publish_gallery_changes(cache_file, [('Student', '3')], [], 'h3')
+    assert load_cache_state(cache_file)['compacted_through'] == 1
+    assert changes_since(cache_file, 0) is None
+    assert changes_since(cache_file, 1) == {('Student', '2'): 'upsert', ('Student', '3'): 'upsert'}
+
+
+def test_unprocessed_stale_marks_survive_a_publish(cache_file):
+    mark_person_stale('Student', 'A', cache_path=cache_file)
+    snapshot = pending_stale_marks(cache_file)
+    mark_person_stale('Student', 'B', cache_path=cache_file)
+    publish_gallery_changes(cache_file, [('Student', 'A')], [], 'h1', processed_stale=snapshot)
+    assert pending_stale_people(cache_file) == {('Student', 'B')}
+    assert [entry['op'] for entry in read_journal(cache_file)].count('stale') == 1
+
+
+def test_unjournalled_change_bumps_generation_without_delta(cache_file):
+    first = describe_face_cache(cache_file)
+    cache_file.write_bytes(pickle.dumps({'student_ids': ['1']}))
+    second = describe_face_cache(cache_file)
+    assert second['generation'] == first['generation'] + 1
+    assert changes_since(cache_file, first['generation']) is None
+
+
+def test_meta_poll_waits_for_publish_and_sees_the_journalled_generation(cache_file):
+    before = describe_face_cache(cache_file)
+    temp_file = cache_file.with_name(cache_file.name + '.tmp')
+    temp_file.write_bytes(pickle.dumps({'student_ids': ['1']}))
+    seen = {}
+    poll = threading.Thread(target=lambda: seen.update(describe_face_cache(cache_file)))
+    with cache_state_lock, journal_file_lock(cache_file):
+        publish_gallery_changes(cache_file, [('Student', '1')], [], file_sha256(temp_file))
+        temp_file.replace(cache_file)
+        poll.start()
+        poll.join(0.2)
+        assert poll.is_alive()
+    poll.join()
+    assert seen['generation'] == before['generation'] + 1
+    assert changes_since(cache_file, before['generation']) == {('Student', '1'): 'upsert'}
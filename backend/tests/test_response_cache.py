@@ -0,0 +1,64 @@
+import time
+
+from extensions import db
+from models import Course
+from utils.response_cache import CachedPayload, conditional_json
+
+
+def counting_build(payload, expires_at=None):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return payload, expires_at
+    return build, calls
+
+
+def test_body_is_reused_until_a_dependent_table_commits(app):
+    cache = CachedPayload(Course)
+    build, calls = counting_build({'classes': []})
+    with app.app_context():
+        first = cache.get('all', build)
+        assert cache.get('all', build) == first
+        assert len(calls) == 1
+        db.session.add(Course(code='CS101'))
+        db.session.commit()
+        assert cache.get('all', build) == first
+        assert len(calls) == 2
+
+
+def test_rolled_back_changes_keep_the_cached_body(app):
+    cache = CachedPayload(Course)
+    build, calls = counting_build({'classes': []})
+    with app.app_context():
+        cache.get('all', build)
+        db.session.add(Course(code='CS102'))
+        db.session.flush()
+        db.session.rollback()
+        cache.get('all', build)
+    assert len(calls) == 1
+
+
+def test_scopes_and_expiry_are_independent(monkeypatch):
+    cache = CachedPayload(Course, max_age=30)
+    build, calls = counting_build({'now': 1}, expires_at=time.time() + 5)
+    _, etag = cache.get(('today', 12), build)
+    cache.get(('today', 24), build)
+    assert len(calls) == 2
+    later = time.time() + 10
+    monkeypatch.setattr('utils.response_cache.time.time', lambda: later)
+    _, refreshed = cache.get(('today', 12), build)
+    assert len(calls) == 3
+    assert refreshed == etag
+
+
+def test_matching_if_none_match_gets_304(app):
+    cache = CachedPayload(Course)
+    build, _ = counting_build({'classes': ['CS101']})
+    with app.test_request_context('/'):
+        response = conditional_json(cache, 'all', build)
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'no-cache'
+        etag = response.get_etag()[0]
+    with app.test_request_context('/', headers={'If-None-Match': f'"{etag}"'}):
+        assert conditional_json(cache, 'all', build).status_code == 304
@@ -0,0 +1,291 @@
+"""Set-based ingestion of many student check-ins in one transaction.
+
+``POST /api/attendance/batch`` takes a list of check-ins. The sources are
+kiosk journal flushes and bulk imports of paper sign-in sheets. Each item is
+``{idempotency_key, student_id, class_id or class_session_id, recorded_at}``.
+The one-at-a-time endpoints each repeat the student, enrollment, class and
+session lookups and commit their own transaction. :func:`ingest_attendance_batch`
+instead resolves everything with one ``IN`` query per table, creates any
+missing sessions, and inserts or updates all rows in a single commit.
+
+The rules are those of ``/api/attendance/record``:
+
+* A missing session for the class and day is created, starting at the
+  earliest check-in.
+* The status comes from ``AttendanceTimeValidator`` relative to the session
+  start.
+* ``recorded_at`` goes through :func:`resolve_recorded_time`, so stale
+  replays are rejected here exactly as on the single endpoints.
+* An ``ABSENT`` row is upgraded.
+* Any other existing row is reported as a duplicate.
+
+Items that repeat an idempotency key in the same batch share one result.
+Keys are also remembered per client (``X-Kiosk-Id`` or the remote address)
+for as long as ``recorded_at`` stays acceptable. A batch resent after a
+lost response then gets the original results back instead of being applied
+again. The memory is per process: under several workers a resend that
+reaches another worker falls back to the duplicate rule above.
+Each result carries an HTTP-style ``code`` (201 created, 200 updated,
+409 duplicate, 4xx rejected), so clients can settle items the same way as
+single requests.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from exceptions import RecordedTimeError
+from extensions import db
+from models import AttendanceRecord, AttendanceStatus, Class, ClassSession, Enrollment, Student
+from utils.attendance_manager import AttendanceTimeValidator
+from utils.schedule_parser import resolve_schedule_window
+from utils.timezone import pst_now_naive, to_pst
+
+MAX_BATCH_ITEMS = 500
+CLIENT_CLOCK_SKEW = timedelta(minutes=2)
+DEFAULT_MAX_BACKDATE_HOURS = 12
+DEFAULT_SESSION_MINUTES = 60
+MAX_REMEMBERED_KEYS = 50000
+
+
+class ProcessedKeys:
+    """Bounded, thread-safe memory of the result each ``(client, idempotency_key)`` got."""
+
+    def __init__(self, capacity=MAX_REMEMBERED_KEYS):
+        self.capacity = capacity
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, client, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._results.get((client, key))
+            if entry is None or entry[0] <= now:
+                return None
+            return dict(entry[1])
+
+    def remember(self, client, key, result, ttl, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._results[(client, key)] = (now + ttl, dict(result))
+            self._results.move_to_end((client, key))
+            while len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+            while self._results:
+                oldest = next(iter(self._results.values()))
+                if oldest[0] > now:
+                    break
+                self._results.popitem(last=False)
+
+
+processed_keys = ProcessedKeys()
+
+
+def parse_client_time(raw):
+    """Parse an ISO timestamp from a client into a PST-naive datetime; ``None`` if it is unusable."""
+    if not raw:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return to_pst(parsed).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def resolve_recorded_time(raw, now=None):
+    """Return when a check-in or checkout happened, applying the one ``recorded_at`` policy every endpoint shares.
+
+    A missing value means "now". Unparseable or future values and values
+    older than ``ATTENDANCE_MAX_BACKDATE_HOURS`` (default 12) raise
+    :class:`RecordedTimeError`. A stale replay is rejected rather than
+    recorded on today's date, and the kiosk journal settles it as rejected.
+    """
+    now = pst_now_naive() if now is None else now
+    if raw in (None, ''):
+        return now
+    recorded = parse_client_time(raw)
+    if recorded is None:
+        raise RecordedTimeError('Invalid recorded_at timestamp')
+    if recorded > now + CLIENT_CLOCK_SKEW:
+        raise RecordedTimeError('recorded_at is in the future')
+    max_hours = float(current_app.config.get('ATTENDANCE_MAX_BACKDATE_HOURS', DEFAULT_MAX_BACKDATE_HOURS))
+    if recorded < now - timedelta(hours=max_hours):
+        raise RecordedTimeError(f'recorded_at is more than {max_hours:g} hours old', status_code=422, error_type='stale_recorded_at')
+    return min(recorded, now)
+
+
+def _value(item, *keys):
+    for key in keys:
+        if key in item and item[key] not in (None, ''):
+            return item[key]
+    return None
+
+
+def _result(index, key, code, outcome, message, error_type=None, record=None):
+    result = {'index': index, 'idempotency_key': key, 'code': code, 'result': outcome, 'message': message}
+    if error_type:
+        result['error_type'] = error_type
+    if record is not None:
+        result['record_id'] = record.id
+        result['status'] = record.status.value if record.status else None
+        result['time_in'] = record.time_in.isoformat() if record.time_in else None
+    return result
+
+
+def _normalize_items(items, now):
+    """Validate item shapes; returns ``(accepted, rejected_results)`` where accepted items are dicts."""
+    accepted = []
+    rejected = []
+    for index, item in enumerate(items):
+        key = str(_value(item, 'idempotency_key', 'idempotencyKey') or '') if isinstance(item, dict) else ''
+        if not isinstance(item, dict):
+            rejected.append(_result(index, None, 400, 'rejected', 'Item must be an object', 'invalid_item'))
+            continue
+        student_id = _value(item, 'student_id', 'studentId', 'StudentID')
+        class_id = _value(item, 'class_id', 'classId', 'ClassID')
+        session_id = _value(item, 'class_session_id', 'classSessionId', 'ClassSessionID')
+        if not student_id or not (class_id or session_id):
+            rejected.append(_result(index, key or None, 400, 'rejected', 'Missing required fields: student_id and class_id or class_session_id', 'invalid_item'))
+            continue
+        try:
+            class_id = int(class_id) if class_id is not None else None
+            session_id = int(session_id) if session_id is not None else None
+        except (TypeError, ValueError):
+            rejected.append(_result(index, key or None, 400, 'rejected', 'Invalid class_id or class_session_id', 'invalid_item'))
+            continue
+        try:
+            recorded = resolve_recorded_time(_value(item, 'recorded_at', 'recordedAt', 'time_in', 'timeIn', 'timestamp'), now)
+        except RecordedTimeError as exc:
+            rejected.append(_result(index, key or None, exc.status_code, 'rejected', str(exc), exc.error_type))
+            continue
+        accepted.append({'index': index, 'key': key or None, 'student_id': str(student_id), 'class_id': class_id, 'session_id': session_id, 'recorded_at': recorded})
+    return (accepted, rejected)
+
+
+def _create_session(class_obj, session_date, start_time):
+    window = resolve_schedule_window(class_obj.schedule or '', target_date=session_date)
+    if window:
+        scheduled_start, scheduled_end = window['start_datetime'], window['end_datetime']
+    else:
+        scheduled_start, scheduled_end = start_time, start_time + timedelta(minutes=DEFAULT_SESSION_MINUTES)
+    session = ClassSession(class_id=class_obj.id, instructor_id=class_obj.instructor_id, date=session_date, start_time=start_time, scheduled_start_time=scheduled_start, scheduled_end_time=scheduled_end, is_attendance_processed=False, session_room_number=getattr(class_obj, 'room_number', None))
+    db.session.add(session)
+    return session
+
+
+def ingest_attendance_batch(items, client=None):
+    """Record ``items`` in one transaction; returns per-item results in request order.
+
+    The caller commits nothing itself: this function commits on success and
+    rolls back and re-raises on a database error, so the batch is all or nothing.
+    ``client`` identifies the sender for :data:`processed_keys`; without it
+    keys only deduplicate within this batch.
+    """
+    now = pst_now_naive()
+    accepted, results = _normalize_items(items, now)
+    if client is not None:
+        fresh = []
+        for item in accepted:
+            replayed = processed_keys.get(client, item['key']) if item['key'] else None
+            if replayed is None:
+                fresh.append(item)
+            else:
+                replayed['index'] = item['index']
+                results.append(replayed)
+        accepted = fresh
+    by_key = OrderedDict()
+    unique = []
+    for item in accepted:
+        if item['key'] and item['key'] in by_key:
+            item['same_as'] = by_key[item['key']]
+            continue
+        if item['key']:
+            by_key[item['key']] = item
+        unique.append(item)
+    student_ids = {item['student_id'] for item in unique}
+    explicit_session_ids = {item['session_id'] for item in unique if item['session_id'] is not None}
+    sessions_by_id = {session.id: session for session in ClassSession.query.filter(ClassSession.id.in_(explicit_session_ids)).all()} if explicit_session_ids else {}
+    for item in unique:
+        if item['session_id'] is not None:
+            session = sessions_by_id.get(item['session_id'])
+            item['class_id'] = session.class_id if session is not None else item['class_id']
+    class_ids = {item['class_id'] for item in unique if item['class_id'] is not None}
+    known_students = {row[0] for row in db.session.query(Student.id).filter(Student.id.in_(student_ids)).all()} if student_ids else set()
+    classes = {class_obj.id: class_obj for class_obj in Class.query.filter(Class.id.in_(class_ids)).all()} if class_ids else {}
+    enrolled = {(row[0], row[1]) for row in db.session.query(Enrollment.student_id, Enrollment.class_id).filter(Enrollment.student_id.in_(student_ids), Enrollment.class_id.in_(class_ids)).all()} if student_ids and class_ids else set()
+    session_dates = {item['recorded_at'].date() for item in unique if item['session_id'] is None}
+    sessions_by_day = {}
+    if class_ids and session_dates:
+        for session in ClassSession.query.filter(ClassSession.class_id.in_(class_ids), ClassSession.date.in_(session_dates)).order_by(ClassSession.id).all():
+            sessions_by_day.setdefault((session.class_id, session.date), session)
+    valid = []
+    for item in unique:
+        if item['session_id'] is not None and item['session_id'] not in sessions_by_id:
+            item['outcome'] = _result(item['index'], item['key'], 404, 'rejected', f"Class session with ID {item['session_id']} not found", 'session_not_found')
+        elif item['student_id'] not in known_students:
+            item['outcome'] = _result(item['index'], item['key'], 404, 'rejected', f"Student with ID {item['student_id']} not found", 'student_not_found')
+        elif item['class_id'] not in classes:
+            item['outcome'] = _result(item['index'], item['key'], 404, 'rejected', 'Class not found', 'class_not_found')
+        elif (item['student_id'], item['class_id']) not in enrolled:
+            item['outcome'] = _result(item['index'], item['key'], 403, 'rejected', f"Student {item['student_id']} is not enrolled in this class", 'not_enrolled_in_class')
+        else:
+            valid.append(item)
+    try:
+        for item in sorted(valid, key=lambda entry: entry['recorded_at']):
+            if item['session_id'] is not None:
+                session = sessions_by_id[item['session_id']]
+            else:
+                day = (item['class_id'], item['recorded_at'].date())
+                session = sessions_by_day.get(day)
+                if session is None:
+                    session = sessions_by_day[day] = _create_session(classes[item['class_id']], day[1], item['recorded_at'])
+            if not session.start_time:
+                session.start_time = item['recorded_at']
+            item['session'] = session
+        db.session.flush()
+        session_ids = {item['session'].id for item in valid}
+        existing = {}
+        if session_ids:
+            for record in AttendanceRecord.query.filter(AttendanceRecord.class_session_id.in_(session_ids), AttendanceRecord.student_id.in_({item['student_id'] for item in valid})).all():
+                existing.setdefault((record.class_session_id, record.student_id), record)
+        for item in sorted(valid, key=lambda entry: entry['recorded_at']):
+            session = item['session']
+            recorded = item['recorded_at']
+            status = AttendanceStatus[AttendanceTimeValidator.determine_attendance_status(session.start_time, recorded).upper()] if session.start_time else AttendanceStatus.LATE
+            record = existing.get((session.id, item['student_id']))
+            if record is not None and record.status != AttendanceStatus.ABSENT:
+                item['outcome'] = _result(item['index'], item['key'], 409, 'duplicate', 'Attendance already recorded for this session', 'already_recorded', record)
+                continue
+            if record is not None:
+                record.status = status
+                record.time_in = recorded
+                record.marked_by = None
+                record.marked_at = recorded
+                item['outcome'] = (200, 'updated', record)
+                continue
+            record = AttendanceRecord(student_id=item['student_id'], class_id=session.class_id, class_session_id=session.id, time_in=recorded, date=recorded, status=status, marked_by=None, marked_at=recorded)
+            db.session.add(record)
+            existing[(session.id, item['student_id'])] = record
+            item['outcome'] = (201, 'created', record)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for item in valid:
+        if isinstance(item['outcome'], tuple):
+            code, outcome, record = item['outcome']
+            item['outcome'] = _result(item['index'], item['key'], code, outcome, 'Attendance recorded' if code == 201 else 'Attendance updated', record=record)
+    if client is not None:
+        ttl = float(current_app.config.get('ATTENDANCE_MAX_BACKDATE_HOURS', DEFAULT_MAX_BACKDATE_HOURS)) * 3600
+        for item in unique:
+            if item['key'] and item['outcome']['code'] in (200, 201, 409):
+                processed_keys.remember(client, item['key'], item['outcome'], ttl)
+    for item in accepted:
+        source = item.get('same_as', item)
+        outcome = dict(source['outcome'])
+        outcome['index'] = item['index']
+        results.append(outcome)
+    results.sort(key=lambda result: result['index'])
+    return results
@@ -0,0 +1,163 @@
+"""Change journal for the face encoding cache, used for kiosk delta sync.
+
+Each line of ``face_cache_journal.jsonl`` is one JSON record:
+
+* ``upsert`` / ``remove`` - published by ``extract_embeddings`` when a person's
+  rows in the cache changed; ``generation`` is the cache generation that
+  contains the change.
+* ``stale`` - written by the image upload/delete routes; the person's source
+  images changed and incremental extraction should re-process them.
+  ``generation`` is the generation that was current when the images changed.
+  Marks an extraction run did not process are carried into the generation it
+  publishes, so uploads made during a run are picked up by the next one.
+
+The Flask process and the ``extract_embeddings`` script both rewrite the
+journal, so every read-modify-write holds
+:func:`utils.face_cache_meta.journal_file_lock`, an OS file lock next to the
+journal, in addition to the in-process lock.
+"""
+import json
+import os
+import uuid
+
+from utils.face_cache_meta import cache_state_lock, forget_cached_meta, journal_file_lock, load_cache_state, save_cache_state
+from utils.timezone import pst_now_naive
+
+JOURNAL_FILENAME = 'face_cache_journal.jsonl'
+MAX_PUBLISHED_ENTRIES = 5000
+PUBLISHED_OPS = ('upsert', 'remove')
+
+
+def journal_path(cache_path):
+    return os.path.join(os.path.dirname(os.path.abspath(str(cache_path))), JOURNAL_FILENAME)
+
+
+def _person_key(person_type, person_id):
+    return (str(person_type), str(person_id))
+
+
+def read_journal(cache_path):
+    """Return all journal records, skipping lines that fail to parse."""
+    entries = []
+    try:
+        with open(journal_path(cache_path), 'r', encoding='utf-8') as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def _write_journal(cache_path, entries):
+    path = journal_path(cache_path)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as handle:
+        for entry in entries:
+            handle.write(json.dumps(entry) + '\n')
+    os.replace(temp_path, path)
+
+
+def _append_journal(cache_path, entries):
+    with open(journal_path(cache_path), 'a', encoding='utf-8') as handle:
+        for entry in entries:
+            handle.write(json.dumps(entry) + '\n')
+
+
+def default_cache_path():
+    """Resolve the cache path from the active Flask app configuration."""
+    from flask import current_app
+    cache_path = current_app.config.get('FACE_ENCODINGS_CACHE')
+    if not cache_path:
+        cache_path = os.path.abspath(os.path.join(current_app.root_path, '..', 'cache', 'face_encodings.pkl'))
+    return cache_path
+
+
+def mark_person_stale(person_type, person_id, cache_path=None):
+    """Record that a person's enrollment images changed since the last extraction.
+
+    Never raises: a journal write failure must not fail the upload itself.
+    """
+    try:
+        cache_path = cache_path or default_cache_path()
+        with cache_state_lock, journal_file_lock(cache_path):
+            generation = load_cache_state(cache_path)['generation']
+            _append_journal(cache_path, [{'op': 'stale', 'id': uuid.uuid4().hex, 'generation': generation, 'person_type': str(person_type), 'person_id': str(person_id), 'at': pst_now_naive().isoformat()}])
+        return True
+    except Exception:
+        return False
+
+
+def _mark_identity(entry):
+    return entry.get('id') or (entry.get('person_type'), entry.get('person_id'), entry.get('generation'), entry.get('at'))
+
+
+def pending_stale_marks(cache_path):
+    """Return the ``stale`` journal records made after the current generation was built."""
+    with cache_state_lock, journal_file_lock(cache_path):
+        generation = load_cache_state(cache_path)['generation']
+        entries = read_journal(cache_path)
+    return [entry for entry in entries if entry.get('op') == 'stale' and int(entry.get('generation') or 0) >= generation]
+
+
+def pending_stale_people(cache_path, marks=None):
+    """Return ``(person_type, person_id)`` keys whose images changed after the current generation was built."""
+    marks = pending_stale_marks(cache_path) if marks is None else marks
+    return {_person_key(entry.get('person_type'), entry.get('person_id')) for entry in marks}
+
+
+def publish_gallery_changes(cache_path, changed, removed, content_hash, processed_stale=()):
+    """Bump the cache generation and journal which people changed in it.
+
+    ``changed`` and ``removed`` are iterables of ``(person_type, person_id)``.
+    ``processed_stale`` is the :func:`pending_stale_marks` snapshot the
+    extraction worked from; any other ``stale`` mark is kept and re-tagged with
+    the new generation. Returns the new generation. Old published entries
+    beyond ``MAX_PUBLISHED_ENTRIES`` are compacted away; kiosks behind the
+    compaction point must download the full cache.
+    """
+    processed = {_mark_identity(entry) for entry in processed_stale}
+    with cache_state_lock, journal_file_lock(cache_path):
+        state = load_cache_state(cache_path)
+        generation = state['generation'] + 1
+        timestamp = pst_now_naive().isoformat()
+        records = [{'op': 'upsert', 'generation': generation, 'person_type': str(person_type), 'person_id': str(person_id), 'at': timestamp} for person_type, person_id in changed]
+        records.extend({'op': 'remove', 'generation': generation, 'person_type': str(person_type), 'person_id': str(person_id), 'at': timestamp} for person_type, person_id in removed)
+        journal = read_journal(cache_path)
+        entries = [entry for entry in journal if entry.get('op') in PUBLISHED_OPS] + records
+        carried = [dict(entry, generation=generation) for entry in journal if entry.get('op') == 'stale' and _mark_identity(entry) not in processed]
+        compacted_through = state['compacted_through']
+        if len(entries) > MAX_PUBLISHED_ENTRIES:
+            dropped = entries[:len(entries) - MAX_PUBLISHED_ENTRIES]
+            entries = entries[len(entries) - MAX_PUBLISHED_ENTRIES:]
+            compacted_through = max(compacted_through, max(int(entry.get('generation') or 0) for entry in dropped))
+        _write_journal(cache_path, entries + carried)
+        save_cache_state(cache_path, {'generation': generation, 'hash': content_hash, 'compacted_through': compacted_through})
+        forget_cached_meta()
+        return generation
+
+
+def changes_since(cache_path, since):
+    """Return ``{(person_type, person_id): op}`` for changes after ``since``.
+
+    Returns ``None`` when the journal no longer covers ``since`` and the
+    caller has to fall back to a full download.
+    """
+    with cache_state_lock, journal_file_lock(cache_path):
+        state = load_cache_state(cache_path)
+        entries = read_journal(cache_path)
+    if since < state['compacted_through'] or since > state['generation']:
+        return None
+    changes = {}
+    for entry in entries:
+        if entry.get('op') not in PUBLISHED_OPS:
+            continue
+        if int(entry.get('generation') or 0) <= since:
+            continue
+        changes[_person_key(entry.get('person_type'), entry.get('person_id'))] = entry['op']
+    return changes
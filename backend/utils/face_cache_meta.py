@@ -0,0 +1,163 @@
+"""Fingerprint and generation tracking for the shared face encoding cache.
+
+The Flask process and the ``extract_embeddings`` script both rewrite the
+cache state file and the change journal beside it, so every
+read-modify-write of either holds :func:`journal_file_lock`, an OS file
+lock next to the journal, in addition to the in-process ``cache_state_lock``
+(always taken first).
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from utils.face_gallery_format import GALLERY_HEADER, GALLERY_HEADER_SIZE, GALLERY_MAGIC, gallery_path_for
+
+STATE_FILENAME = 'face_cache_state.json'
+LOCK_FILENAME = 'face_cache_journal.jsonl.lock'
+_HASH_CHUNK_SIZE = 1024 * 1024
+cache_state_lock = threading.RLock()
+_meta_memo = {}
+_held_file_locks = threading.local()
+
+
+def _state_path(cache_path):
+    return os.path.join(os.path.dirname(os.path.abspath(str(cache_path))), STATE_FILENAME)
+
+
+@contextmanager
+def journal_file_lock(cache_path):
+    """Hold an exclusive cross-process lock on the cache state and journal for the duration of the block.
+
+    Re-entrant within a thread, so a caller holding it can still call
+    helpers such as ``publish_gallery_changes`` that take it themselves.
+    """
+    lock_path = os.path.join(os.path.dirname(os.path.abspath(str(cache_path))), LOCK_FILENAME)
+    held = getattr(_held_file_locks, 'paths', None)
+    if held is None:
+        held = _held_file_locks.paths = set()
+    if lock_path in held:
+        yield
+        return
+    with open(lock_path, 'a+b') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        held.add(lock_path)
+        try:
+            yield
+        finally:
+            held.discard(lock_path)
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def load_cache_state(cache_path):
+    """Return the persisted ``{'generation', 'hash', 'compacted_through'}`` state for the cache."""
+    try:
+        with open(_state_path(cache_path), 'r', encoding='utf-8') as handle:
+            state = json.load(handle)
+        return {'generation': int(state.get('generation') or 0), 'hash': state.get('hash'), 'compacted_through': int(state.get('compacted_through') or 0)}
+    except (OSError, ValueError, TypeError, AttributeError):
+        return {'generation': 0, 'hash': None, 'compacted_through': 0}
+
+
+def save_cache_state(cache_path, state):
+    """Persist the cache state next to the cache file."""
+    path = _state_path(cache_path)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as handle:
+        json.dump(state, handle)
+    os.replace(temp_path, path)
+
+
+def file_sha256(path):
+    """Hash a file in chunks so large galleries never sit fully in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _count_entries(cache_path, stat):
+    """Count gallery rows, reading the binary header when it is current."""
+    gallery_path = gallery_path_for(cache_path)
+    try:
+        if os.path.getmtime(gallery_path) >= stat.st_mtime:
+            with open(gallery_path, 'rb') as handle:
+                header = handle.read(GALLERY_HEADER_SIZE)
+            fields = GALLERY_HEADER.unpack_from(header)
+            if fields[0] == GALLERY_MAGIC:
+                return int(fields[3])
+    except Exception:
+        pass
+    try:
+        with open(cache_path, 'rb') as handle:
+            face_data = pickle.load(handle)
+        return len(face_data.get('student_ids') or []) + len(face_data.get('instructor_ids') or [])
+    except Exception:
+        return 0
+
+
+def describe_face_cache(cache_path):
+    """Return hash, generation, size, entry count and mtime for the cache file.
+
+    Results are memoized on the file's mtime and size, so repeated polls only
+    stat the file. A content change that was not recorded in the change
+    journal still bumps the generation the first time it is observed; since
+    nobody knows what changed, delta sync is disabled up to that generation.
+    The file is hashed under :func:`journal_file_lock`, so a cache that
+    ``extract_embeddings`` is publishing is seen either before or after its
+    journal entry, never in between.
+    """
+    stat = os.stat(cache_path)
+    memo_key = (os.path.abspath(cache_path), stat.st_mtime_ns, stat.st_size)
+    with cache_state_lock:
+        cached = _meta_memo.get(memo_key)
+        if cached is not None:
+            return dict(cached)
+        with journal_file_lock(cache_path):
+            stat = os.stat(cache_path)
+            memo_key = (os.path.abspath(cache_path), stat.st_mtime_ns, stat.st_size)
+            content_hash = file_sha256(cache_path)
+            state = load_cache_state(cache_path)
+            if state['hash'] != content_hash:
+                generation = state['generation'] + 1
+                state = {'generation': generation, 'hash': content_hash, 'compacted_through': generation}
+                try:
+                    save_cache_state(cache_path, state)
+                except OSError:
+                    pass
+        meta = {
+            'hash': content_hash,
+            'generation': state['generation'],
+            'compacted_through': state['compacted_through'],
+            'size': stat.st_size,
+            'entry_count': _count_entries(cache_path, stat),
+            'mtime': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat(),
+            'last_modified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+        }
+        _meta_memo.clear()
+        _meta_memo[memo_key] = meta
+        return dict(meta)
+
+
+def forget_cached_meta():
+    """Drop memoized metadata after the state file was rewritten elsewhere."""
+    with cache_state_lock:
+        _meta_memo.clear()
@@ -0,0 +1,72 @@
+"""Versioned binary face gallery written next to ``face_encodings.pkl``.
+
+Layout (little-endian), mirrored by the kiosk reader in ``client/face_gallery.py``:
+
+* 64-byte header: magic, format version, flags, row count, embedding
+  dimension, matrix offset, label table offset and label table length.
+* ``count x dim`` float32 matrix, row-major, every row L2-normalized.
+* UTF-8 JSON label table: one ``[id, name, type_code]`` row per matrix row.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+GALLERY_MAGIC = b'FRGALLRY'
+GALLERY_VERSION = 1
+GALLERY_FILENAME = 'face_gallery.bin'
+GALLERY_HEADER = struct.Struct('<8sHHIIQQQ')
+GALLERY_HEADER_SIZE = 64
+GALLERY_FLAG_NORMALIZED = 1
+PERSON_TYPE_CODES = {'Student': 0, 'Instructor': 1}
+
+
+def _json_label(value):
+    """Serialize numpy scalars in the label table as plain Python values."""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def gallery_path_for(cache_file):
+    """Return the binary gallery path that sits beside the pickle cache."""
+    return os.path.join(os.path.dirname(os.path.abspath(str(cache_file))), GALLERY_FILENAME)
+
+
+def _normalized_rows(embeddings):
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype='<f4')
+
+
+def write_face_gallery(path, face_data):
+    """Write the cache dictionary as a binary gallery, replacing ``path`` atomically.
+
+    Returns the number of rows written.
+    """
+    vectors = []
+    labels = []
+    for prefix, person_type in (('student', 'Student'), ('instructor', 'Instructor')):
+        embeddings = face_data.get(f'{prefix}_embeddings') or []
+        names = face_data.get(f'{prefix}_names') or []
+        ids = face_data.get(f'{prefix}_ids') or []
+        for embedding, name, person_id in zip(embeddings, names, ids):
+            vectors.append(np.asarray(embedding, dtype=np.float32).ravel())
+            labels.append([person_id, name, PERSON_TYPE_CODES[person_type]])
+    if vectors:
+        matrix = _normalized_rows(np.vstack(vectors))
+    else:
+        matrix = np.zeros((0, 0), dtype='<f4')
+    count = matrix.shape[0]
+    dim = matrix.shape[1] if count else 0
+    label_bytes = json.dumps(labels, ensure_ascii=False, separators=(',', ':'), default=_json_label).encode('utf-8')
+    matrix_offset = GALLERY_HEADER_SIZE
+    labels_offset = matrix_offset + matrix.nbytes
+    header = GALLERY_HEADER.pack(GALLERY_MAGIC, GALLERY_VERSION, GALLERY_FLAG_NORMALIZED, count, dim, matrix_offset, labels_offset, len(label_bytes))
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(header.ljust(GALLERY_HEADER_SIZE, b'\0'))
+        handle.write(matrix.tobytes())
+        handle.write(label_bytes)
+    os.replace(temp_path, path)
+    return count
@@ -0,0 +1,119 @@
+"""Inverted-file (IVF) index written next to ``face_gallery.bin``.
+
+Gallery rows are grouped under ``nlist`` coarse centroids trained with
+spherical k-means. Kiosks score the query against the centroids, scan only
+the rows of the ``nprobe`` closest lists and re-rank that short list with
+exact distances. Layout (little-endian), mirrored by ``client/face_gallery.py``:
+
+* 64-byte header: magic, format version, flags, list count, embedding
+  dimension, gallery row count, CRC32 of the gallery label table and the
+  offsets of the centroid matrix, list offsets and row order.
+* ``nlist x dim`` float32 centroid matrix, rows L2-normalized.
+* ``nlist + 1`` int64 offsets into the row order.
+* ``rows`` int32 gallery row indices grouped by list.
+"""
+import math
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from utils.face_gallery_format import GALLERY_HEADER, GALLERY_HEADER_SIZE, GALLERY_MAGIC
+
+INDEX_MAGIC = b'FRGINDEX'
+INDEX_VERSION = 1
+INDEX_FILENAME = 'face_gallery.ivf'
+INDEX_HEADER = struct.Struct('<8sHHIIIIQQQ')
+INDEX_HEADER_SIZE = 64
+INDEX_MIN_ROWS = 2048
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+_ASSIGN_CHUNK_ROWS = 8192
+
+
+def index_path_for(cache_file):
+    """Return the IVF index path that sits beside the pickle cache."""
+    return os.path.join(os.path.dirname(os.path.abspath(str(cache_file))), INDEX_FILENAME)
+
+
+def default_list_count(rows):
+    """Pick ``nlist`` around ``4 * sqrt(rows)``, the usual IVF starting point."""
+    return int(min(4096, max(16, round(4 * math.sqrt(max(rows, 1))))))
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def assign_lists(matrix, centroids):
+    """Return the nearest centroid of every row, computed in chunks to bound memory."""
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), _ASSIGN_CHUNK_ROWS):
+        block = np.asarray(matrix[start:start + _ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(matrix, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means on a sample of ``matrix``; returns ``nlist x dim`` unit centroids."""
+    rng = np.random.default_rng(seed)
+    rows = len(matrix)
+    sample_size = min(rows, nlist * KMEANS_SAMPLES_PER_LIST)
+    sample = np.asarray(matrix[np.sort(rng.choice(rows, size=sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=nlist)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = np.flatnonzero(counts)
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(sample_size, size=len(empty), replace=False)]
+        centroids = _normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def write_face_index(path, gallery_path, nlist=None, min_rows=INDEX_MIN_ROWS):
+    """Build the IVF index for the binary gallery at ``gallery_path``.
+
+    Returns the number of lists written, or 0 when the gallery is too small
+    to benefit; any stale index is removed in that case so kiosks fall back
+    to the exact scan.
+    """
+    with open(gallery_path, 'rb') as handle:
+        header = handle.read(GALLERY_HEADER_SIZE)
+        magic, _version, _flags, count, dim, matrix_offset, labels_offset, labels_length = GALLERY_HEADER.unpack_from(header)
+        if magic != GALLERY_MAGIC:
+            raise ValueError(f'{gallery_path} is not a face gallery file')
+        handle.seek(labels_offset)
+        labels_crc = zlib.crc32(handle.read(labels_length))
+    if count < max(min_rows, 1):
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    matrix = np.memmap(gallery_path, dtype='<f4', mode='r', offset=matrix_offset, shape=(count, dim))
+    nlist = min(nlist or default_list_count(count), count)
+    centroids = train_centroids(matrix, nlist)
+    assignments = assign_lists(matrix, centroids)
+    order = np.argsort(assignments, kind='stable').astype('<i4')
+    offsets = np.zeros(nlist + 1, dtype='<i8')
+    np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+    centroids = np.ascontiguousarray(centroids, dtype='<f4')
+    centroids_offset = INDEX_HEADER_SIZE
+    offsets_offset = centroids_offset + centroids.nbytes
+    order_offset = offsets_offset + offsets.nbytes
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, nlist, dim, count, labels_crc, centroids_offset, offsets_offset, order_offset)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(header.ljust(INDEX_HEADER_SIZE, b'\0'))
+        handle.write(centroids.tobytes())
+        handle.write(offsets.tobytes())
+        handle.write(order.tobytes())
+    os.replace(temp_path, path)
+    return nlist
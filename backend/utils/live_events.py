@@ -0,0 +1,203 @@
+"""In-process change feed that kiosks follow over Server-Sent Events.
+
+Kiosks used to poll ``/api/sessions/active``, ``/classes/api/list`` and
+``/api/face-encodings/meta`` every few seconds each. That load grows with
+kiosks x endpoints / interval. ``GET /api/events`` instead streams one line
+per change:
+
+* ``session`` - a class session was created, started, ended or deleted.
+* ``view_lock`` - only the session's kiosk view lock changed.
+* ``class`` - a class was created, edited or deleted.
+* ``gallery`` - the face encoding cache moved to a new generation.
+
+Session and class events come from SQLAlchemy flush hooks and are published
+only after the transaction commits, so every write path is covered without
+touching the routes. Gallery bumps can come from ``extract_embeddings``
+running in another process, so each stream checks the cache generation
+every few seconds instead of relying on an in-process publish.
+
+Event ids are ``<boot>-<sequence>``. A reconnecting kiosk sends
+``Last-Event-ID`` and gets the events it missed from a bounded buffer. When
+the buffer no longer reaches back that far, or the server restarted, the
+stream opens with a ``hello`` event whose ``resync`` flag tells the kiosk to
+reload its state once. The bus lives in one process, so a multi-worker
+deployment needs every kiosk stream and write on the same worker or a
+shared broker in its place.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import Class, ClassSession
+
+EVENT_BUFFER_SIZE = int(os.environ.get('FRCAS_EVENT_BUFFER', '1024'))
+HEARTBEAT_SECONDS = 15
+GALLERY_CHECK_SECONDS = 5
+STREAM_MAX_SECONDS = int(os.environ.get('FRCAS_EVENT_STREAM_SECONDS', '900'))
+RECONNECT_MS = 3000
+VIEW_LOCK_FIELDS = frozenset(('view_lock_owner', 'view_lock_acquired_at'))
+_PENDING_KEY = 'live_events'
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+class EventBus:
+    """Bounded, thread-safe buffer of recent events with blocking reads."""
+
+    def __init__(self, capacity=EVENT_BUFFER_SIZE):
+        self.boot = uuid.uuid4().hex[:12]
+        self._events = deque(maxlen=capacity)
+        self._condition = threading.Condition()
+        self._last_seq = 0
+
+    @property
+    def last_seq(self):
+        with self._condition:
+            return self._last_seq
+
+    def event_id(self, seq):
+        return f'{self.boot}-{seq}'
+
+    def resume_point(self, event_id):
+        """Sequence to resume after for a client's ``Last-Event-ID``; ``None`` when it must resync."""
+        boot, _, seq = str(event_id or '').rpartition('-')
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        with self._condition:
+            if seq > self._last_seq:
+                return None
+            oldest = self._events[0][0] if self._events else self._last_seq + 1
+            if seq + 1 < oldest and seq != self._last_seq:
+                return None
+        return seq
+
+    def publish(self, event_type, data):
+        with self._condition:
+            self._last_seq += 1
+            self._events.append((self._last_seq, event_type, data))
+            self._condition.notify_all()
+            return self._last_seq
+
+    def events_after(self, seq, timeout=None):
+        """Events newer than ``seq``, waiting up to ``timeout`` for one; ``None`` if some were dropped."""
+        with self._condition:
+            if self._last_seq <= seq:
+                self._condition.wait(timeout)
+            if self._events and self._events[0][0] > seq + 1:
+                return None
+            return [entry for entry in self._events if entry[0] > seq]
+
+
+bus = EventBus()
+
+
+def session_payload(session, deleted=False):
+    return {
+        'class_session_id': session.id,
+        'class_id': session.class_id,
+        'date': _iso(session.date),
+        'start_time': _iso(session.start_time),
+        'scheduled_end_time': _iso(session.scheduled_end_time),
+        'room_number': session.session_room_number,
+        'instructor_id': session.instructor_id,
+        'is_attendance_processed': bool(session.is_attendance_processed),
+        'view_lock_owner': session.view_lock_owner,
+        'view_lock_acquired_at': _iso(session.view_lock_acquired_at),
+        'active': not deleted and session.start_time is not None and not session.is_attendance_processed,
+        'deleted': deleted,
+    }
+
+
+def _changed_fields(obj):
+    state = inspect(obj)
+    return {attr.key for attr in state.attrs if attr.history.has_changes()}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj, deleted in [(obj, False) for obj in session.new] + [(obj, False) for obj in session.dirty] + [(obj, True) for obj in session.deleted]:
+        if isinstance(obj, ClassSession):
+            changed = _changed_fields(obj) if obj in session.dirty else None
+            if changed is not None and not changed:
+                continue
+            event_type = 'view_lock' if changed and changed <= VIEW_LOCK_FIELDS else 'session'
+            previous = pending.get(('session', obj.id))
+            if previous is not None and previous[0] == 'session':
+                event_type = 'session'
+            pending[('session', obj.id)] = (event_type, session_payload(obj, deleted=deleted))
+        elif isinstance(obj, Class):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            pending[('class', obj.id)] = ('class', {'class_id': obj.id, 'deleted': deleted})
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    for event_type, data in (pending or {}).values():
+        bus.publish(event_type, data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def format_event(event_type, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id else []
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def event_stream(last_event_id, gallery_generation, max_seconds=STREAM_MAX_SECONDS):
+    """Yield SSE frames until ``max_seconds`` pass; the client reconnects with ``Last-Event-ID``.
+
+    ``gallery_generation`` is a callable returning the current face cache
+    generation, or ``None`` when there is no cache.
+    """
+
+    def current_generation():
+        try:
+            return gallery_generation()
+        except Exception:
+            return None
+
+    seq = bus.resume_point(last_event_id)
+    resync = seq is None
+    if resync:
+        seq = bus.last_seq
+    generation = current_generation()
+    yield f'retry: {RECONNECT_MS}\n\n'
+    yield format_event('hello', {'resync': resync, 'gallery_generation': generation}, event_id=bus.event_id(seq))
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        entries = bus.events_after(seq, timeout=GALLERY_CHECK_SECONDS)
+        if entries is None:
+            seq = bus.last_seq
+            yield format_event('hello', {'resync': True, 'gallery_generation': generation}, event_id=bus.event_id(seq))
+            last_sent = time.monotonic()
+            continue
+        for entry_seq, event_type, data in entries:
+            seq = entry_seq
+            yield format_event(event_type, data, event_id=bus.event_id(entry_seq))
+            last_sent = time.monotonic()
+        latest = current_generation()
+        if latest is not None and latest != generation:
+            generation = latest
+            yield format_event('gallery', {'generation': generation})
+            last_sent = time.monotonic()
+        if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
@@ -0,0 +1,110 @@
+"""Change tokens and cached bodies for the JSON endpoints kiosks revalidate.
+
+``/classes/api/list`` and ``/api/sessions/active`` used to be rebuilt and
+serialized on every kiosk refresh, even though the timetable rarely changes.
+Each table has an in-process generation counter. It is bumped after a
+commit that inserted, updated or deleted rows of that table, through the
+ORM or through bulk ``query.update()``/``delete()`` calls.
+
+A :class:`CachedPayload` keeps the serialized body and its ``ETag`` (a
+hash of the body) for as long as the generations of the tables it depends
+on are unchanged. An unchanged timetable then costs a 304 to a kiosk that
+sends ``If-None-Match``. A cached body is also dropped after
+``max_age`` seconds, because scripts such as ``reset_class_sessions.py``
+write to the database without going through this process. A body that
+depends on the clock can also give its own expiry. Because the ETag hashes
+the content, a rebuild that produces the same body keeps the kiosks' copies
+valid.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+CACHE_MAX_AGE_SECONDS = 30
+_PENDING_KEY = 'changed_tables'
+_generations = {}
+_generations_lock = threading.Lock()
+
+
+def _table_name(obj):
+    table = getattr(obj, '__table__', None)
+    return table.name if table is not None else None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_tables(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        name = _table_name(obj)
+        if name and (obj not in session.dirty or session.is_modified(obj)):
+            pending.add(name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None:
+        orm_execute_state.session.info.setdefault(_PENDING_KEY, set()).add(orm_execute_state.bind_mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_generations(session):
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        with _generations_lock:
+            for name in changed:
+                _generations[name] = _generations.get(name, 0) + 1
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_tables(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def table_generations(*models):
+    """Current generation of each model's table, as a tuple usable in cache keys."""
+    with _generations_lock:
+        return tuple(_generations.get(model.__table__.name, 0) for model in models)
+
+
+class CachedPayload:
+    """Serialized JSON body and ETag, rebuilt only after one of ``models`` changed."""
+
+    def __init__(self, *models, max_age=CACHE_MAX_AGE_SECONDS):
+        self.models = models
+        self.max_age = max_age
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope, build):
+        """Return ``(body, etag)`` for ``scope``.
+
+        ``build()`` returns ``(payload, expires_at)``. ``expires_at`` is an
+        optional ``time.time()`` deadline for payloads that change with the clock.
+        """
+        generations = table_generations(*self.models)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is not None and entry[0] == generations and now < entry[1]:
+                return (entry[2], entry[3])
+        payload, expires_at = build()
+        body = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        expires_at = min(now + self.max_age, expires_at) if expires_at is not None else now + self.max_age
+        with self._lock:
+            self._entries[scope] = (generations, expires_at, body, etag)
+        return (body, etag)
+
+
+def conditional_json(cache, scope, build):
+    """JSON response for ``cache``/``scope`` that answers a matching ``If-None-Match`` with 304."""
+    body, etag = cache.get(scope, build)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
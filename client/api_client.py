@@ -0,0 +1,220 @@
+"""Pooled HTTP client for every kiosk call to the backend.
+
+Each bare ``requests.get``/``requests.post`` opened a new TCP (and TLS)
+connection, so every scan, poll and lock paid a handshake on the campus LAN.
+:class:`ApiClient` keeps one ``requests.Session`` per server with a
+keep-alive connection pool that all kiosk windows and threads share.
+
+Every call names its endpoint. That picks the read timeout from
+``ENDPOINT_TIMEOUTS`` (connect timeout ``FRCAS_HTTP_CONNECT_TIMEOUT``), and
+the latency metrics record the call under ``http.<endpoint>``. Idempotent
+calls are retried on connection errors, timeouts and 502/503/504 responses,
+up to ``FRCAS_HTTP_RETRIES`` times. The sleep between attempts is a jittered
+exponential backoff. Calls that change state, such as recording attendance,
+are sent once. The class list and active sessions are fetched with
+``If-None-Match``. When the server answers 304, the client returns the last
+full response, so an unchanged timetable costs one header exchange.
+
+The typed helpers at the bottom wrap each backend endpoint the kiosks use.
+They return the ``requests.Response`` so callers keep their own status
+handling, and failures raise ``requests.exceptions.RequestException`` as
+before.
+"""
+
+import os
+import random
+import threading
+import time
+import warnings
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from latency_metrics import record as record_latency
+from server import API_KEY, SERVER_URL
+
+try:
+    from urllib3.exceptions import InsecureRequestWarning
+    warnings.simplefilter('ignore', InsecureRequestWarning)
+except ImportError:
+    pass
+
+CONNECT_TIMEOUT = float(os.environ.get('FRCAS_HTTP_CONNECT_TIMEOUT', '3.05'))
+MAX_RETRIES = int(os.environ.get('FRCAS_HTTP_RETRIES', '2'))
+POOL_SIZE = int(os.environ.get('FRCAS_HTTP_POOL_SIZE', '8'))
+VERIFY_TLS = os.environ.get('FRCAS_HTTP_VERIFY', '').strip().lower() in ('1', 'true', 'yes', 'on')
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4.0
+RETRY_STATUSES = frozenset((502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+DEFAULT_TIMEOUT = 10
+ENDPOINT_TIMEOUTS = {'rooms': 10, 'sessions.active': 10, 'sessions.view_lock': 10, 'classes.list': 10, 'classes.roster': 10, 'attendance.check': 5, 'attendance.record': 10, 'attendance.batch': 30, 'instructor.checkin': 15, 'instructor.checkout': 10, 'face_cache.meta': 3, 'face_cache.delta': 10, 'face_cache.download': 30, 'face_cache.index': 30, 'kiosk_metrics': 5, 'students.upload_image': 30, 'students.create': 20, 'students.images': 20, 'instructor.classes': 15, 'instructor.students': 20, 'instructor.class_students': 20, 'image': 20, 'events': 45}
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full-jitter exponential backoff before retry number ``attempt`` (1-based)."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class ApiClient:
+    """Keep-alive session to one backend with default headers, timeouts and retries."""
+
+    def __init__(self, server_url=SERVER_URL, api_key=API_KEY, pool_size=POOL_SIZE, max_retries=MAX_RETRIES, verify=VERIFY_TLS):
+        self.server_url = server_url.rstrip('/')
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.headers.update({'X-API-Key': api_key, 'Accept': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._validated = {}
+        self._validated_lock = threading.Lock()
+
+    def url(self, path):
+        return path if path.startswith(('http://', 'https://')) else f"{self.server_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, endpoint=None, timeout=None, idempotent=None, **kwargs):
+        """Send one request, retrying idempotent calls; returns the final ``requests.Response``.
+
+        ``idempotent`` overrides the method-based default, e.g. for read-only
+        POST lookups. The last response or exception is surfaced unchanged.
+        """
+        method = method.upper()
+        if timeout is None:
+            timeout = ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        if not isinstance(timeout, tuple):
+            timeout = (min(CONNECT_TIMEOUT, timeout), timeout)
+        retries = self.max_retries if (method in IDEMPOTENT_METHODS if idempotent is None else idempotent) else 0
+        url = self.url(path)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    if endpoint:
+                        record_latency(f'http.{endpoint}', time.perf_counter() - started)
+                    return response
+                response.close()
+            attempt += 1
+            time.sleep(backoff_delay(attempt))
+
+    def get(self, path, endpoint=None, **kwargs):
+        return self.request('GET', path, endpoint=endpoint, **kwargs)
+
+    def get_revalidated(self, path, endpoint=None, headers=None, **kwargs):
+        """GET that sends the last ``ETag`` seen for ``path`` and answers a 304 with the stored 200 response."""
+        url = self.url(path)
+        with self._validated_lock:
+            stored = self._validated.get(url)
+        headers = dict(headers or {})
+        if stored is not None:
+            headers['If-None-Match'] = stored.headers['ETag']
+        response = self.get(url, endpoint=endpoint, headers=headers, **kwargs)
+        if response.status_code == 304 and stored is not None:
+            return stored
+        if response.status_code == 200 and response.headers.get('ETag'):
+            with self._validated_lock:
+                self._validated[url] = response
+        return response
+
+    def post(self, path, endpoint=None, **kwargs):
+        return self.request('POST', path, endpoint=endpoint, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def rooms(self):
+        return self.get('/api/rooms', endpoint='rooms')
+
+    def active_sessions(self):
+        return self.get_revalidated('/api/sessions/active', endpoint='sessions.active')
+
+    def view_lock(self, session_id, payload):
+        return self.post(f'/api/sessions/{session_id}/view-lock', endpoint='sessions.view_lock', json=payload)
+
+    def class_list(self, timeout=None):
+        return self.get_revalidated('/classes/api/list', endpoint='classes.list', timeout=timeout)
+
+    def class_roster(self, class_id):
+        return self.get(f'/api/classes/{class_id}/roster', endpoint='classes.roster')
+
+    def attendance_check(self, payload, person_type='Student'):
+        path = '/api/attendance/check' if person_type == 'Student' else '/api/attendance/check/instructor'
+        return self.post(path, endpoint='attendance.check', json=payload, idempotent=True)
+
+    def record_student_attendance(self, payload, headers=None):
+        return self.post('/api/attendance/record', endpoint='attendance.record', json=payload, headers=headers)
+
+    def record_attendance_batch(self, items, headers=None):
+        return self.post('/api/attendance/batch', endpoint='attendance.batch', json={'items': items}, headers=headers)
+
+    def record_instructor_attendance(self, payload, headers=None):
+        return self.post('/api/instructor-attendance', endpoint='attendance.record', json=payload, headers=headers)
+
+    def instructor_checkin(self, payload):
+        return self.post('/api/checkin/instructor', endpoint='instructor.checkin', json=payload)
+
+    def instructor_checkout(self, payload, headers=None):
+        return self.post('/api/checkout/instructor', endpoint='instructor.checkout', json=payload, headers=headers)
+
+    def face_cache_meta(self, headers=None, timeout=None):
+        return self.get('/api/face-encodings/meta', endpoint='face_cache.meta', headers=headers, timeout=timeout)
+
+    def face_cache_delta(self, since, headers=None, timeout=None):
+        return self.get('/api/face-encodings/delta', endpoint='face_cache.delta', params={'since': since}, headers=headers, timeout=timeout)
+
+    def face_cache_download(self, headers=None, timeout=None):
+        return self.get('/api/face-encodings', endpoint='face_cache.download', headers=headers, timeout=timeout, stream=True)
+
+    def face_cache_index(self, headers=None, timeout=None):
+        return self.get('/api/face-encodings/index', endpoint='face_cache.index', headers=headers, timeout=timeout, stream=True)
+
+    def kiosk_metrics(self, report, timeout=None):
+        return self.post('/api/kiosk-metrics', endpoint='kiosk_metrics', json=report, timeout=timeout)
+
+    def upload_student_image(self, data, files, headers=None):
+        return self.post('/students/api/upload-image', endpoint='students.upload_image', data=data, files=files, headers=headers)
+
+    def student_images(self, student_id, headers=None):
+        return self.get(f'/students/api/images/{student_id}', endpoint='students.images', headers=headers)
+
+    def create_student(self, payload, headers=None):
+        return self.post('/students/api/create', endpoint='students.create', json=payload, headers=headers)
+
+    def instructor_classes(self, instructor_id, headers=None):
+        return self.get(f'/api/instructors/{instructor_id}/classes', endpoint='instructor.classes', headers=headers)
+
+    def instructor_students(self, instructor_id, headers=None):
+        return self.get(f'/api/instructors/{instructor_id}/students', endpoint='instructor.students', headers=headers)
+
+    def instructor_class_students(self, instructor_id, class_id, headers=None):
+        return self.get(f'/api/instructors/{instructor_id}/classes/{class_id}/students', endpoint='instructor.class_students', headers=headers)
+
+    def event_stream(self, last_event_id=None):
+        headers = {'Accept': 'text/event-stream'}
+        if last_event_id:
+            headers['Last-Event-ID'] = last_event_id
+        return self.get('/api/events', endpoint='events', headers=headers, stream=True, idempotent=False)
+
+    def fetch_image(self, url, headers=None, timeout=None):
+        return self.get(url, endpoint='image', headers=headers, timeout=timeout)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_api_client(server_url=None):
+    """Return the process-wide client for ``server_url`` (default ``FRCAS_SERVER_URL``)."""
+    key = (server_url or SERVER_URL).rstrip('/')
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = ApiClient(key)
+        return client
@@ -0,0 +1,381 @@
+"""Offline-first journal for attendance writes made by the kiosk.
+
+A recognized check-in used to be posted straight to the backend. A timeout
+or a backend restart during class changeover lost it. Every student and
+instructor check-in and every class checkout is now written first to a
+SQLite database in WAL mode, ``cache/attendance_journal.sqlite3``. Each
+entry carries a client-generated idempotency key and the ``recorded_at``
+time of the scan. :meth:`JournalFlusher.submit` then tries one immediate
+delivery. If the backend is known to be unreachable, it skips that attempt
+so the scan does not wait on the network. A background thread drains the
+remaining entries in order and in batches of ``FRCAS_JOURNAL_BATCH`` every
+``FRCAS_JOURNAL_FLUSH_INTERVAL`` seconds. Consecutive student check-ins in
+a batch are sent in one ``/api/attendance/batch`` call, falling back to
+single requests against a backend without that endpoint. While the backend is unreachable,
+the thread probes it with exponential backoff. An entry the backend answered
+with an error backs off on its own.
+
+Delivery outcomes:
+
+* 2xx and 409 (already recorded) mark the entry delivered.
+* Other 4xx responses mark it rejected. It is kept for inspection, and
+  callbacks registered with :meth:`JournalFlusher.subscribe` hear about it
+  so a queued write the backend refused is not dropped silently.
+* Network errors, 429 and 5xx leave it pending for the next pass.
+
+The backend's attendance rules make replays harmless: a second check-in
+for the same session returns 409, and a second checkout returns "already
+ended".
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import requests
+
+from api_client import get_api_client
+
+JOURNAL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'cache', 'attendance_journal.sqlite3'))
+FLUSH_INTERVAL = float(os.environ.get('FRCAS_JOURNAL_FLUSH_INTERVAL', '5'))
+FLUSH_BATCH_SIZE = int(os.environ.get('FRCAS_JOURNAL_BATCH', '25'))
+RETRY_BASE_SECONDS = 2.0
+RETRY_CAP_SECONDS = 300.0
+KEEP_FINISHED_SECONDS = 7 * 24 * 3600
+MAX_BACKOFF_EXPONENT = 16
+KIND_STUDENT_ATTENDANCE = 'student_attendance'
+KIND_INSTRUCTOR_ATTENDANCE = 'instructor_attendance'
+KIND_INSTRUCTOR_CHECKOUT = 'instructor_checkout'
+STATE_PENDING = 'pending'
+STATE_DELIVERED = 'delivered'
+STATE_REJECTED = 'rejected'
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance_journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    status_code INTEGER,
+    last_error TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS attendance_journal_pending ON attendance_journal (state, next_attempt_at, id);
+"""
+
+
+def _send(client, kind, payload, key):
+    headers = {'Idempotency-Key': key}
+    if kind == KIND_STUDENT_ATTENDANCE:
+        return client.record_student_attendance(payload, headers=headers)
+    if kind == KIND_INSTRUCTOR_ATTENDANCE:
+        return client.record_instructor_attendance(payload, headers=headers)
+    if kind == KIND_INSTRUCTOR_CHECKOUT:
+        return client.instructor_checkout(payload, headers=headers)
+    raise ValueError(f'Unknown journal entry kind: {kind}')
+
+
+def retry_delay(failures):
+    """Exponential retry delay after ``failures`` failed attempts, capped at ``RETRY_CAP_SECONDS``."""
+    return min(RETRY_CAP_SECONDS, RETRY_BASE_SECONDS * 2 ** min(max(failures, 0), MAX_BACKOFF_EXPONENT))
+
+
+def outcome_for_status(status_code):
+    """Journal state a backend response with ``status_code`` settles an entry into."""
+    if 200 <= status_code < 300 or status_code == 409:
+        return STATE_DELIVERED
+    if status_code == 429 or status_code >= 500:
+        return STATE_PENDING
+    return STATE_REJECTED
+
+
+class AttendanceJournal:
+    """Durable queue of attendance writes, safe to share between threads."""
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def append(self, kind, payload, key=None):
+        """Record a write; returns its idempotency key. ``payload`` gains ``idempotency_key``/``recorded_at``."""
+        key = key or uuid.uuid4().hex
+        payload = dict(payload)
+        payload.setdefault('idempotency_key', key)
+        payload.setdefault('recorded_at', datetime.now().astimezone().isoformat())
+        with self._lock:
+            self._conn.execute('INSERT OR IGNORE INTO attendance_journal (idempotency_key, kind, payload, created_at) VALUES (?, ?, ?, ?)', (key, kind, json.dumps(payload), time.time()))
+        return key
+
+    def entry(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM attendance_journal WHERE idempotency_key = ?', (key,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def due(self, limit=FLUSH_BATCH_SIZE, now=None, exclude=()):
+        """Oldest pending entries whose retry time has come, in the order they were recorded."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM attendance_journal WHERE state = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?', (STATE_PENDING, now, limit + len(exclude))).fetchall()
+        entries = [self._row(row) for row in rows if row['idempotency_key'] not in exclude]
+        return entries[:limit]
+
+    def settle(self, key, state, status_code=None, error=None, now=None, backoff=True):
+        """Record a delivery attempt; ``STATE_PENDING`` with ``backoff`` delays this entry's next retry."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if state == STATE_PENDING:
+                row = self._conn.execute('SELECT attempts FROM attendance_journal WHERE idempotency_key = ?', (key,)).fetchone()
+                attempts = (row['attempts'] if row is not None else 0) + 1
+                delay = retry_delay(attempts - 1) if backoff else 0.0
+                self._conn.execute('UPDATE attendance_journal SET attempts = ?, next_attempt_at = ?, status_code = ?, last_error = ? WHERE idempotency_key = ?', (attempts, now + delay, status_code, error, key))
+            else:
+                self._conn.execute('UPDATE attendance_journal SET state = ?, attempts = attempts + 1, status_code = ?, last_error = ?, finished_at = ? WHERE idempotency_key = ?', (state, status_code, error, now, key))
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM attendance_journal WHERE state = ?', (STATE_PENDING,)).fetchone()[0]
+
+    def prune(self, older_than=KEEP_FINISHED_SECONDS, now=None):
+        """Drop delivered and rejected entries finished more than ``older_than`` seconds ago."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute('DELETE FROM attendance_journal WHERE state != ? AND finished_at < ?', (STATE_PENDING, now - older_than))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row(row):
+        entry = dict(row)
+        entry['payload'] = json.loads(entry['payload'])
+        return entry
+
+
+class JournalFlusher:
+    """Delivers journal entries to the backend, immediately when online and in the background otherwise."""
+
+    def __init__(self, journal, server_url=None, interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH_SIZE):
+        self.journal = journal
+        self.server_url = server_url
+        self.interval = interval
+        self.batch_size = batch_size
+        self.online = True
+        self.batch_supported = True
+        self._failures = 0
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+        self._listeners = []
+        self._listeners_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='attendance-journal', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, callback):
+        """Call ``callback(entry, state, status_code, error)`` when a queued entry is delivered or rejected.
+
+        Only entries settled by the background flusher are reported; a
+        :meth:`submit` that got an answer returns it to its caller instead.
+        Callbacks run on the flusher thread. Returns ``callback``.
+        """
+        with self._listeners_lock:
+            self._listeners.append(callback)
+        return callback
+
+    def _settle(self, entry, state, status_code=None, error=None, notify=False):
+        self.journal.settle(entry['idempotency_key'], state, status_code=status_code, error=error)
+        if not notify or state == STATE_PENDING:
+            return
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(entry, state, status_code, error)
+            except Exception:
+                pass
+
+    def _claim(self, key):
+        with self._in_flight_lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+            return True
+
+    def _release(self, key):
+        with self._in_flight_lock:
+            self._in_flight.discard(key)
+
+    def _deliver(self, entry, notify=False):
+        """Send one entry and settle it; returns the response, or ``None`` when it stays pending on a network error."""
+        key = entry['idempotency_key']
+        try:
+            response = _send(get_api_client(self.server_url), entry['kind'], entry['payload'], key)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+            self.online = False
+            self._failures += 1
+            self.journal.settle(key, STATE_PENDING, error=str(exc), backoff=False)
+            return None
+        self.online = True
+        self._failures = 0
+        state = outcome_for_status(response.status_code)
+        self._settle(entry, state, status_code=response.status_code, error=None if state == STATE_DELIVERED else response.text[:500], notify=notify)
+        return response
+
+    def submit(self, kind, payload):
+        """Journal a write and try to deliver it now.
+
+        Returns ``(key, response)``. ``response`` is ``None`` when the entry
+        was queued for the background flusher instead.
+        """
+        key = self.journal.append(kind, payload)
+        if not self.online or not self._claim(key):
+            self._wake.set()
+            return (key, None)
+        try:
+            entry = self.journal.entry(key)
+            response = self._deliver(entry)
+        finally:
+            self._release(key)
+        if response is not None and outcome_for_status(response.status_code) == STATE_PENDING:
+            return (key, None)
+        return (key, response)
+
+    def _deliver_batch(self, entries):
+        """Send student check-ins through ``/api/attendance/batch`` and settle each from its result.
+
+        Returns the number settled, ``None`` when the backend stopped answering,
+        or ``False`` when the batch endpoint is unavailable and the caller should
+        send the entries one at a time.
+        """
+        items = [dict(entry['payload'], idempotency_key=entry['idempotency_key']) for entry in entries]
+        try:
+            response = get_api_client(self.server_url).record_attendance_batch(items)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+            self.online = False
+            self._failures += 1
+            for entry in entries:
+                self.journal.settle(entry['idempotency_key'], STATE_PENDING, error=str(exc), backoff=False)
+            return None
+        self.online = True
+        self._failures = 0
+        if outcome_for_status(response.status_code) == STATE_PENDING:
+            for entry in entries:
+                self.journal.settle(entry['idempotency_key'], STATE_PENDING, status_code=response.status_code, error=response.text[:500])
+            return None
+        try:
+            results = response.json().get('results') if response.ok else None
+        except ValueError:
+            results = None
+        if not isinstance(results, list):
+            if response.status_code in (404, 405):
+                self.batch_supported = False
+            return False
+        settled = set()
+        for result in results:
+            index = result.get('index') if isinstance(result, dict) else None
+            if not isinstance(index, int) or not 0 <= index < len(entries) or index in settled:
+                continue
+            code = int(result.get('code', 500))
+            state = outcome_for_status(code)
+            self._settle(entries[index], state, status_code=code, error=None if state == STATE_DELIVERED else str(result.get('message', ''))[:500], notify=True)
+            settled.add(index)
+        for index, entry in enumerate(entries):
+            if index not in settled:
+                self.journal.settle(entry['idempotency_key'], STATE_PENDING, status_code=response.status_code, error='Missing from batch response')
+        return len(settled)
+
+    def _flush_run(self, entries):
+        """Deliver consecutive due entries; returns ``(sent, keep_going)``."""
+        if len(entries) > 1 and self.batch_supported and all(entry['kind'] == KIND_STUDENT_ATTENDANCE for entry in entries):
+            settled = self._deliver_batch(entries)
+            if settled is None:
+                return (0, False)
+            if settled is not False:
+                return (settled, True)
+        sent = 0
+        for entry in entries:
+            response = self._deliver(entry, notify=True)
+            if response is None or outcome_for_status(response.status_code) == STATE_PENDING:
+                return (sent, False)
+            sent += 1
+        return (sent, True)
+
+    def flush(self):
+        """Deliver due entries in batches until none are left or the backend stops answering; returns the count sent.
+
+        Consecutive student check-ins go out as one ``/api/attendance/batch``
+        call; other kinds keep their own endpoints, in journal order.
+        """
+        sent = 0
+        while True:
+            with self._in_flight_lock:
+                busy = set(self._in_flight)
+            batch = [entry for entry in self.journal.due(self.batch_size, exclude=busy) if self._claim(entry['idempotency_key'])]
+            if not batch:
+                return sent
+            try:
+                runs = []
+                for entry in batch:
+                    if runs and entry['kind'] == KIND_STUDENT_ATTENDANCE and runs[-1][-1]['kind'] == KIND_STUDENT_ATTENDANCE:
+                        runs[-1].append(entry)
+                    else:
+                        runs.append([entry])
+                for run in runs:
+                    delivered, keep_going = self._flush_run(run)
+                    sent += delivered
+                    if not keep_going:
+                        return sent
+            finally:
+                for entry in batch:
+                    self._release(entry['idempotency_key'])
+
+    def _run(self):
+        while True:
+            try:
+                delay = self.interval if self.online else max(self.interval, retry_delay(self._failures))
+            except Exception:
+                delay = RETRY_CAP_SECONDS
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                self.flush()
+                now = time.time()
+                if now - self._last_prune > 3600:
+                    self._last_prune = now
+                    self.journal.prune(now=now)
+            except Exception:
+                pass
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_journal_flusher():
+    """Return the process-wide flusher over the default journal, starting it on first use."""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = JournalFlusher(AttendanceJournal())
+            _flusher.start()
+        return _flusher
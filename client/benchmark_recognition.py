@@ -0,0 +1,201 @@
+"""Replay recorded frames through the headless recognition engine.
+
+Reads a directory of images (in name order) or a video file and feeds each
+frame to :class:`RecognitionEngine`. Matching runs against a synthetic gallery
+of random Facenet512-sized identities plus one benchmark subject. Reports
+frames/s, time to first recognition, wall/CPU time per stage and peak RSS, so
+runs can be compared on a plain Linux box with no display or webcam.
+
+``--embedder`` names an :mod:`embedding_backend` (``deepface``,
+``opencv-dnn``, ``onnxruntime``) that embeds in this process with the real
+model. The subject is then the largest face in ``--enroll``, or the first face
+seen in the replay. ``--embedder auto`` first times every backend available
+on this machine on a batch of crops and replays with the fastest.
+``--embedder synthetic`` skips the model and returns the subject's embedding
+plus noise for every face, which measures everything around the CNN.
+
+    python benchmark_recognition.py recordings/hallway.mp4 --gallery-size 5000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import cv2
+from face_gallery import FaceGallery, PERSON_TYPE_STUDENT, DEFAULT_MATCH_THRESHOLD, distance_to_confidence, normalize_embedding
+from embedding_backend import available_backends, backend_names, get_backend
+from face_detector import DETECT_WIDTH, FaceDetector
+from latency_metrics import METRICS
+from recognition_engine import RecognitionEngine
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+EMBEDDING_DIM = 512
+SUBJECT_ID = 'BENCH-SUBJECT'
+SUBJECT_NAME = 'Benchmark Subject'
+SYNTHETIC_NOISE = 0.15
+BACKEND_TRIAL_BATCH = 4
+BACKEND_TRIAL_RUNS = 5
+
+def iter_frames(source, max_frames=None):
+    """Yield BGR frames from an image directory or a video file."""
+    count = 0
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if max_frames is not None and count >= max_frames:
+                return
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                count += 1
+                yield frame
+        return
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise SystemExit(f'Cannot open video source: {source}')
+    try:
+        while max_frames is None or count < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            count += 1
+            yield frame
+    finally:
+        capture.release()
+
+def synthetic_gallery(size, subject, rng):
+    """Random unit identities plus the benchmark subject as the last row."""
+    matrix = rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = np.vstack([matrix, subject.reshape(1, -1)])
+    ids = [f'SYN-{index}' for index in range(size)] + [SUBJECT_ID]
+    names = [f'Synthetic {index}' for index in range(size)] + [SUBJECT_NAME]
+    return FaceGallery(matrix, ids, names, [PERSON_TYPE_STUDENT] * (size + 1))
+
+class SubjectGallery:
+    """Holds the gallery, built lazily when the subject comes from the replay itself."""
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.gallery = None
+
+    def enroll(self, embedding):
+        self.gallery = synthetic_gallery(self.size, normalize_embedding(embedding).astype(np.float32), self.rng)
+
+    def match(self, embeddings):
+        if self.gallery is None and embeddings:
+            self.enroll(embeddings[0])
+        if self.gallery is None:
+            return []
+        matches = self.gallery.best_matches(embeddings, threshold=DEFAULT_MATCH_THRESHOLD)
+        return [(match.name, match.person_type, distance_to_confidence(match.distance), match.person_id) if match is not None else (None, None, 0, None) for match in matches]
+
+def fastest_backend(rng):
+    """Time each available backend on random crops and return the fastest one's name."""
+    crops = [rng.integers(0, 256, size=(160, 160, 3), dtype=np.uint8) for _ in range(BACKEND_TRIAL_BATCH)]
+    timings = {}
+    for name in available_backends():
+        try:
+            backend = get_backend(name)
+            backend.embed_crops(crops)
+            started = time.perf_counter()
+            for _ in range(BACKEND_TRIAL_RUNS):
+                backend.embed_crops(crops)
+            timings[name] = (time.perf_counter() - started) / BACKEND_TRIAL_RUNS
+        except Exception as exc:
+            print(f'backend {name}: unusable ({exc})', file=sys.stderr)
+    if not timings:
+        raise SystemExit('No embedding backend is available; use --embedder synthetic')
+    for name, seconds in sorted(timings.items(), key=lambda item: item[1]):
+        print(f'backend {name:<12} {seconds * 1000.0 / BACKEND_TRIAL_BATCH:.1f}ms/face (batch of {BACKEND_TRIAL_BATCH})')
+    return min(timings, key=timings.get)
+
+def build_embedder(kind, subjects, rng):
+    if kind != 'synthetic':
+        from face_pipeline import embed_boxes
+        backend = get_backend(fastest_backend(rng) if kind == 'auto' else kind)
+        return lambda frame, boxes: embed_boxes(frame, boxes, backend=backend)
+    subject = rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+    subject /= np.linalg.norm(subject)
+    subjects.enroll(subject)
+
+    def embed(frame, boxes):
+        noise = rng.standard_normal((len(boxes), EMBEDDING_DIM)).astype(np.float32) * (SYNTHETIC_NOISE / np.sqrt(EMBEDDING_DIM))
+        return [(tuple(box), normalize_embedding(subject + offset)) for box, offset in zip(boxes, noise)]
+    return embed
+
+def enroll_from_image(path, engine, subjects):
+    image = cv2.imread(path)
+    if image is None:
+        raise SystemExit(f'Cannot read enrollment image: {path}')
+    boxes = sorted(FaceDetector(min_distance=0.05).detect(image), key=lambda box: box[2] * box[3], reverse=True)
+    if not boxes:
+        raise SystemExit(f'No face found in enrollment image: {path}')
+    faces = engine.embed(image, boxes[:1])
+    if not faces:
+        raise SystemExit(f'Could not embed the face in enrollment image: {path}')
+    subjects.enroll(faces[0][1])
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    subjects = SubjectGallery(args.gallery_size, rng)
+    embed = build_embedder(args.embedder, subjects, rng)
+    engine = RecognitionEngine(embed=embed, match=subjects.match, detector=FaceDetector(detect_width=args.detect_width))
+    if args.enroll:
+        enroll_from_image(args.enroll, engine, subjects)
+    METRICS.reset()
+    engine.cpu_seconds = {}
+    frame_interval = 1.0 / args.fps
+    frames = skipped = recognitions = 0
+    first_recognition = None
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for frame in iter_frames(args.source, args.max_frames):
+        result = engine.process(frame, now=frames * frame_interval)
+        frames += 1
+        skipped += int(result.skipped)
+        if result.error is not None:
+            print(f'frame {frames}: {result.error}', file=sys.stderr)
+        for name, _person_type, _confidence, person_id in result.identities:
+            if person_id == SUBJECT_ID:
+                recognitions += 1
+                if first_recognition is None:
+                    first_recognition = (time.perf_counter() - started, frames)
+    elapsed = time.perf_counter() - started
+    cpu_total = time.process_time() - cpu_started
+    if not frames:
+        raise SystemExit('No frames were read from the source')
+    print(f'frames={frames} motion_skipped={skipped} elapsed={elapsed:.2f}s fps={frames / elapsed:.1f} process_cpu={cpu_total:.2f}s embedder={args.embedder} gallery={args.gallery_size + 1} detect_width={args.detect_width}')
+    if first_recognition is None:
+        print('time_to_first_recognition=never')
+    else:
+        print(f'time_to_first_recognition={first_recognition[0] * 1000.0:.0f}ms (frame {first_recognition[1]}) recognitions={recognitions}')
+    snapshot = METRICS.snapshot()
+    print(f"{'stage':<20}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cpu s':>10}")
+    for stage, stats in snapshot.items():
+        print(f"{stage:<20}{stats['count']:>7}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{engine.cpu_seconds.get(stage, 0.0):>10.3f}")
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f'peak_rss={rss:.1f}MB')
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay images or a video through the headless recognition engine.')
+    parser.add_argument('source', help='Directory of images or a video file')
+    parser.add_argument('--embedder', choices=('auto', 'synthetic') + tuple(backend_names()), default='auto' if available_backends() else 'synthetic', help='Embedding backend, auto for the fastest available, or synthetic (default auto when any backend is installed)')
+    parser.add_argument('--enroll', help='Image whose largest face becomes the benchmark subject (real backends only)')
+    parser.add_argument('--gallery-size', type=int, default=1000, help='Synthetic identities in the gallery besides the subject (default 1000)')
+    parser.add_argument('--max-frames', type=int, default=None, help='Stop after this many frames')
+    parser.add_argument('--fps', type=float, default=30.0, help='Capture rate used to timestamp replayed frames (default 30)')
+    parser.add_argument('--detect-width', type=int, default=DETECT_WIDTH, help=f'Width of the downscaled frame Haar detection runs on, 0 for full resolution (default {DETECT_WIDTH})')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default 0)')
+    run(parser.parse_args())
+if __name__ == '__main__':
+    main()
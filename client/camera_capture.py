@@ -0,0 +1,243 @@
+"""Low-latency camera capture service for the kiosk scanners.
+
+One thread drives ``cv2.VideoCapture`` with ``CAP_PROP_BUFFERSIZE=1`` and the
+configured resolution, FOURCC and frame rate. It calls ``grab()`` every frame
+but ``retrieve()`` (decode) only when a ring slot is free. Decoded frames land
+in preallocated slots and are published with a sequence number.
+
+Consumers call :meth:`CameraCapture.read_latest` and get a :class:`FrameLease`,
+a zero-copy view of the newest frame. The slot stays pinned until the lease is
+released, so processing needs no lock. The writer only decodes into slots that
+are neither the latest nor pinned. Two slots double-buffer the writer against
+the latest frame; the extra slots let consumers hold frames while they work.
+
+The login scanner, the attendance scanner and the enrollment window share one
+device through :func:`acquire_camera` and :func:`release_camera`. When the
+last holder lets go, the device stays open for ``CAMERA_RELEASE_GRACE``
+seconds, so moving from one screen to the next reuses the running capture
+instead of closing and reopening the webcam.
+"""
+
+import os
+import threading
+import time
+
+import cv2
+
+CAMERA_INDEX = int(os.environ.get('FRCAS_CAMERA_INDEX', '0'))
+CAMERA_WIDTH = int(os.environ.get('FRCAS_CAMERA_WIDTH', '640'))
+CAMERA_HEIGHT = int(os.environ.get('FRCAS_CAMERA_HEIGHT', '480'))
+CAMERA_FPS = int(os.environ.get('FRCAS_CAMERA_FPS', '30'))
+CAMERA_FOURCC = os.environ.get('FRCAS_CAMERA_FOURCC', 'MJPG')
+DEFAULT_RING_SLOTS = 4
+CAMERA_RELEASE_GRACE = float(os.environ.get('FRCAS_CAMERA_RELEASE_GRACE', '10'))
+READ_FAILURE_SLEEP_SECONDS = 0.05
+
+
+class FrameLease:
+    """A pinned, read-only view of one captured frame; call :meth:`release` when done."""
+
+    def __init__(self, capture, slot, seq, frame, timestamp):
+        self._capture = capture
+        self.slot = slot
+        self.seq = seq
+        self.frame = frame
+        self.timestamp = timestamp
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.frame = None
+            self._capture._unpin(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.release()
+
+
+class CameraCapture:
+    """Owns a capture device and publishes its newest decoded frame."""
+
+    def __init__(self, index=CAMERA_INDEX, width=CAMERA_WIDTH, height=CAMERA_HEIGHT, fps=CAMERA_FPS, fourcc=CAMERA_FOURCC, slots=DEFAULT_RING_SLOTS):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.cap = None
+        self.running = False
+        self._thread = None
+        self._condition = threading.Condition()
+        self._buffers = [None] * max(3, slots)
+        self._pins = [0] * len(self._buffers)
+        self._slot_seq = [0] * len(self._buffers)
+        self._slot_time = [0.0] * len(self._buffers)
+        self._latest = None
+        self._seq = 0
+        self.dropped_frames = 0
+
+    def _configure(self, cap):
+        if self.fourcc:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc[:4].ljust(4)))
+        if self.width and self.height:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            cap.set(cv2.CAP_PROP_FPS, self.fps)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def start(self):
+        """Open and configure the device and start the capture thread; returns False if it cannot be opened."""
+        if self.running:
+            return True
+        cap = cv2.VideoCapture(self.index)
+        if not cap or not cap.isOpened():
+            if cap:
+                cap.release()
+            return False
+        self._configure(cap)
+        self.cap = cap
+        self.running = True
+        self._thread = threading.Thread(target=self._capture_loop, name='camera-capture', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stop the capture thread and release the device."""
+        self.running = False
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+        self._thread = None
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            except Exception:
+                pass
+            self.cap = None
+        with self._condition:
+            self._latest = None
+            self._condition.notify_all()
+
+    def is_opened(self):
+        return self.running and self.cap is not None and self.cap.isOpened()
+
+    def _free_slot(self):
+        for slot in range(len(self._buffers)):
+            if slot != self._latest and self._pins[slot] == 0:
+                return slot
+        return None
+
+    def _capture_loop(self):
+        while self.running:
+            cap = self.cap
+            if cap is None or not cap.grab():
+                time.sleep(READ_FAILURE_SLEEP_SECONDS)
+                continue
+            with self._condition:
+                slot = self._free_slot()
+                if slot is not None:
+                    self._slot_seq[slot] = 0
+            if slot is None:
+                self.dropped_frames += 1
+                continue
+            ok, image = cap.retrieve(self._buffers[slot])
+            if not ok or image is None:
+                continue
+            with self._condition:
+                self._buffers[slot] = image
+                self._seq += 1
+                self._slot_seq[slot] = self._seq
+                self._slot_time[slot] = time.time()
+                self._latest = slot
+                self._condition.notify_all()
+
+    def _unpin(self, slot):
+        with self._condition:
+            if self._pins[slot] > 0:
+                self._pins[slot] -= 1
+
+    @property
+    def latest_seq(self):
+        return self._seq
+
+    def read_latest(self, after_seq=0, timeout=None):
+        """Lease the newest frame whose sequence number is greater than ``after_seq``.
+
+        Waits up to ``timeout`` seconds (forever when ``None``) and returns
+        ``None`` if no such frame arrives or the service stops.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self.running and (self._latest is None or self._slot_seq[self._latest] <= after_seq):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if self._latest is None or self._slot_seq[self._latest] <= after_seq:
+                return None
+            slot = self._latest
+            self._pins[slot] += 1
+            return FrameLease(self, slot, self._slot_seq[slot], self._buffers[slot], self._slot_time[slot])
+
+    def read_copy(self, timeout=1.0):
+        """Return a private copy of the newest frame, or ``None``; for one-off snapshots."""
+        lease = self.read_latest(timeout=timeout)
+        if lease is None:
+            return None
+        with lease:
+            return lease.frame.copy()
+
+
+_shared_camera = None
+_shared_holders = 0
+_shared_stop_timer = None
+_shared_lock = threading.Lock()
+
+
+def _stop_idle_camera():
+    global _shared_camera, _shared_stop_timer
+    with _shared_lock:
+        _shared_stop_timer = None
+        if _shared_holders or _shared_camera is None:
+            return
+        camera = _shared_camera
+        _shared_camera = None
+    camera.stop()
+
+
+def acquire_camera():
+    """Return the process-wide running capture, opening the device for the first holder; ``None`` if it cannot be opened."""
+    global _shared_camera, _shared_holders, _shared_stop_timer
+    with _shared_lock:
+        if _shared_stop_timer is not None:
+            _shared_stop_timer.cancel()
+            _shared_stop_timer = None
+        if _shared_camera is None:
+            _shared_camera = CameraCapture()
+        if not _shared_camera.running and not _shared_camera.start():
+            _shared_camera = None
+            return None
+        _shared_holders += 1
+        return _shared_camera
+
+
+def release_camera(grace=None):
+    """Drop one hold on the shared capture; the device closes ``grace`` seconds after the last holder leaves."""
+    global _shared_holders, _shared_stop_timer
+    grace = CAMERA_RELEASE_GRACE if grace is None else grace
+    with _shared_lock:
+        if _shared_holders <= 0:
+            return
+        _shared_holders -= 1
+        if _shared_holders or _shared_camera is None:
+            return
+        if grace > 0:
+            _shared_stop_timer = threading.Timer(grace, _stop_idle_camera)
+            _shared_stop_timer.daemon = True
+            _shared_stop_timer.start()
+            return
+    _stop_idle_camera()
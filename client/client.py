@@ -1,4 +1,5 @@
 import customtkinter as ctk
+import tkinter as tk
 from tkinter import messagebox
 import requests
 import warnings
@@ -10,27 +11,31 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 import threading
 import time
-import pickle
 import re
 import json
 from datetime import datetime, date, timedelta
-import cv2
-import numpy as np
-from PIL import Image, ImageTk
 from server import SERVER_URL, API_KEY
+from api_client import get_api_client
+from attendance_journal import KIND_INSTRUCTOR_CHECKOUT, STATE_REJECTED, get_journal_flusher
+from live_events import GalleryGenerationWatch, get_live_events
 from ui_utils import bring_window_to_front
-try:
-    from deepface import DeepFace
-    _DEEPFACE_IMPORT_ERROR = None
-except Exception as deepface_error:
-    DeepFace = None
-    _DEEPFACE_IMPORT_ERROR = deepface_error
+from face_cache_sync import apply_cache_delta, cache_is_current, download_cache, fetch_cache_meta, read_sync_state
+from face_gallery import FaceGallery, load_face_gallery, PERSON_TYPE_INSTRUCTOR, DEFAULT_MATCH_THRESHOLD, distance_to_confidence, normalize_embedding
+from face_detector import FaceDetector, face_cascade
+from face_pipeline import FACE_CROP_MARGIN
+from inference_worker import acquire_inference_worker, embedding_available, release_inference_worker
+from face_tracker import FaceTracker
+from camera_capture import acquire_camera, release_camera
+from preview_renderer import PreviewRenderer
+from latency_metrics import span as latency_span, start_metrics_reporter
+from recognition_scheduler import RecognitionScheduler
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
 CLIENT_INSTANCE_ID = os.environ.get('FRCAS_CLIENT_ID') or f"{socket.gethostname() or 'kiosk'}-{uuid.uuid4().hex}"
 HEADERS = {'X-API-Key': API_KEY}
-JSON_HEADERS = {**HEADERS, 'Content-Type': 'application/json'}
 FACE_ENCODINGS_CACHE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'cache', 'face_encodings.pkl'))
 FACE_ENCODINGS_ENDPOINT = f'{SERVER_URL}/api/face-encodings'
+LOGIN_REVERIFY_FRAMES = 3
+LOGIN_PREVIEW_SIZE = (840, 500)
 MPSU_LOGO_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'MPSU.png'))
 CLASS_STATE_CACHE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'cache', 'class_state.json'))
 WEEKDAY_CODES = ['M', 'T', 'W', 'Th', 'F', 'S', 'Su']
@@ -233,7 +238,7 @@ def fetch_available_rooms(force_refresh=False):
     if not force_refresh and cache_age < ROOM_CACHE_TTL_SECONDS:
         return _ROOM_OPTIONS_CACHE['rooms']
     try:
-        response = requests.get(f'{SERVER_URL}/api/rooms', headers=HEADERS, verify=False, timeout=10)
+        response = get_api_client().rooms()
         if response.status_code == 200:
             try:
                 data = response.json()
@@ -260,10 +265,30 @@ def fetch_available_rooms(force_refresh=False):
     _ROOM_OPTIONS_CACHE['timestamp'] = now
     return _ROOM_OPTIONS_CACHE['rooms']
 
+def _normalize_active_session(session):
+    """Return ``(class_id, entry)`` for a backend session payload, or ``None`` when it has no class."""
+    try:
+        class_id = int(session.get('class_id'))
+    except (TypeError, ValueError):
+        return None
+    session_id = session.get('class_session_id')
+    try:
+        session_id = int(session_id) if session_id is not None else None
+    except (TypeError, ValueError):
+        session_id = None
+    room_number = (session.get('room_number') or '').strip()
+    return (class_id, {'class_id': class_id, 'class_session_id': session_id, 'room_number': room_number or None, 'start_time': session.get('start_time'), 'class_code': session.get('class_code') or '', 'description': session.get('description') or '', 'instructor_id': session.get('instructor_id'), 'view_lock_owner': session.get('view_lock_owner')})
+
 def fetch_active_sessions():
-    """Ask the backend for currently running class sessions."""
+    """Return currently running class sessions, from the live event mirror when the stream is up."""
+    global live_sessions_primed, live_sessions_primed_at
+    stream = get_live_events()
+    with _LIVE_SESSIONS_LOCK:
+        if stream.connected and live_sessions_primed and time.monotonic() - live_sessions_primed_at < LIVE_REFRESH_INTERVAL_MS / 1000.0:
+            return {class_id: dict(entry) for class_id, entry in live_active_sessions.items()}
+        version = live_sessions_version
     try:
-        response = requests.get(f'{SERVER_URL}/api/sessions/active', headers=HEADERS, verify=False, timeout=10)
+        response = get_api_client().active_sessions()
     except requests.exceptions.RequestException:
         return None
     if response.status_code != 200:
@@ -275,26 +300,81 @@ def fetch_active_sessions():
     sessions = payload.get('sessions') or []
     normalized = {}
     for session in sessions:
-        class_id = session.get('class_id')
-        session_id = session.get('class_session_id')
-        try:
-            class_id = int(class_id)
-        except (TypeError, ValueError):
-            continue
-        try:
-            session_id = int(session_id) if session_id is not None else None
-        except (TypeError, ValueError):
-            session_id = None
-        room_number = (session.get('room_number') or '').strip()
-        normalized[class_id] = {'class_id': class_id, 'class_session_id': session_id, 'room_number': room_number or None, 'start_time': session.get('start_time'), 'class_code': session.get('class_code') or '', 'description': session.get('description') or '', 'instructor_id': session.get('instructor_id'), 'view_lock_owner': session.get('view_lock_owner')}
+        entry = _normalize_active_session(session)
+        if entry is not None:
+            normalized[entry[0]] = entry[1]
+    with _LIVE_SESSIONS_LOCK:
+        if stream.connected and version == live_sessions_version:
+            live_active_sessions.clear()
+            live_active_sessions.update({class_id: dict(entry) for class_id, entry in normalized.items()})
+            live_sessions_primed = True
+            live_sessions_primed_at = time.monotonic()
     return normalized
 
+def _apply_live_session_event(data):
+    """Patch the active session mirror from a ``session`` or ``view_lock`` event."""
+    if not live_sessions_primed:
+        return
+    class_payload = class_metadata_by_id.get(_coerce_int(data.get('class_id'))) or {}
+    merged = dict(data)
+    merged.setdefault('class_code', class_payload.get('class_code'))
+    merged.setdefault('description', class_payload.get('description'))
+    if not merged.get('room_number'):
+        merged['room_number'] = class_payload.get('room_number')
+    entry = _normalize_active_session(merged)
+    if entry is None:
+        return
+    class_id, normalized = entry
+    if data.get('active') and data.get('date') == datetime.now().date().isoformat():
+        live_active_sessions[class_id] = normalized
+        return
+    current = live_active_sessions.get(class_id)
+    if current is not None and current.get('class_session_id') == normalized.get('class_session_id'):
+        live_active_sessions.pop(class_id, None)
+
+def handle_live_event(event_type, data):
+    """Update local state from a backend event and refresh the class cards (runs on the stream thread)."""
+    global live_sessions_primed, live_sessions_version
+    if event_type == 'gallery':
+        return
+    with _LIVE_SESSIONS_LOCK:
+        live_sessions_version += 1
+        if event_type == 'connection' or (event_type == 'hello' and data.get('resync')):
+            live_sessions_primed = False
+            live_active_sessions.clear()
+        elif event_type in ('session', 'view_lock'):
+            _apply_live_session_event(data)
+        elif event_type != 'class':
+            return
+    parent = globals().get('root')
+    if parent is not None:
+        try:
+            parent.after(0, queue_live_refresh)
+        except Exception:
+            pass
+
+def queue_live_refresh():
+    """Coalesce a burst of events into one status refresh on the Tk loop."""
+    global live_refresh_job
+    parent = globals().get('root')
+    if parent is None or live_refresh_job is not None:
+        return
+
+    def _run_refresh():
+        global live_refresh_job
+        live_refresh_job = None
+        refresh_class_statuses()
+    try:
+        live_refresh_job = parent.after(LIVE_EVENT_DEBOUNCE_MS, _run_refresh)
+    except Exception:
+        live_refresh_job = None
+
 def _request_session_view_lock(session_id, locker_id, action, force=False):
     payload = {'locker_id': locker_id, 'action': action}
     if force:
         payload['force'] = True
     try:
-        response = requests.post(f'{SERVER_URL}/api/sessions/{session_id}/view-lock', headers=JSON_HEADERS, json=payload, verify=False, timeout=10)
+        response = get_api_client().view_lock(session_id, payload)
     except requests.exceptions.RequestException as exc:
         return (False, str(exc), None)
     if response.status_code == 200:
@@ -345,31 +425,7 @@ def release_remote_view_lock(class_id, session_id=None, force=False):
 
 def download_face_encoding_cache():
     """Download the shared face encoding cache from the backend server."""
-    cache_dir = os.path.dirname(FACE_ENCODINGS_CACHE)
-    if cache_dir:
-        os.makedirs(cache_dir, exist_ok=True)
-    temp_path = FACE_ENCODINGS_CACHE + '.tmp'
-    try:
-        response = requests.get(FACE_ENCODINGS_ENDPOINT, headers=HEADERS, verify=False, timeout=30, stream=True)
-    except requests.exceptions.RequestException:
-        return False
-    if response.status_code != 200:
-        return False
-    try:
-        with open(temp_path, 'wb') as temp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    temp_file.write(chunk)
-        os.replace(temp_path, FACE_ENCODINGS_CACHE)
-        return True
-    except OSError:
-        return False
-    finally:
-        if os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except OSError:
-                pass
+    return download_cache(SERVER_URL, HEADERS, FACE_ENCODINGS_CACHE)
 
 def parse_iso_datetime(value):
     if not value:
@@ -650,19 +706,23 @@ class InstructorLoginScanner:
     """Minimal facial recognition scanner used for instructor authentication."""
 
     def __init__(self, parent, on_success, on_closed=None):
-        if DeepFace is None:
-            raise RuntimeError(f'DeepFace library is unavailable: {_DEEPFACE_IMPORT_ERROR}')
+        if not embedding_available():
+            raise RuntimeError('Face embedding backend is unavailable')
         self.parent = parent
         self.on_success = on_success
         self.on_closed = on_closed
         self.running = True
-        self.current_frame = None
+        self.display_seq = 0
+        self.preview = PreviewRenderer()
+        self.preview_scheduled_at = None
         self.success_emitted = False
         self._closed = False
-        self.cap = None
-        self.instructor_embeddings = []
-        self.instructor_names = []
-        self.instructor_ids = []
+        self.camera = None
+        self.gallery = FaceGallery.empty()
+        self.gallery_generation = None
+        self.face_tracker = FaceTracker(reverify_every=LOGIN_REVERIFY_FRAMES)
+        self.scheduler = RecognitionScheduler()
+        self.inference = None
         self.window = ctk.CTkToplevel(parent)
         self.window.title('Instructor Facial Login')
         self.window.geometry('900x650')
@@ -673,30 +733,34 @@ class InstructorLoginScanner:
         bring_window_to_front(self.window)
         self._enter_fullscreen()
         self.window.bind('<Escape>', lambda _event=None: self.close())
-        self.video_label = ctk.CTkLabel(self.window, text='Initializing camera...', width=820, height=480, corner_radius=16, fg_color='#000000', anchor='center', justify='center', font=('Arial', 20, 'bold'), text_color='#ffffff')
-        self.video_label.pack(fill='both', expand=True, padx=20, pady=(20, 10))
+        video_frame = ctk.CTkFrame(self.window, width=820, height=480, corner_radius=16, fg_color='#000000')
+        video_frame.pack(fill='both', expand=True, padx=20, pady=(20, 10))
+        self.video_label = tk.Label(video_frame, text='Initializing camera...', bg='#000000', fg='#ffffff', font=('Arial', 20, 'bold'), bd=0, highlightthickness=0)
+        self.video_label.pack(expand=True, padx=12, pady=12)
         self.status_label = ctk.CTkLabel(self.window, text='Align your face with the camera', font=('Arial', 20), text_color=('#006400', '#90EE90'))
         self.status_label.pack(pady=(0, 10))
         self.cancel_button = ctk.CTkButton(self.window, text='Cancel Scan', font=('Arial', 18, 'bold'), width=220, height=55, fg_color=('#dc3545', '#c82333'), hover_color=('#a71d2a', '#7f151f'), command=self.close)
         self.cancel_button.pack(pady=(0, 20))
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_detector = FaceDetector(scale_factor=1.2)
         try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap or not self.cap.isOpened():
+            self.camera = acquire_camera()
+            if self.camera is None:
                 raise RuntimeError('Unable to access camera device for scanning.')
             cache_updated = download_face_encoding_cache()
             if not cache_updated and (not os.path.exists(FACE_ENCODINGS_CACHE)):
                 raise RuntimeError('Unable to download face encoding cache from the server.')
             self._load_embeddings()
-            if not self.instructor_embeddings:
+            if not self.gallery.count(PERSON_TYPE_INSTRUCTOR):
                 raise RuntimeError('No instructor face data found. Run the embedding extractor before using facial login.')
         except Exception:
             self.close(silent=True)
             raise
         self.last_cache_mtime = None
         self.update_check_interval = 5.0
+        self.gallery_watch = GalleryGenerationWatch(get_live_events())
         self._try_download_cache_on_startup()
         self._update_cache_mtime()
+        self.inference = acquire_inference_worker()
         self.update_frame()
         self.recognition_thread = threading.Thread(target=self._recognition_loop, daemon=True)
         self.recognition_thread.start()
@@ -727,23 +791,11 @@ class InstructorLoginScanner:
     def _try_download_cache_on_startup(self):
         """Try to download the latest cache file on startup if it doesn't exist or is outdated."""
         if not os.path.exists(FACE_ENCODINGS_CACHE):
-            if self._download_cache_file():
-                pass
+            self._download_cache_file()
             return
-        try:
-            response = requests.get(f'{SERVER_URL}/api/face-encodings/meta', headers=HEADERS, verify=False, timeout=3)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    server_mtime_str = data.get('mtime')
-                    if server_mtime_str:
-                        server_mtime = datetime.fromisoformat(server_mtime_str.replace('Z', '+00:00')).timestamp()
-                        local_mtime = os.path.getmtime(FACE_ENCODINGS_CACHE)
-                        if server_mtime > local_mtime:
-                            if self._download_cache_file():
-                                pass
-        except Exception as e:
-            pass
+        meta = fetch_cache_meta(SERVER_URL, HEADERS)
+        if meta is not None and (not cache_is_current(FACE_ENCODINGS_CACHE, meta)):
+            self._download_cache_file()
 
     def _update_cache_mtime(self):
         """Update the last known cache file modification time."""
@@ -756,57 +808,32 @@ class InstructorLoginScanner:
             self.last_cache_mtime = None
 
     def _check_for_updates_loop(self):
-        """Background thread that periodically checks for cache file updates."""
+        """Background thread that checks for cache updates, woken early by gallery events."""
         while self.running:
             try:
-                try:
-                    response = requests.get(f'{SERVER_URL}/api/face-encodings/meta', headers=HEADERS, verify=False, timeout=3)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('success'):
-                            server_mtime_str = data.get('mtime')
-                            if server_mtime_str:
-                                server_mtime = datetime.fromisoformat(server_mtime_str.replace('Z', '+00:00')).timestamp()
-                                if self.last_cache_mtime is None or server_mtime > self.last_cache_mtime:
-                                    self._reload_embeddings()
-                                    self.last_cache_mtime = server_mtime
-                except Exception as api_error:
-                    if os.path.exists(FACE_ENCODINGS_CACHE):
-                        try:
-                            current_mtime = os.path.getmtime(FACE_ENCODINGS_CACHE)
-                            if self.last_cache_mtime is None or current_mtime > self.last_cache_mtime:
-                                self._reload_embeddings()
-                                self.last_cache_mtime = current_mtime
-                        except Exception:
-                            pass
+                generation = self.gallery_watch.remote_generation(lambda: fetch_cache_meta(SERVER_URL, HEADERS))
+                if generation is not None and generation != self.gallery_generation:
+                    if not self._apply_gallery_delta():
+                        self._reload_embeddings()
+                elif os.path.exists(FACE_ENCODINGS_CACHE):
+                    current_mtime = os.path.getmtime(FACE_ENCODINGS_CACHE)
+                    if self.last_cache_mtime is None or current_mtime > self.last_cache_mtime:
+                        self._reload_embeddings()
             except Exception as e:
                 pass
-            time.sleep(self.update_check_interval)
+            self.gallery_watch.wait(self.update_check_interval)
 
     def _download_cache_file(self):
-        """Download the latest cache file from the server."""
-        cache_dir = os.path.dirname(FACE_ENCODINGS_CACHE)
-        if cache_dir:
-            os.makedirs(cache_dir, exist_ok=True)
-        temp_path = FACE_ENCODINGS_CACHE + '.tmp'
-        try:
-            response = requests.get(FACE_ENCODINGS_ENDPOINT, headers=HEADERS, verify=False, timeout=30, stream=True)
-            if response.status_code != 200:
-                return False
-            with open(temp_path, 'wb') as temp_file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        temp_file.write(chunk)
-            os.replace(temp_path, FACE_ENCODINGS_CACHE)
-            return True
-        except Exception as e:
+        """Download the latest cache file from the server unless it is unchanged."""
+        return download_cache(SERVER_URL, HEADERS, FACE_ENCODINGS_CACHE)
+
+    def _apply_gallery_delta(self):
+        """Patch the in-memory gallery from the server change journal instead of a full reload."""
+        result = apply_cache_delta(SERVER_URL, HEADERS, self.gallery, self.gallery_generation, cache_file=FACE_ENCODINGS_CACHE)
+        if result is None:
             return False
-        finally:
-            if os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+        self.gallery, self.gallery_generation = result
+        return True
 
     def _reload_embeddings(self):
         """Download and reload embeddings from cache file when update is detected."""
@@ -825,92 +852,103 @@ class InstructorLoginScanner:
         if not os.path.exists(FACE_ENCODINGS_CACHE):
             raise RuntimeError(f'Face encoding cache not found at {FACE_ENCODINGS_CACHE}.')
         try:
-            with open(FACE_ENCODINGS_CACHE, 'rb') as cache_file:
-                face_data = pickle.load(cache_file)
+            gallery = load_face_gallery(FACE_ENCODINGS_CACHE)
         except Exception as exc:
             raise RuntimeError(f'Failed to load face encodings: {exc}')
-        instructor_embeds = face_data.get('instructor_embeddings') or []
-        self.instructor_embeddings = [self._normalize_embedding(np.array(embedding)) for embedding in instructor_embeds]
-        self.instructor_names = face_data.get('instructor_names') or []
-        self.instructor_ids = face_data.get('instructor_ids') or []
+        self.gallery = gallery
+        self.gallery_generation = read_sync_state(FACE_ENCODINGS_CACHE).get('generation')
 
     @staticmethod
     def _normalize_embedding(embedding):
-        norm = np.linalg.norm(embedding)
-        return embedding / norm if norm > 0 else embedding
+        return normalize_embedding(embedding)
 
     def update_frame(self):
-        if not self.running or not self.cap:
+        if not self.running or not self.camera:
             return
-        ret, frame = self.cap.read()
-        if ret:
-            self.current_frame = frame
+        lease = self.camera.read_latest(after_seq=self.display_seq, timeout=0)
+        if lease is not None:
+            self.display_seq = lease.seq
             try:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame_rgb)
-                img.thumbnail((840, 500))
-                photo = ImageTk.PhotoImage(img)
-                self.video_label.configure(image=photo, text='')
-                self.video_label.image = photo
+                with lease:
+                    photo, created = self.preview.render(lease.frame, LOGIN_PREVIEW_SIZE, scheduled_at=self.preview_scheduled_at)
+                if created:
+                    self.video_label.configure(image=photo, text='')
+                    self.video_label.image = photo
             except Exception:
                 pass
         if self.running:
-            self.window.after(30, self.update_frame)
+            self.preview_scheduled_at = time.time() + self.preview.interval
+            self.window.after(self.preview.next_delay_ms(), self.update_frame)
 
     def _recognition_loop(self):
+        last_seq = 0
+        camera = self.camera
         while self.running:
-            frame = self.current_frame
-            if frame is None:
-                time.sleep(0.1)
+            lease = camera.read_latest(after_seq=last_seq, timeout=0.5)
+            if lease is None:
                 continue
-            if not self.face_cascade.empty():
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = self.face_cascade.detectMultiScale(gray, 1.2, 5)
-                if len(faces) == 0:
-                    self._update_status('No face detected. Please step closer.')
-                    time.sleep(0.2)
-                    continue
+            last_seq = lease.seq
+            frame = lease.frame
+            work_started = time.perf_counter()
+            idle = False
+            new_track = False
             try:
-                representations = DeepFace.represent(img_path=frame, model_name='Facenet512', detector_backend='opencv', enforce_detection=False)
-            except Exception:
-                time.sleep(0.4)
-                continue
-            if not representations:
-                time.sleep(0.3)
-                continue
-            recognized = False
-            for rep in representations:
-                embedding = self._normalize_embedding(np.array(rep['embedding']))
-                match = self._compare_embeddings(embedding)
-                if match:
-                    name, instructor_id, confidence = match
-                    recognized = True
-                    self.window.after(0, lambda i=instructor_id, n=name: self._handle_success(i, n))
-                    break
-            if not recognized:
-                self._update_status('Face not recognized. Please try again.')
-                time.sleep(0.4)
-            else:
-                return
+                if not face_cascade().empty():
+                    with latency_span('login.detect'):
+                        faces = self.face_detector.detect(frame)
+                    if len(faces) == 0:
+                        self._update_status('No face detected. Please step closer.')
+                        idle = True
+                        continue
+                    tracks = self.face_tracker.update(faces)
+                    new_track = any((track.first_seen == track.last_seen for track in tracks))
+                    pending = {track.box: track for track in tracks if self.face_tracker.needs_embedding(track)}
+                    if not pending:
+                        self._update_status('Face not recognized. Please try again.')
+                        continue
+                    if not self.inference.ready:
+                        self._update_status('Face model warming up, please wait...')
+                        idle = True
+                        continue
+                    boxes = sorted(pending, key=lambda box: box[2] * box[3], reverse=True)
+                    margin = FACE_CROP_MARGIN
+                else:
+                    pending = {}
+                    boxes = [(0, 0, frame.shape[1], frame.shape[0])]
+                    margin = 0.0
+                try:
+                    with latency_span('login.embed'):
+                        representations = self.inference.embed(frame, boxes, margin=margin)
+                except Exception:
+                    idle = True
+                    continue
+                if not representations:
+                    continue
+                recognized = False
+                for box, embedding in representations:
+                    with latency_span('login.match'):
+                        match = self._compare_embeddings(embedding)
+                    if box in pending:
+                        pending[box].remember(match)
+                    if match:
+                        name, instructor_id, confidence = match
+                        recognized = True
+                        self.window.after(0, lambda i=instructor_id, n=name: self._handle_success(i, n))
+                        break
+                if not recognized:
+                    self._update_status('Face not recognized. Please try again.')
+                else:
+                    return
+            finally:
+                frame = None
+                lease.release()
+                if self.running:
+                    self.scheduler.pause(time.perf_counter() - work_started, idle=idle, new_track=new_track, running=lambda: self.running)
 
     def _compare_embeddings(self, embedding):
-        best_idx = -1
-        min_distance = float('inf')
-        for idx, stored in enumerate(self.instructor_embeddings):
-            try:
-                distance = np.linalg.norm(embedding - stored)
-            except Exception:
-                continue
-            if distance < min_distance:
-                min_distance = distance
-                best_idx = idx
-        threshold = 0.6
-        if best_idx >= 0 and min_distance < threshold:
-            instructor_name = self.instructor_names[best_idx] if best_idx < len(self.instructor_names) else 'Instructor'
-            instructor_id = self.instructor_ids[best_idx] if best_idx < len(self.instructor_ids) else None
-            if instructor_id:
-                confidence = max(0.0, (1 - min_distance) * 100)
-                return (instructor_name, instructor_id, confidence)
+        best = self.gallery.best_match(embedding, threshold=DEFAULT_MATCH_THRESHOLD, person_type=PERSON_TYPE_INSTRUCTOR)
+        if best is not None and best.person_id:
+            return (best.name or 'Instructor', best.person_id, distance_to_confidence(best.distance))
         return None
 
     def _update_status(self, text):
@@ -936,11 +974,17 @@ class InstructorLoginScanner:
             return
         self._closed = True
         self.running = False
+        if getattr(self, 'gallery_watch', None) is not None:
+            self.gallery_watch.close()
         try:
-            if self.cap:
-                self.cap.release()
+            if self.camera:
+                self.camera = None
+                release_camera()
         except Exception:
             pass
+        if self.inference is not None:
+            self.inference = None
+            release_inference_worker()
         try:
             self.window.grab_release()
         except Exception:
@@ -959,7 +1003,15 @@ class InstructorLoginScanner:
 active_login_scanner = None
 pending_login_success_handler = None
 AUTO_REFRESH_INTERVAL_MS = 5000
+LIVE_REFRESH_INTERVAL_MS = int(os.environ.get('FRCAS_LIVE_REFRESH_MS', '60000'))
+LIVE_EVENT_DEBOUNCE_MS = 300
 SCANNER_SESSION_MONITOR_INTERVAL_MS = 4000
+live_active_sessions = {}
+live_sessions_primed = False
+live_sessions_primed_at = 0.0
+live_sessions_version = 0
+live_refresh_job = None
+_LIVE_SESSIONS_LOCK = threading.Lock()
 classes_auto_refresh_job = None
 ongoing_classes = set()
 class_rooms = {}
@@ -1238,14 +1290,15 @@ def cancel_classes_auto_refresh():
     classes_auto_refresh_job = None
 
 def schedule_classes_auto_refresh():
-    """Schedule the next automatic reload of today's classes."""
+    """Schedule the next automatic reload of today's classes; slow while the live event stream is up."""
     global classes_auto_refresh_job
     parent = globals().get('root')
     if parent is None or AUTO_REFRESH_INTERVAL_MS <= 0:
         return
     cancel_classes_auto_refresh()
+    interval = LIVE_REFRESH_INTERVAL_MS if get_live_events().connected else AUTO_REFRESH_INTERVAL_MS
     try:
-        classes_auto_refresh_job = parent.after(AUTO_REFRESH_INTERVAL_MS, refresh_class_statuses)
+        classes_auto_refresh_job = parent.after(interval, refresh_class_statuses)
     except Exception:
         classes_auto_refresh_job = None
 
@@ -1262,7 +1315,7 @@ def cancel_scanner_session_monitor():
     scanner_session_monitor_job = None
 
 def schedule_scanner_session_monitor(class_id, session_id):
-    """Poll the server to detect when another kiosk ends the class."""
+    """Watch for another kiosk ending the class; the check is local while the live event stream is up."""
     global scanner_session_monitor_job
     parent = globals().get('root')
     if parent is None or SCANNER_SESSION_MONITOR_INTERVAL_MS <= 0:
@@ -1414,7 +1467,7 @@ def refresh_class_statuses():
             schedule_classes_auto_refresh()
             return
     try:
-        response = requests.get(f'{SERVER_URL}/classes/api/list', headers=HEADERS, verify=False)
+        response = get_api_client().class_list()
         if response.status_code != 200:
             return
         raw_classes = response.json()
@@ -1483,7 +1536,7 @@ def show_today_classes():
     refresh_btn = ctk.CTkButton(header_row, text='↻ Refresh', font=('Arial', 18, 'bold'), width=160, height=48, fg_color=('#228B22', '#32CD32'), hover_color=('#006400', '#90EE90'), command=show_today_classes)
     refresh_btn.pack(side='right')
     try:
-        response = requests.get(f'{SERVER_URL}/classes/api/list', headers=HEADERS, verify=False)
+        response = get_api_client().class_list()
         if response.status_code != 200:
             error_label = ctk.CTkLabel(root, text=f'Failed to load classes: {response.status_code} - {response.text}', font=('Arial', 18))
             error_label.pack(pady=20)
@@ -1751,7 +1804,7 @@ def show_today_classes():
                     return None
                 payload = {'instructor_id': instructor_id_int, 'class_id': class_id, 'room_number': room_input, 'timestamp': datetime.now().astimezone().isoformat()}
                 try:
-                    response = requests.post(f'{SERVER_URL}/api/checkin/instructor', headers=JSON_HEADERS, json=payload, verify=False, timeout=15)
+                    response = get_api_client().instructor_checkin(payload)
                 except requests.exceptions.RequestException as exc:
                     messagebox.showerror('Check-In Failed', f'Unable to reach the server for instructor check-in.\n{exc}')
                     return None
@@ -2042,7 +2095,14 @@ def show_today_classes():
             schedule_classes_auto_refresh()
 
 def end_class_session(cls, auto=False):
-    """End a class session and mark absent students."""
+    """End a class session and mark absent students.
+
+    Returns True once the checkout was answered or saved in the attendance
+    journal. A saved checkout ends the class on this kiosk right away, so
+    the absent count is only known to the server; if the server later
+    rejects it, :func:`handle_journal_outcome` tells the operator and
+    reloads the class state.
+    """
     class_id = cls['id']
     class_code = cls['class_code']
     session_id = class_session_ids.get(class_id)
@@ -2055,7 +2115,7 @@ def end_class_session(cls, auto=False):
         instructor_id_override = instructor_binding.get('id') if instructor_binding else None
         instructor_id = instructor_id_override
         if instructor_id is None:
-            classes_response = requests.get(f'{SERVER_URL}/classes/api/list', headers=HEADERS, verify=False, timeout=10)
+            classes_response = get_api_client().class_list()
             if classes_response.status_code != 200:
                 messagebox.showerror('Error', f'Could not fetch class list: {classes_response.status_code}')
                 return False
@@ -2072,8 +2132,16 @@ def end_class_session(cls, auto=False):
         if session_id:
             checkout_data['class_session_id'] = session_id
         checkout_data['auto'] = bool(auto)
-        checkout_response = requests.post(f'{SERVER_URL}/api/checkout/instructor', json=checkout_data, headers=HEADERS, verify=False, timeout=10)
-        if checkout_response.status_code == 200:
+        _key, checkout_response = get_journal_flusher().submit(KIND_INSTRUCTOR_CHECKOUT, checkout_data)
+        if checkout_response is None:
+            if not auto or class_id not in _timeout_message_shown:
+                try:
+                    messagebox.showinfo('Class Ended Offline', f'The server could not be reached. Ending {class_code} was saved on this kiosk and will be sent automatically when the server is reachable.')
+                    if auto:
+                        _timeout_message_shown.add(class_id)
+                except Exception:
+                    pass
+        elif checkout_response.status_code == 200:
             result = checkout_response.json()
             absent_count = result.get('total_absent_students_marked', 0)
             title = 'Class Timed Out' if auto else 'Class Ended'
@@ -2104,6 +2172,30 @@ def end_class_session(cls, auto=False):
         return False
     return True
 
+def _show_rejected_checkout(class_id, error):
+    """Tell the operator a queued checkout was refused and reload the class state from the server."""
+    clear_class_recent_end_marker(class_id)
+    persist_class_state()
+    class_label = (class_metadata_by_id.get(class_id) or {}).get('class_code') or f'class {class_id}'
+    try:
+        messagebox.showerror('Class End Rejected', f'The server rejected ending {class_label} that was saved while offline:\n{error or "No reason given"}\n\nThe class may still be open on the server. End it again once the problem is fixed.')
+    except Exception:
+        pass
+    queue_live_refresh()
+
+def handle_journal_outcome(entry, state, status_code, error):
+    """Report a queued checkout the server rejected (runs on the journal flusher thread)."""
+    if entry.get('kind') != KIND_INSTRUCTOR_CHECKOUT or state != STATE_REJECTED:
+        return
+    class_id = _coerce_int(entry.get('payload', {}).get('class_id'))
+    parent = globals().get('root')
+    if class_id is None or parent is None:
+        return
+    try:
+        parent.after(0, lambda: _show_rejected_checkout(class_id, error))
+    except Exception:
+        pass
+
 def end_class_session_and_reset(cls, auto=False):
     """End a class session, mark absences, and refresh the kiosk state."""
     result = end_class_session(cls, auto=auto)
@@ -2120,26 +2212,34 @@ def end_class_session_and_reset(cls, auto=False):
         mark_class_recently_ended(cls['id'])
     persist_class_state()
     return result
-root = ctk.CTk()
-root.title('Facial Recognition Class Attendance System')
-root.configure(fg_color=('#f0f8f0', '#1e4a1e'))
-try:
-    root.update_idletasks()
-except Exception:
-    pass
-try:
-    screen_width = root.winfo_screenwidth()
-    screen_height = root.winfo_screenheight()
-except Exception:
-    screen_width = screen_height = None
-if screen_width and screen_height:
+if __name__ == '__main__':
+    root = ctk.CTk()
+    root.title('Facial Recognition Class Attendance System')
+    root.configure(fg_color=('#f0f8f0', '#1e4a1e'))
+    try:
+        root.update_idletasks()
+    except Exception:
+        pass
+    try:
+        screen_width = root.winfo_screenwidth()
+        screen_height = root.winfo_screenheight()
+    except Exception:
+        screen_width = screen_height = None
+    if screen_width and screen_height:
+        try:
+            root.geometry(f'{screen_width}x{screen_height}+0+0')
+        except Exception:
+            pass
     try:
-        root.geometry(f'{screen_width}x{screen_height}+0+0')
+        root.overrideredirect(True)
     except Exception:
         pass
-try:
-    root.overrideredirect(True)
-except Exception:
-    pass
-show_today_classes()
-root.mainloop()
+    acquire_inference_worker()
+    start_metrics_reporter(SERVER_URL, HEADERS)
+    get_journal_flusher().subscribe(handle_journal_outcome)
+    get_live_events().subscribe(handle_live_event)
+    show_today_classes()
+    try:
+        root.mainloop()
+    finally:
+        release_inference_worker()
@@ -0,0 +1,357 @@
+"""Pluggable face embedding backends shared by the server and the kiosks.
+
+This file is kept identical in ``client/embedding_backend.py`` and
+``backend/utils/embedding_backend.py``: kiosks ship the ``client`` folder on
+its own and the server must import without it.
+``backend/tests/test_embedding_backend.py`` fails when the copies diverge.
+
+Every backend turns BGR face images into Facenet512 embeddings. It exposes
+the same two calls:
+
+* :meth:`EmbeddingBackend.embed_crops` embeds a batch of face crops that were
+  already located (the kiosks crop Haar boxes) in one forward pass.
+* :meth:`EmbeddingBackend.embed_image` embeds the face in a whole photo,
+  detecting it first. The server uses it for uploaded images and extraction.
+
+Backends that run a local model find the face with the same Haar cascade as
+the kiosks and cut it out with :func:`crop_face`, which the kiosks also use,
+so gallery and live crops get the same eye alignment. They only accept the
+detectors in ``LOCAL_DETECTORS`` and raise for any other.
+
+Backends are picked by name from the registry. ``FRCAS_EMBEDDING_BACKEND``
+selects the default, ``deepface`` unless set. ``opencv-dnn`` and
+``onnxruntime`` run a local Facenet512 model file from
+``FRCAS_EMBEDDING_MODEL``, exported with NHWC input (set
+``FRCAS_EMBEDDING_LAYOUT=nchw`` otherwise). CPU threading is explicit:
+``FRCAS_EMBEDDING_THREADS`` sets intra-op threads (all cores by default) and
+``FRCAS_EMBEDDING_INTER_THREADS`` sets inter-op threads (default 1).
+Embeddings are returned as raw float32 vectors, exactly as
+``DeepFace.represent`` produced them. Callers normalize when they need to.
+"""
+
+import importlib.util
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_BACKEND = os.environ.get('FRCAS_EMBEDDING_BACKEND', 'deepface').strip().lower() or 'deepface'
+MODEL_PATH = os.environ.get('FRCAS_EMBEDDING_MODEL', '')
+MODEL_LAYOUT = os.environ.get('FRCAS_EMBEDDING_LAYOUT', 'nhwc').strip().lower()
+
+
+def _threads_from_env(name, default):
+    """Positive thread count from ``name``; unset, zero or malformed values give ``default``."""
+    try:
+        value = int(os.environ.get(name, '') or 0)
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+INTRA_OP_THREADS = _threads_from_env('FRCAS_EMBEDDING_THREADS', os.cpu_count() or 1)
+INTER_OP_THREADS = _threads_from_env('FRCAS_EMBEDDING_INTER_THREADS', 1)
+FACE_MODEL_NAME = 'Facenet512'
+FACE_INPUT_SIZE = 160
+EMBEDDING_DIM = 512
+DEFAULT_DETECTOR = 'opencv'
+LOCAL_DETECTORS = ('opencv', 'skip')
+FACE_CROP_MARGIN = 0.2
+MAX_ALIGN_ANGLE = 25.0
+_thread_state = threading.local()
+
+
+class EmbeddingBackendError(RuntimeError):
+    """Raised when a backend is unknown, not installed or cannot load its model."""
+
+
+def _eye_cascade():
+    """Return this thread's eye cascade; OpenCV classifiers are not shared across threads."""
+    import cv2
+    cascade = getattr(_thread_state, 'eye_cascade', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+        _thread_state.eye_cascade = cascade
+    return cascade
+
+
+def _face_cascade():
+    import cv2
+    cascade = getattr(_thread_state, 'face_cascade', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        _thread_state.face_cascade = cascade
+    return cascade
+
+
+def expand_box(box, frame_shape, margin=FACE_CROP_MARGIN):
+    """Grow ``(x, y, w, h)`` by ``margin`` on each side into a square shifted inside the frame."""
+    x, y, w, h = (int(value) for value in box)
+    frame_h, frame_w = frame_shape[:2]
+    side = min(int(round(max(w, h) * (1 + 2 * margin))), frame_w, frame_h)
+    left = min(max(0, x + w // 2 - side // 2), frame_w - side)
+    top = min(max(0, y + h // 2 - side // 2), frame_h - side)
+    right = min(frame_w, left + side)
+    bottom = min(frame_h, top + side)
+    return (left, top, right - left, bottom - top)
+
+
+def _roll_angle(face_gray):
+    """Estimate head roll from the two largest eyes in the upper half of the face."""
+    cascade = _eye_cascade()
+    if cascade.empty():
+        return 0.0
+    upper = face_gray[:face_gray.shape[0] // 2]
+    min_eye = max(8, face_gray.shape[1] // 10)
+    eyes = cascade.detectMultiScale(upper, 1.1, 5, minSize=(min_eye, min_eye))
+    if len(eyes) < 2:
+        return 0.0
+    eyes = sorted(eyes, key=lambda eye: eye[2] * eye[3], reverse=True)[:2]
+    (x1, y1, w1, h1), (x2, y2, w2, h2) = sorted(eyes, key=lambda eye: eye[0])
+    angle = float(np.degrees(np.arctan2(y2 + h2 / 2.0 - (y1 + h1 / 2.0), x2 + w2 / 2.0 - (x1 + w1 / 2.0))))
+    return angle if abs(angle) <= MAX_ALIGN_ANGLE else 0.0
+
+
+def crop_face(frame, box, margin=FACE_CROP_MARGIN, align=True):
+    """Return the BGR face crop for ``box`` resized to the model input, or ``None``.
+
+    The margin gives the roll correction real pixels to rotate in; the result
+    is cut back to the detected box.
+    """
+    import cv2
+    left, top, width, height = expand_box(box, frame.shape, margin)
+    if width <= 1 or height <= 1:
+        return None
+    crop = frame[top:top + height, left:left + width]
+    x, y, w, h = (int(value) for value in box)
+    inner_x = min(max(0, x - left), width - 1)
+    inner_y = min(max(0, y - top), height - 1)
+    inner_w = max(1, min(w, width - inner_x))
+    inner_h = max(1, min(h, height - inner_y))
+    if align:
+        angle = _roll_angle(cv2.cvtColor(crop[inner_y:inner_y + inner_h, inner_x:inner_x + inner_w], cv2.COLOR_BGR2GRAY))
+        if angle:
+            rotation = cv2.getRotationMatrix2D((inner_x + inner_w / 2.0, inner_y + inner_h / 2.0), angle, 1.0)
+            crop = cv2.warpAffine(crop, rotation, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    face = crop[inner_y:inner_y + inner_h, inner_x:inner_x + inner_w]
+    return cv2.resize(face, (FACE_INPUT_SIZE, FACE_INPUT_SIZE), interpolation=cv2.INTER_AREA)
+
+
+class EmbeddingBackend:
+    """Interface of an embedding backend; subclasses implement the ``_embed_*`` hooks."""
+
+    name = None
+    required_modules = ()
+    detectors = None
+
+    def __init__(self, intra_threads=INTRA_OP_THREADS, inter_threads=INTER_OP_THREADS):
+        self.intra_threads = intra_threads
+        self.inter_threads = inter_threads
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def available(cls):
+        """True when the backend's libraries (and model file, if any) are present, checked without importing them."""
+        return all((importlib.util.find_spec(module) is not None for module in cls.required_modules))
+
+    def load(self):
+        """Load the model once; safe to call from several threads."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        pass
+
+    def supports_detector(self, detector):
+        """True when :meth:`embed_image` accepts ``detector``; ``detectors = None`` accepts any."""
+        return self.detectors is None or detector in self.detectors
+
+    def embed_crops(self, crops):
+        """Embed BGR face crops in one batch; returns a float32 vector or ``None`` per crop, in order."""
+        crops = list(crops)
+        if not crops:
+            return []
+        self.load()
+        return self._embed_crops(crops)
+
+    def embed_image(self, image, detector=DEFAULT_DETECTOR, enforce_detection=False, align=True):
+        """Embed the first face found in a photo (path or BGR array); ``None`` when there is none.
+
+        With ``enforce_detection`` a photo without a detectable face raises instead.
+        A ``detector`` the backend does not support raises :class:`EmbeddingBackendError`.
+        """
+        if not self.supports_detector(detector):
+            raise EmbeddingBackendError(f"Embedding backend '{self.name}' cannot use the '{detector}' detector; choose one of {', '.join(self.detectors)}")
+        self.load()
+        return self._embed_image(image, detector, enforce_detection, align)
+
+    def _embed_crops(self, crops):
+        raise NotImplementedError
+
+    def _embed_image(self, image, detector, enforce_detection, align):
+        raise NotImplementedError
+
+
+class DeepFaceBackend(EmbeddingBackend):
+    """Facenet512 through DeepFace/TensorFlow."""
+
+    name = 'deepface'
+    required_modules = ('deepface',)
+
+    def _load(self):
+        try:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(self.intra_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(self.inter_threads)
+        except (ImportError, RuntimeError, AttributeError):
+            pass
+        from deepface import DeepFace
+        self._deepface = DeepFace
+
+    @staticmethod
+    def _first_embedding(representations):
+        if not representations:
+            return None
+        first = representations[0]
+        embedding = first['embedding'] if isinstance(first, dict) and 'embedding' in first else first
+        return np.asarray(embedding, dtype=np.float32)
+
+    def _embed_crops(self, crops):
+        if len(crops) == 1:
+            representations = self._deepface.represent(img_path=crops[0], model_name=FACE_MODEL_NAME, detector_backend='skip', enforce_detection=False)
+            return [self._first_embedding(representations)]
+        representations = self._deepface.represent(img_path=crops, model_name=FACE_MODEL_NAME, detector_backend='skip', enforce_detection=False)
+        return [self._first_embedding(faces) for faces in representations]
+
+    def _embed_image(self, image, detector, enforce_detection, align):
+        representations = self._deepface.represent(img_path=image, model_name=FACE_MODEL_NAME, detector_backend=detector, enforce_detection=enforce_detection, align=align)
+        return self._first_embedding(representations)
+
+
+class LocalModelBackend(EmbeddingBackend):
+    """Shared preprocessing and Haar face finding for backends that run a local model file."""
+
+    detectors = LOCAL_DETECTORS
+
+    def __init__(self, model_path=MODEL_PATH, layout=MODEL_LAYOUT, **kwargs):
+        super().__init__(**kwargs)
+        self.model_path = model_path
+        self.layout = layout
+
+    @classmethod
+    def available(cls):
+        return super().available() and bool(MODEL_PATH) and os.path.exists(MODEL_PATH)
+
+    def _blob(self, crops):
+        """Stack crops into the float32 RGB/255 batch Facenet512 expects."""
+        import cv2
+        batch = np.stack([cv2.cvtColor(cv2.resize(crop, (FACE_INPUT_SIZE, FACE_INPUT_SIZE), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB) for crop in crops]).astype(np.float32) / 255.0
+        return batch if self.layout == 'nhwc' else np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+    def _embed_crops(self, crops):
+        outputs = np.asarray(self._run(self._blob(crops)), dtype=np.float32).reshape(len(crops), -1)
+        return [row for row in outputs]
+
+    def _embed_image(self, image, detector, enforce_detection, align):
+        import cv2
+        frame = cv2.imread(image) if isinstance(image, str) else image
+        if frame is None:
+            raise EmbeddingBackendError(f'Cannot read image: {image}')
+        if detector == 'skip':
+            return self._embed_crops([frame])[0]
+        cascade = _face_cascade()
+        faces = cascade.detectMultiScale(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1.1, 5) if not cascade.empty() else []
+        if len(faces) == 0:
+            if enforce_detection:
+                raise EmbeddingBackendError('Face could not be detected in the image')
+            return self._embed_crops([frame])[0]
+        crop = crop_face(frame, max(faces, key=lambda box: box[2] * box[3]), align=align)
+        return self._embed_crops([crop])[0] if crop is not None else None
+
+
+class OpenCVDNNBackend(LocalModelBackend):
+    """Local ONNX/TF Facenet512 model run by ``cv2.dnn``."""
+
+    name = 'opencv-dnn'
+    required_modules = ('cv2',)
+
+    def _load(self):
+        import cv2
+        cv2.setNumThreads(self.intra_threads)
+        self._net = cv2.dnn.readNet(self.model_path)
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def _run(self, batch):
+        self._net.setInput(batch)
+        return self._net.forward()
+
+
+class ONNXRuntimeBackend(LocalModelBackend):
+    """Local ONNX Facenet512 model run by onnxruntime on the CPU provider."""
+
+    name = 'onnxruntime'
+    required_modules = ('onnxruntime',)
+
+    def _load(self):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_threads
+        options.inter_op_num_threads = self.inter_threads
+        self._session = onnxruntime.InferenceSession(self.model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+
+    def _run(self, batch):
+        return self._session.run(None, {self._input_name: batch})[0]
+
+
+_REGISTRY = {}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_backend(backend_class):
+    """Make ``backend_class`` selectable by its ``name``."""
+    _REGISTRY[backend_class.name] = backend_class
+    return backend_class
+
+
+for _backend_class in (DeepFaceBackend, OpenCVDNNBackend, ONNXRuntimeBackend):
+    register_backend(_backend_class)
+
+
+def backend_names():
+    return list(_REGISTRY)
+
+
+def available_backends():
+    """Names of the registered backends that can run on this machine."""
+    return [name for name, backend_class in _REGISTRY.items() if backend_class.available()]
+
+
+def backend_available(name=None):
+    backend_class = _REGISTRY.get(name or DEFAULT_BACKEND)
+    return backend_class is not None and backend_class.available()
+
+
+def get_backend(name=None):
+    """Return the shared instance of backend ``name`` (default ``FRCAS_EMBEDDING_BACKEND``)."""
+    name = name or DEFAULT_BACKEND
+    backend_class = _REGISTRY.get(name)
+    if backend_class is None:
+        raise EmbeddingBackendError(f"Unknown embedding backend '{name}'; choose one of {', '.join(_REGISTRY)}")
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            if not backend_class.available():
+                raise EmbeddingBackendError(f"Embedding backend '{name}' is not available on this machine")
+            backend = _instances[name] = backend_class()
+        return backend
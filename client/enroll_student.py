@@ -9,20 +9,21 @@ import pickle
 import tempfile
 from datetime import datetime
 from io import BytesIO
+import tkinter as tk
 from tkinter import messagebox
 from urllib.parse import urljoin
 import customtkinter as ctk
-import requests
 import cv2
 import numpy as np
 from PIL import Image
-try:
-    from deepface import DeepFace
-    DEEPFACE_AVAILABLE = True
-except ImportError:
-    DeepFace = None
-    DEEPFACE_AVAILABLE = False
 from ui_utils import bring_window_to_front
+from api_client import get_api_client
+from embedding_backend import get_backend
+from inference_worker import embedding_available
+from camera_capture import acquire_camera, release_camera
+from preview_renderer import PreviewRenderer
+EMBEDDING_AVAILABLE = embedding_available()
+from face_cache_sync import cache_is_current, download_cache, fetch_cache_meta
 from server import SERVER_URL as DEFAULT_SERVER_URL, API_KEY as DEFAULT_API_KEY
 try:
     from urllib3.exceptions import InsecureRequestWarning
@@ -34,6 +35,7 @@ STUDENT_TABLE_COLUMNS = [('Name', 3), ('Student ID', 2), ('Year Level', 1), ('Fa
 REALTIME_REFRESH_MS = 9000
 POSE_DISPLACEMENT_PX = 45
 ROLL_SEARCH_ANGLES = (-24, -16, -8, 8, 16, 24)
+CAPTURE_PREVIEW_SIZE = (680, 480)
 
 class FaceCaptureWindow(ctk.CTkToplevel):
     """Camera-driven dialog for capturing and uploading a student's face."""
@@ -46,12 +48,15 @@ class FaceCaptureWindow(ctk.CTkToplevel):
         self.api_key = api_key
         self.headers = {'X-API-Key': self.api_key}
         self.on_success = on_success
-        self.cap = None
+        self.camera = None
+        self.preview_seq = 0
         self.running = False
         self.current_frame = None
         self.captured_frame = None
         self.saved_photos = 0
         self.preview_image = None
+        self.preview = PreviewRenderer(max_fps=25.0)
+        self.preview_scheduled_at = None
         self.status_var = ctk.StringVar(value='Click Start to begin automatic face capture every 3 seconds.')
         self.face_detector = self._load_face_detector()
         self.roll_search_angles = ROLL_SEARCH_ANGLES
@@ -113,8 +118,11 @@ class FaceCaptureWindow(ctk.CTkToplevel):
         container.pack(fill='both', expand=True, padx=20, pady=20)
         name_label = ctk.CTkLabel(container, text=f"Student: {self.student.get('name') or self.student_id}", font=('Arial', 20, 'bold'), text_color=('#006400', '#90EE90'))
         name_label.pack(pady=(10, 20))
-        self.preview_label = ctk.CTkLabel(container, text='Initializing camera...', width=680, height=480, fg_color=('#000000', '#000000'), corner_radius=12)
-        self.preview_label.pack(pady=10)
+        preview_frame = ctk.CTkFrame(container, width=680, height=480, fg_color=('#000000', '#000000'), corner_radius=12)
+        preview_frame.pack(pady=10)
+        preview_frame.pack_propagate(False)
+        self.preview_label = tk.Label(preview_frame, text='Initializing camera...', bg='#000000', fg='#ffffff', bd=0, highlightthickness=0)
+        self.preview_label.pack(expand=True)
         liveness_panel = ctk.CTkFrame(container, fg_color='transparent')
         liveness_panel.pack(pady=(4, 14))
         self.liveness_label = ctk.CTkLabel(liveness_panel, textvariable=self.liveness_var, font=('Arial', 16, 'bold'), text_color=('#0b5f0b', '#b6f7b6'))
@@ -137,8 +145,8 @@ class FaceCaptureWindow(ctk.CTkToplevel):
 
     def _start_camera(self):
         try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
+            self.camera = acquire_camera()
+            if self.camera is None:
                 raise RuntimeError('Unable to access camera device')
             self.running = True
             self._update_preview()
@@ -153,10 +161,12 @@ class FaceCaptureWindow(ctk.CTkToplevel):
         if self.captured_frame is not None:
             frame_to_show = self.captured_frame
         else:
-            ret, frame = self.cap.read()
-            if ret:
-                self.current_frame = frame
-                frame_to_show = frame
+            lease = self.camera.read_latest(after_seq=self.preview_seq, timeout=0)
+            if lease is not None:
+                with lease:
+                    self.preview_seq = lease.seq
+                    self.current_frame = lease.frame.copy()
+                frame_to_show = self.current_frame
         if frame_to_show is not None:
             if self.captured_frame is None:
                 if self.auto_capture_enabled and (not self.is_paused) and (self.countdown_timer is None):
@@ -165,12 +175,12 @@ class FaceCaptureWindow(ctk.CTkToplevel):
                         if self._detect_face_center(frame_to_show) is not None:
                             self._start_countdown()
                             self.last_capture_time = current_time
-            rgb_frame = cv2.cvtColor(frame_to_show, cv2.COLOR_BGR2RGB)
-            image = Image.fromarray(rgb_frame)
-            image = image.resize((680, 480))
-            self.preview_image = ctk.CTkImage(light_image=image, dark_image=image, size=(680, 480))
-            self.preview_label.configure(image=self.preview_image, text='')
-        self.after(40, self._update_preview)
+            photo, created = self.preview.render(frame_to_show, CAPTURE_PREVIEW_SIZE, scheduled_at=self.preview_scheduled_at)
+            if created:
+                self.preview_image = photo
+                self.preview_label.configure(image=photo, text='')
+        self.preview_scheduled_at = time.time() + self.preview.interval
+        self.after(self.preview.next_delay_ms(), self._update_preview)
 
     def _capture_frame(self):
         if self.current_frame is None:
@@ -186,7 +196,7 @@ class FaceCaptureWindow(ctk.CTkToplevel):
 
     def _toggle_start_pause(self):
         """Toggle between start and pause."""
-        if not self.running or self.cap is None:
+        if not self.running or self.camera is None:
             self.status_var.set('Camera not ready. Please wait...')
             return
         if not self.auto_capture_enabled or self.is_paused:
@@ -268,13 +278,12 @@ class FaceCaptureWindow(ctk.CTkToplevel):
         threading.Thread(target=self._upload_image, args=(image_bytes, pose_label), daemon=True).start()
 
     def _upload_image(self, image_bytes, pose_label=None):
-        url = f'{self.server_url}/students/api/upload-image'
         files = {'image': ('capture.jpg', image_bytes, 'image/jpeg')}
         data = {'student_id': self.student_id}
         if pose_label:
             data['pose_label'] = pose_label
         try:
-            response = requests.post(url, headers=self.headers, data=data, files=files, verify=False, timeout=30)
+            response = get_api_client(self.server_url).upload_student_image(data, files, headers=self.headers)
             payload = response.json()
             if response.status_code >= 400 or not payload.get('success', True):
                 raise RuntimeError(payload.get('message', 'Failed to upload image'))
@@ -331,12 +340,9 @@ class FaceCaptureWindow(ctk.CTkToplevel):
     def _final_close(self):
         """Final cleanup and window close."""
         self.running = False
-        if self.cap:
-            try:
-                self.cap.release()
-            except Exception:
-                pass
-            self.cap = None
+        if self.camera:
+            self.camera = None
+            release_camera()
         if self.auto_capture_timer:
             try:
                 self.after_cancel(self.auto_capture_timer)
@@ -348,9 +354,10 @@ class FaceCaptureWindow(ctk.CTkToplevel):
 
     def _extract_and_save_embeddings(self):
         """Extract embeddings from uploaded images and append to pickle file."""
-        if not DEEPFACE_AVAILABLE:
+        if not EMBEDDING_AVAILABLE:
             return
         try:
+            backend = get_backend()
             cache_file = self._get_cache_file_path()
             cache_dir = os.path.dirname(cache_file)
             if cache_dir:
@@ -379,16 +386,15 @@ class FaceCaptureWindow(ctk.CTkToplevel):
                         full_url = image_path
                     else:
                         full_url = f"{server_url.rstrip('/')}/{image_path.lstrip('/')}"
-                    response = requests.get(full_url, headers=self.headers, verify=False, timeout=10)
+                    response = get_api_client(server_url).fetch_image(full_url, headers=self.headers, timeout=10)
                     if response.status_code != 200:
                         continue
                     with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
                         tmp_file.write(response.content)
                         tmp_path = tmp_file.name
                     try:
-                        embedding_result = DeepFace.represent(img_path=tmp_path, model_name='Facenet512', detector_backend='opencv', enforce_detection=False, align=True)
-                        if embedding_result and len(embedding_result) > 0:
-                            embedding = np.array(embedding_result[0]['embedding'], dtype=np.float32)
+                        embedding = backend.embed_image(tmp_path, detector='opencv', enforce_detection=False, align=True)
+                        if embedding is not None:
                             face_data['student_embeddings'].append(embedding.tolist())
                             face_data['student_names'].append(student_name)
                             face_data['student_ids'].append(self.student_id)
@@ -679,9 +685,9 @@ class StudentPhotoViewer(ctk.CTkToplevel):
             self.status_var.set('Loading saved photos...')
 
         def task():
-            url = f'{self.server_url}/students/api/images/{self.student_id}'
+            client = get_api_client(self.server_url)
             try:
-                response = requests.get(url, headers=self.headers, verify=False, timeout=20)
+                response = client.student_images(self.student_id, headers=self.headers)
                 payload = response.json()
                 if response.status_code >= 400 or not payload.get('success', True):
                     raise RuntimeError(payload.get('message', 'Failed to load photos'))
@@ -691,7 +697,7 @@ class StudentPhotoViewer(ctk.CTkToplevel):
                     path = self._resolve_image_url(image_meta.get('path'))
                     if not path:
                         continue
-                    resp = requests.get(path, verify=False, timeout=20)
+                    resp = client.fetch_image(path)
                     resp.raise_for_status()
                     img = Image.open(BytesIO(resp.content))
                     img.thumbnail((260, 260))
@@ -836,11 +842,8 @@ class ManualStudentEnrollDialog(ctk.CTkToplevel):
         threading.Thread(target=self._submit_async, args=(payload,), daemon=True).start()
 
     def _submit_async(self, payload):
-        url = f'{self.server_url}/students/api/create'
-        headers = dict(self.headers)
-        headers['Content-Type'] = 'application/json'
         try:
-            response = requests.post(url, headers=headers, json=payload, verify=False, timeout=20)
+            response = get_api_client(self.server_url).create_student(payload, headers=self.headers)
             data = response.json()
             if response.status_code >= 400 or not data.get('success'):
                 raise RuntimeError(data.get('message', 'Failed to enroll student'))
@@ -1071,7 +1074,7 @@ class StudentRegistrationWindow(ctk.CTkToplevel):
 
         def task():
             try:
-                response = requests.get(f'{self.server_url}/api/instructors/{self.instructor_id}/classes', headers=self.headers, verify=False, timeout=15)
+                response = get_api_client(self.server_url).instructor_classes(self.instructor_id, headers=self.headers)
                 classes_data = self._parse_api_response(response, 'Failed to load classes')
                 classes = classes_data.get('classes', [])
             except Exception as exc:
@@ -1119,7 +1122,7 @@ class StudentRegistrationWindow(ctk.CTkToplevel):
 
         def task():
             try:
-                response = requests.get(f'{self.server_url}/api/instructors/{self.instructor_id}/students', headers=self.headers, verify=False, timeout=20)
+                response = get_api_client(self.server_url).instructor_students(self.instructor_id, headers=self.headers)
                 data = self._parse_api_response(response, 'Failed to load students')
                 students = data.get('students', [])
             except Exception as exc:
@@ -1135,7 +1138,7 @@ class StudentRegistrationWindow(ctk.CTkToplevel):
 
         def task():
             try:
-                response = requests.get(f'{self.server_url}/api/instructors/{self.instructor_id}/classes/{class_id}/students', headers=self.headers, verify=False, timeout=20)
+                response = get_api_client(self.server_url).instructor_class_students(self.instructor_id, class_id, headers=self.headers)
                 data = self._parse_api_response(response, 'Failed to load class students')
                 students = data.get('students', [])
             except Exception as exc:
@@ -1268,50 +1271,15 @@ class StudentRegistrationWindow(ctk.CTkToplevel):
         """Try to download the latest cache file on startup if it doesn't exist or is outdated."""
         cache_file = self._get_cache_file_path()
         if not os.path.exists(cache_file):
-            if self._download_cache_file():
-                pass
+            self._download_cache_file()
             return
-        try:
-            response = requests.get(f'{self.server_url}/api/face-encodings/meta', headers=self.headers, verify=False, timeout=3)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    server_mtime_str = data.get('mtime')
-                    if server_mtime_str:
-                        from datetime import datetime
-                        server_mtime = datetime.fromisoformat(server_mtime_str.replace('Z', '+00:00')).timestamp()
-                        local_mtime = os.path.getmtime(cache_file)
-                        if server_mtime > local_mtime:
-                            if self._download_cache_file():
-                                pass
-        except Exception as e:
-            pass
+        meta = fetch_cache_meta(self.server_url, self.headers)
+        if meta is not None and (not cache_is_current(cache_file, meta)):
+            self._download_cache_file()
 
     def _download_cache_file(self):
-        """Download the latest cache file from the server."""
-        cache_file = self._get_cache_file_path()
-        cache_dir = os.path.dirname(cache_file)
-        if cache_dir:
-            os.makedirs(cache_dir, exist_ok=True)
-        temp_path = cache_file + '.tmp'
-        try:
-            response = requests.get(f'{self.server_url}/api/face-encodings', headers=self.headers, verify=False, timeout=30, stream=True)
-            if response.status_code != 200:
-                return False
-            with open(temp_path, 'wb') as temp_file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        temp_file.write(chunk)
-            os.replace(temp_path, cache_file)
-            return True
-        except Exception as e:
-            return False
-        finally:
-            if os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+        """Download the latest cache file from the server unless it is unchanged."""
+        return download_cache(self.server_url, self.headers, self._get_cache_file_path())
 
     def _start_cache_update_checking(self):
         """Start the background thread to check for cache file updates."""
@@ -1326,28 +1294,14 @@ class StudentRegistrationWindow(ctk.CTkToplevel):
         """Background thread that periodically checks for cache file updates."""
         while self._running and self.winfo_exists():
             try:
-                try:
-                    response = requests.get(f'{self.server_url}/api/face-encodings/meta', headers=self.headers, verify=False, timeout=3)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('success'):
-                            server_mtime_str = data.get('mtime')
-                            if server_mtime_str:
-                                from datetime import datetime
-                                server_mtime = datetime.fromisoformat(server_mtime_str.replace('Z', '+00:00')).timestamp()
-                                if self.last_cache_mtime is None or server_mtime > self.last_cache_mtime:
-                                    self._reload_cache()
-                                    self.last_cache_mtime = server_mtime
-                except Exception as api_error:
-                    cache_file = self._get_cache_file_path()
-                    if os.path.exists(cache_file):
-                        try:
-                            current_mtime = os.path.getmtime(cache_file)
-                            if self.last_cache_mtime is None or current_mtime > self.last_cache_mtime:
-                                self._reload_cache()
-                                self.last_cache_mtime = current_mtime
-                        except Exception:
-                            pass
+                cache_file = self._get_cache_file_path()
+                meta = fetch_cache_meta(self.server_url, self.headers)
+                if meta is not None and (not cache_is_current(cache_file, meta)):
+                    self._reload_cache()
+                elif os.path.exists(cache_file):
+                    current_mtime = os.path.getmtime(cache_file)
+                    if self.last_cache_mtime is None or current_mtime > self.last_cache_mtime:
+                        self._reload_cache()
             except Exception as e:
                 pass
             time.sleep(self.update_check_interval)
@@ -0,0 +1,224 @@
+"""Conditional download helpers for the shared face encoding cache.
+
+The server describes its cache at ``/api/face-encodings/meta`` (content hash,
+generation, size, entry count). The hash of the copy we last downloaded is
+kept in ``cache_metadata.json`` beside the cache so polls can compare
+fingerprints and downloads can send ``If-None-Match``. Scanners that hold a
+gallery in memory can instead patch it from ``/api/face-encodings/delta``;
+the patched gallery and its index are written back beside the cache so a
+restart starts from the new generation.
+After each full download the matching IVF index, if the server built one, is
+fetched from ``/api/face-encodings/index``. Requests go through the shared
+:mod:`api_client` session so polls reuse its keep-alive connections.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import requests
+
+from api_client import get_api_client
+from face_gallery import gallery_path_for, index_path_for
+
+SYNC_STATE_FILENAME = 'cache_metadata.json'
+INDEX_FILENAME = 'face_gallery.ivf'
+
+
+def _sync_state_path(cache_file):
+    return os.path.join(os.path.dirname(os.path.abspath(cache_file)), SYNC_STATE_FILENAME)
+
+
+def read_sync_state(cache_file):
+    """Return the recorded ``data_hash``/``generation`` of the local cache."""
+    try:
+        with open(_sync_state_path(cache_file), 'r', encoding='utf-8') as handle:
+            state = json.load(handle)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def write_sync_state(cache_file, data_hash, generation=None):
+    """Record which server version the local cache file holds."""
+    state = read_sync_state(cache_file)
+    state.update({'data_hash': data_hash, 'generation': generation, 'last_update': datetime.now().isoformat()})
+    path = _sync_state_path(cache_file)
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump(state, handle)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def fetch_cache_meta(server_url, headers, timeout=3):
+    """Fetch ``/api/face-encodings/meta``; returns the payload or ``None``."""
+    try:
+        response = get_api_client(server_url).face_cache_meta(headers=headers, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    return data if data.get('success') else None
+
+
+def fetch_cache_delta(server_url, headers, since, timeout=10):
+    """Fetch the gallery changes after generation ``since``.
+
+    Returns the delta payload, ``{'full_sync_required': True}`` when the
+    server's journal no longer covers ``since``, or ``None`` on failure.
+    """
+    try:
+        response = get_api_client(server_url).face_cache_delta(since, headers=headers, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return None
+    if response.status_code == 410:
+        return {'full_sync_required': True}
+    if response.status_code != 200:
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    return data if data.get('success') else None
+
+
+def persist_gallery(cache_file, gallery, data_hash, generation):
+    """Write a delta-patched gallery and its index to disk and record the generation they hold.
+
+    Returns False when the files could not be replaced, e.g. while another
+    scanner still has the old gallery memory-mapped on Windows.
+    """
+    index_file = index_path_for(cache_file)
+    try:
+        gallery.save(gallery_path_for(cache_file))
+        if gallery.index is not None:
+            gallery.index.save(index_file, gallery.labels_crc)
+        elif os.path.exists(index_file):
+            os.remove(index_file)
+    except OSError:
+        return False
+    write_sync_state(cache_file, data_hash, generation)
+    return True
+
+
+def apply_cache_delta(server_url, headers, gallery, since, cache_file=None):
+    """Apply the server delta after ``since`` to ``gallery``.
+
+    Returns ``(new_gallery, generation)``, or ``None`` when the caller must
+    fall back to a full download. With ``cache_file`` the new gallery is also
+    persisted with :func:`persist_gallery`.
+    """
+    if since is None:
+        return None
+    delta = fetch_cache_delta(server_url, headers, since)
+    if not delta or delta.get('full_sync_required'):
+        return None
+    try:
+        gallery = gallery.apply_delta(delta.get('upserts') or [], delta.get('removed') or [])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if cache_file is not None:
+        persist_gallery(cache_file, gallery, delta.get('hash'), delta.get('generation'))
+    return (gallery, delta.get('generation'))
+
+
+def cache_is_current(cache_file, meta):
+    """Return True when the local cache already matches the server's ``meta``."""
+    if not os.path.exists(cache_file):
+        return False
+    server_hash = meta.get('hash')
+    if server_hash:
+        return read_sync_state(cache_file).get('data_hash') == server_hash
+    server_mtime_str = meta.get('mtime')
+    if not server_mtime_str:
+        return True
+    try:
+        server_mtime = datetime.fromisoformat(server_mtime_str.replace('Z', '+00:00')).timestamp()
+        return server_mtime <= os.path.getmtime(cache_file)
+    except (OSError, ValueError):
+        return False
+
+
+def download_cache(server_url, headers, cache_file, timeout=30):
+    """Download the cache unless the server reports it unchanged.
+
+    Returns True only when a new file was written; a 304 or any failure
+    returns False and leaves the local copy untouched.
+    """
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    request_headers = {key: value for key, value in headers.items() if key.lower() != 'content-type'}
+    known_hash = read_sync_state(cache_file).get('data_hash')
+    if known_hash and os.path.exists(cache_file):
+        request_headers['If-None-Match'] = f'"{known_hash}"'
+    temp_path = cache_file + '.tmp'
+    try:
+        with get_api_client(server_url).face_cache_download(headers=request_headers, timeout=timeout) as response:
+            generation = response.headers.get('X-Face-Cache-Generation')
+            generation = int(generation) if generation and generation.isdigit() else None
+            if response.status_code == 304:
+                if generation is not None:
+                    write_sync_state(cache_file, known_hash, generation)
+                return False
+            if response.status_code != 200:
+                return False
+            with open(temp_path, 'wb') as temp_file:
+                for chunk in response.iter_content(chunk_size=65536):
+                    if chunk:
+                        temp_file.write(chunk)
+        os.replace(temp_path, cache_file)
+        etag = (response.headers.get('ETag') or '').strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        write_sync_state(cache_file, etag.strip('"') or None, generation)
+        download_cache_index(server_url, headers, cache_file, timeout=timeout)
+        return True
+    except (requests.exceptions.RequestException, OSError):
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def download_cache_index(server_url, headers, cache_file, timeout=30):
+    """Fetch the IVF index that matches the freshly downloaded cache.
+
+    A 404 means the server gallery is small enough for exact matching, so any
+    local index is removed. Returns True when an index file was written.
+    """
+    index_file = os.path.join(os.path.dirname(os.path.abspath(cache_file)), INDEX_FILENAME)
+    request_headers = {key: value for key, value in headers.items() if key.lower() != 'content-type'}
+    temp_path = index_file + '.tmp'
+    try:
+        with get_api_client(server_url).face_cache_index(headers=request_headers, timeout=timeout) as response:
+            if response.status_code == 404:
+                if os.path.exists(index_file):
+                    os.remove(index_file)
+                return False
+            if response.status_code != 200:
+                return False
+            with open(temp_path, 'wb') as temp_file:
+                for chunk in response.iter_content(chunk_size=65536):
+                    if chunk:
+                        temp_file.write(chunk)
+        os.replace(temp_path, index_file)
+        return True
+    except (requests.exceptions.RequestException, OSError):
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
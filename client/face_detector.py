@@ -0,0 +1,96 @@
+"""Haar face detection on a downscaled frame, reported in full-resolution boxes.
+
+Running ``detectMultiScale`` over the whole camera frame was the scanners'
+main per-frame cost whenever nothing was being embedded. :class:`FaceDetector`
+instead detects on a grayscale copy about ``FRCAS_DETECT_WIDTH`` pixels wide.
+It limits the search to face sizes that can occur at the kiosk, then scales
+the boxes back so crops for embedding come from the full-resolution frame.
+
+The face size limits are derived from how far people stand from the camera:
+``FRCAS_KIOSK_MIN_DISTANCE`` and ``FRCAS_KIOSK_MAX_DISTANCE`` in metres,
+and the camera's horizontal field of view, ``FRCAS_CAMERA_HFOV`` in degrees.
+When the farthest face would be smaller than the cascade's 24 pixel window,
+the detector downscales less so those faces are still found.
+"""
+
+import math
+import os
+import threading
+
+import cv2
+
+DETECT_WIDTH = int(os.environ.get('FRCAS_DETECT_WIDTH', '320'))
+KIOSK_MIN_DISTANCE = float(os.environ.get('FRCAS_KIOSK_MIN_DISTANCE', '0.3'))
+KIOSK_MAX_DISTANCE = float(os.environ.get('FRCAS_KIOSK_MAX_DISTANCE', '2.0'))
+CAMERA_HFOV = float(os.environ.get('FRCAS_CAMERA_HFOV', '60'))
+FACE_WIDTH_METRES = 0.16
+CASCADE_WINDOW = 24
+SIZE_SLACK = 1.25
+DEFAULT_SCALE_FACTOR = 1.3
+DEFAULT_MIN_NEIGHBORS = 5
+_thread_state = threading.local()
+
+
+def face_cascade():
+    """Return this thread's frontal face cascade, loaded on first use."""
+    cascade = getattr(_thread_state, 'face_cascade', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        _thread_state.face_cascade = cascade
+    return cascade
+
+
+def face_width_pixels(frame_width, distance, hfov=CAMERA_HFOV):
+    """Expected face width in pixels for a person ``distance`` metres away."""
+    visible_width = 2.0 * max(distance, 0.05) * math.tan(math.radians(hfov) / 2.0)
+    return frame_width * FACE_WIDTH_METRES / visible_width
+
+
+class FaceDetector:
+    """Frontal face detection constrained to the face sizes expected at the kiosk."""
+
+    def __init__(self, detect_width=DETECT_WIDTH, min_distance=KIOSK_MIN_DISTANCE, max_distance=KIOSK_MAX_DISTANCE, hfov=CAMERA_HFOV, scale_factor=DEFAULT_SCALE_FACTOR, min_neighbors=DEFAULT_MIN_NEIGHBORS):
+        self.detect_width = detect_width
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.hfov = hfov
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self._geometry = {}
+
+    def size_limits(self, frame_width):
+        """``(min, max)`` face side in full-resolution pixels for a frame ``frame_width`` wide."""
+        smallest = face_width_pixels(frame_width, self.max_distance, self.hfov) / SIZE_SLACK
+        largest = face_width_pixels(frame_width, self.min_distance, self.hfov) * SIZE_SLACK
+        return (max(1.0, smallest), max(smallest + 1.0, largest))
+
+    def _plan(self, frame_width, frame_height):
+        """Downscale factor and detection-space size limits for a frame shape, cached per shape."""
+        key = (frame_width, frame_height)
+        plan = self._geometry.get(key)
+        if plan is None:
+            smallest, largest = self.size_limits(frame_width)
+            scale = min(1.0, self.detect_width / float(frame_width)) if self.detect_width > 0 else 1.0
+            scale = min(1.0, max(scale, CASCADE_WINDOW / smallest))
+            min_side = max(CASCADE_WINDOW, int(smallest * scale))
+            max_side = max(min_side + 1, min(int(math.ceil(largest * scale)), int(frame_height * scale)))
+            plan = self._geometry[key] = (scale, (min_side, min_side), (max_side, max_side))
+        return plan
+
+    def detect(self, frame):
+        """Face boxes of BGR ``frame`` as full-resolution ``(x, y, w, h)`` tuples."""
+        cascade = face_cascade()
+        if cascade.empty():
+            return []
+        frame_height, frame_width = frame.shape[:2]
+        scale, min_size, max_size = self._plan(frame_width, frame_height)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, int(round(frame_width * scale))), max(1, int(round(frame_height * scale)))), interpolation=cv2.INTER_AREA)
+        faces = cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors, minSize=min_size, maxSize=max_size)
+        boxes = []
+        for x, y, w, h in faces:
+            left = min(frame_width - 1, int(round(x / scale)))
+            top = min(frame_height - 1, int(round(y / scale)))
+            boxes.append((left, top, min(frame_width - left, int(round(w / scale))), min(frame_height - top, int(round(h / scale)))))
+        return boxes
@@ -0,0 +1,426 @@
+"""In-memory face gallery with vectorized nearest-neighbour matching.
+
+Galleries are persisted as ``face_gallery.bin`` beside the legacy
+``face_encodings.pkl``. The layout matches ``backend/utils/face_gallery_format.py``:
+a 64-byte header, a pre-normalized float32 matrix and a JSON label table of
+``[id, name, type_code]`` rows. The matrix is opened with ``np.memmap`` so
+kiosks share the page cache instead of unpickling Python lists.
+
+Large galleries also ship ``face_gallery.ivf`` (see
+``backend/utils/face_gallery_index.py``): coarse centroids plus the gallery
+rows grouped per centroid. Matching then scans only the ``nprobe`` closest
+lists and re-ranks them exactly. ``FRCAS_FACE_INDEX_NPROBE`` trades recall
+for speed; ``0`` disables the index.
+"""
+
+import json
+import os
+import pickle
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+PERSON_TYPE_STUDENT = 'Student'
+PERSON_TYPE_INSTRUCTOR = 'Instructor'
+DEFAULT_MATCH_THRESHOLD = 0.6
+
+GALLERY_MAGIC = b'FRGALLRY'
+GALLERY_VERSION = 1
+GALLERY_FILENAME = 'face_gallery.bin'
+GALLERY_HEADER = struct.Struct('<8sHHIIQQQ')
+GALLERY_HEADER_SIZE = 64
+GALLERY_FLAG_NORMALIZED = 1
+PERSON_TYPE_CODES = {PERSON_TYPE_STUDENT: 0, PERSON_TYPE_INSTRUCTOR: 1}
+
+INDEX_MAGIC = b'FRGINDEX'
+INDEX_VERSION = 1
+INDEX_FILENAME = 'face_gallery.ivf'
+INDEX_HEADER = struct.Struct('<8sHHIIIIQQQ')
+INDEX_HEADER_SIZE = 64
+
+
+def _nprobe_from_env(default=8):
+    """``FRCAS_FACE_INDEX_NPROBE`` as an int, ``0`` turning the index off; a bad value falls back to ``default``."""
+    try:
+        value = int(os.environ.get('FRCAS_FACE_INDEX_NPROBE', default))
+    except (TypeError, ValueError):
+        return default
+    return value if value >= 0 else default
+
+
+DEFAULT_NPROBE = _nprobe_from_env()
+
+GalleryMatch = namedtuple('GalleryMatch', ['person_id', 'name', 'person_type', 'distance'])
+
+
+def normalize_embedding(embedding):
+    """Return the embedding as float32 scaled to unit length."""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def distance_to_confidence(distance):
+    """Convert a Euclidean distance between unit vectors into a 0-100 confidence."""
+    return max(0.0, (1 - float(distance)) * 100)
+
+
+def _json_label(value):
+    """Serialize numpy scalars in the label table as plain Python values."""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class IVFIndex:
+    """Coarse-quantizer index over the rows of a :class:`FaceGallery`.
+
+    ``order[offsets[c]:offsets[c + 1]]`` lists the gallery rows assigned to
+    centroid ``c``.
+    """
+
+    def __init__(self, centroids, offsets, order, nprobe=DEFAULT_NPROBE):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.order = np.asarray(order)
+        self.nprobe = nprobe
+
+    @classmethod
+    def open(cls, path, rows, labels_crc, nprobe=DEFAULT_NPROBE):
+        """Memory-map an index file; returns ``None`` when it was built for a different gallery."""
+        with open(path, 'rb') as handle:
+            header = handle.read(INDEX_HEADER_SIZE)
+        if len(header) < INDEX_HEADER_SIZE:
+            return None
+        magic, version, _flags, nlist, dim, index_rows, index_crc, centroids_offset, offsets_offset, order_offset = INDEX_HEADER.unpack_from(header)
+        if magic != INDEX_MAGIC or version > INDEX_VERSION or index_rows != rows or index_crc != labels_crc:
+            return None
+        centroids = np.memmap(path, dtype='<f4', mode='r', offset=centroids_offset, shape=(nlist, dim))
+        offsets = np.memmap(path, dtype='<i8', mode='r', offset=offsets_offset, shape=(nlist + 1,))
+        order = np.memmap(path, dtype='<i4', mode='r', offset=order_offset, shape=(rows,))
+        return cls(centroids, offsets, order, nprobe=nprobe)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def candidates(self, query, nprobe=None):
+        """Return the gallery rows in the ``nprobe`` lists closest to ``query``."""
+        nprobe = min(self.nprobe if nprobe is None else nprobe, self.nlist)
+        scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes]).astype(np.intp)
+
+    def remap(self, keep, new_rows):
+        """Return an index for a gallery made of rows ``keep`` followed by ``new_rows``.
+
+        Kept rows stay in their lists; appended rows join their nearest centroid.
+        """
+        assignments = np.empty(len(self.order), dtype=np.int32)
+        assignments[self.order] = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))
+        lists = assignments[np.asarray(keep, dtype=np.intp)]
+        if len(new_rows):
+            lists = np.concatenate([lists, np.argmax(np.asarray(new_rows, dtype=np.float32) @ self.centroids.T, axis=1).astype(np.int32)])
+        order = np.argsort(lists, kind='stable').astype(np.int32)
+        offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=self.nlist), out=offsets[1:])
+        return IVFIndex(np.array(self.centroids), offsets, order, nprobe=self.nprobe)
+
+    def save(self, path, labels_crc):
+        """Write the index in the server's file format for the gallery whose labels hash to ``labels_crc``."""
+        centroids = np.ascontiguousarray(self.centroids, dtype='<f4')
+        offsets = np.ascontiguousarray(self.offsets, dtype='<i8')
+        order = np.ascontiguousarray(self.order, dtype='<i4')
+        centroids_offset = INDEX_HEADER_SIZE
+        offsets_offset = centroids_offset + centroids.nbytes
+        order_offset = offsets_offset + offsets.nbytes
+        header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, self.nlist, centroids.shape[1], len(order), labels_crc, centroids_offset, offsets_offset, order_offset)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(header.ljust(INDEX_HEADER_SIZE, b'\0'))
+            handle.write(centroids.tobytes())
+            handle.write(offsets.tobytes())
+            handle.write(order.tobytes())
+        os.replace(temp_path, path)
+
+
+class FaceGallery:
+    """Students and instructors stacked into one contiguous float32 matrix.
+
+    Row ``i`` of ``matrix`` belongs to ``ids[i]`` / ``names[i]`` / ``types[i]``.
+    Rows are stored L2-normalized so a single matrix-vector product gives the
+    distances to every enrolled face. An optional :class:`IVFIndex` narrows
+    untyped searches to a short list before the exact re-rank.
+    """
+
+    def __init__(self, matrix=None, ids=None, names=None, types=None, index=None, labels_crc=None):
+        if matrix is None or len(matrix) == 0:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.ids = np.asarray(ids if ids is not None else [], dtype=object)
+        self.names = np.asarray(names if names is not None else [], dtype=object)
+        self.types = np.asarray(types if types is not None else [], dtype=object)
+        if not len(self.ids) == len(self.names) == len(self.types) == len(self.matrix):
+            raise ValueError('Gallery matrix and label arrays must have the same length')
+        self._sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix) if len(self.matrix) else np.zeros(0, dtype=np.float32)
+        self._subsets = {}
+        self.index = index
+        self.labels_crc = labels_crc
+
+    @classmethod
+    def empty(cls):
+        return cls()
+
+    @classmethod
+    def from_face_data(cls, face_data):
+        """Build a gallery from the legacy ``face_encodings.pkl`` dictionary."""
+        vectors = []
+        ids = []
+        names = []
+        types = []
+        for prefix, person_type in (('student', PERSON_TYPE_STUDENT), ('instructor', PERSON_TYPE_INSTRUCTOR)):
+            embeddings = face_data.get(f'{prefix}_embeddings') or []
+            entry_names = face_data.get(f'{prefix}_names') or []
+            entry_ids = face_data.get(f'{prefix}_ids') or []
+            count = min(len(embeddings), len(entry_names), len(entry_ids))
+            for index in range(count):
+                vectors.append(normalize_embedding(embeddings[index]))
+                ids.append(entry_ids[index])
+                names.append(entry_names[index])
+                types.append(person_type)
+        if not vectors:
+            return cls.empty()
+        dimensions = {vector.shape[0] for vector in vectors}
+        if len(dimensions) != 1:
+            raise ValueError(f'Inconsistent embedding sizes in gallery: {sorted(dimensions)}')
+        return cls(np.vstack(vectors), ids, names, types)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a binary gallery written by :meth:`save` or the backend extractor."""
+        with open(path, 'rb') as handle:
+            header = handle.read(GALLERY_HEADER_SIZE)
+            if len(header) < GALLERY_HEADER_SIZE:
+                raise ValueError(f'Truncated gallery header in {path}')
+            magic, version, flags, count, dim, matrix_offset, labels_offset, labels_length = GALLERY_HEADER.unpack_from(header)
+            if magic != GALLERY_MAGIC:
+                raise ValueError(f'{path} is not a face gallery file')
+            if version > GALLERY_VERSION:
+                raise ValueError(f'Unsupported gallery version {version} in {path}')
+            handle.seek(labels_offset)
+            label_bytes = handle.read(labels_length)
+        labels = json.loads(label_bytes.decode('utf-8')) if labels_length else []
+        labels_crc = zlib.crc32(label_bytes)
+        if len(labels) != count:
+            raise ValueError(f'Gallery label table does not match matrix rows in {path}')
+        if not count:
+            return cls.empty()
+        matrix = np.memmap(path, dtype='<f4', mode='r', offset=matrix_offset, shape=(count, dim))
+        type_names = {code: name for name, code in PERSON_TYPE_CODES.items()}
+        ids = [row[0] for row in labels]
+        names = [row[1] for row in labels]
+        types = [type_names.get(row[2], PERSON_TYPE_STUDENT) for row in labels]
+        return cls(matrix, ids, names, types, labels_crc=labels_crc)
+
+    def save(self, path):
+        """Write the gallery in the binary format, replacing ``path`` atomically."""
+        matrix = np.ascontiguousarray(self.matrix, dtype='<f4') if len(self) else np.zeros((0, 0), dtype='<f4')
+        labels = [[self.ids[i], self.names[i], PERSON_TYPE_CODES.get(self.types[i], 0)] for i in range(len(self))]
+        label_bytes = json.dumps(labels, ensure_ascii=False, separators=(',', ':'), default=_json_label).encode('utf-8')
+        labels_offset = GALLERY_HEADER_SIZE + matrix.nbytes
+        header = GALLERY_HEADER.pack(GALLERY_MAGIC, GALLERY_VERSION, GALLERY_FLAG_NORMALIZED, len(self), self.dimension, GALLERY_HEADER_SIZE, labels_offset, len(label_bytes))
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(header.ljust(GALLERY_HEADER_SIZE, b'\0'))
+            handle.write(matrix.tobytes())
+            handle.write(label_bytes)
+        os.replace(temp_path, path)
+        self.labels_crc = zlib.crc32(label_bytes)
+
+    def apply_delta(self, upserts, removed):
+        """Return a new gallery with a server delta applied.
+
+        Every row of a person listed in ``upserts`` or ``removed`` is dropped,
+        then the upserted rows are appended. The current gallery is left
+        untouched so recognition threads can keep using it until the swap.
+        """
+        touched = {(str(item['person_type']), str(item['person_id'])) for item in list(upserts) + list(removed)}
+        keep = [index for index in range(len(self)) if (str(self.types[index]), str(self.ids[index])) not in touched]
+        vectors = [self.matrix[keep]] if keep else []
+        ids = [self.ids[index] for index in keep]
+        names = [self.names[index] for index in keep]
+        types = [self.types[index] for index in keep]
+        appended = []
+        for item in upserts:
+            for embedding in item.get('embeddings') or []:
+                appended.append(normalize_embedding(embedding))
+                ids.append(item['person_id'])
+                names.append(item.get('name'))
+                types.append(item['person_type'])
+        if appended:
+            vectors.append(np.vstack(appended))
+        if not ids:
+            return FaceGallery.empty()
+        matrix = np.vstack(vectors)
+        index = self.index.remap(keep, appended) if self.index is not None else None
+        return FaceGallery(matrix, ids, names, types, index=index)
+
+    def subset(self, keys):
+        """Return a new gallery holding only rows whose ``(person_type, str(person_id))`` is in ``keys``."""
+        keys = {(str(person_type), str(person_id)) for person_type, person_id in keys}
+        rows = [index for index in range(len(self)) if (str(self.types[index]), str(self.ids[index])) in keys]
+        if not rows:
+            return FaceGallery.empty()
+        return FaceGallery(self.matrix[rows], self.ids[rows], self.names[rows], self.types[rows])
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def count(self, person_type=None):
+        """Number of gallery rows, optionally restricted to one person type."""
+        if person_type is None:
+            return len(self)
+        return int(np.count_nonzero(self.types == person_type))
+
+    def distances(self, embedding, person_type=None, exact=False):
+        """Return ``(row_indices, distances)`` from ``embedding`` to the gallery rows.
+
+        Untyped searches go through the IVF index when one is attached, its
+        ``nprobe`` is non-zero and ``exact`` is not set; only the short list
+        of candidate rows is returned then.
+        """
+        if not len(self):
+            return (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32))
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        if query.shape[0] != self.dimension:
+            raise ValueError(f'Embedding has {query.shape[0]} dimensions, gallery expects {self.dimension}')
+        rows = None
+        if person_type is None and self.index is not None and self.index.nprobe > 0 and (not exact):
+            rows = self.index.candidates(query)
+        if rows is not None and len(rows):
+            matrix = self.matrix[rows]
+            sq_norms = self._sq_norms[rows]
+        elif person_type is None:
+            rows = np.arange(len(self))
+            matrix = self.matrix
+            sq_norms = self._sq_norms
+        else:
+            rows, matrix, sq_norms = self._subset(person_type)
+        squared = sq_norms - 2.0 * (matrix @ query) + float(query @ query)
+        np.maximum(squared, 0.0, out=squared)
+        return (rows, np.sqrt(squared))
+
+    def _subset(self, person_type):
+        subset = self._subsets.get(person_type)
+        if subset is None:
+            rows = np.flatnonzero(self.types == person_type)
+            subset = (rows, np.ascontiguousarray(self.matrix[rows]), self._sq_norms[rows])
+            self._subsets[person_type] = subset
+        return subset
+
+    def match(self, embedding, k=1, person_type=None, exact=False):
+        """Return up to ``k`` nearest candidates as :class:`GalleryMatch`, closest first."""
+        rows, distances = self.distances(embedding, person_type, exact=exact)
+        if not len(rows) or k <= 0:
+            return []
+        k = min(k, len(rows))
+        if k < len(rows):
+            nearest = np.argpartition(distances, k - 1)[:k]
+            nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        else:
+            nearest = np.argsort(distances, kind='stable')
+        return [GalleryMatch(self.ids[rows[i]], self.names[rows[i]], self.types[rows[i]], float(distances[i])) for i in nearest]
+
+    def best_match(self, embedding, threshold=DEFAULT_MATCH_THRESHOLD, person_type=None, exact=False):
+        """Return the closest candidate when it falls under ``threshold``, else ``None``."""
+        candidates = self.match(embedding, k=1, person_type=person_type, exact=exact)
+        if candidates and candidates[0].distance < threshold:
+            return candidates[0]
+        return None
+
+    def best_matches(self, embeddings, threshold=DEFAULT_MATCH_THRESHOLD, person_type=None):
+        """Batched :meth:`best_match`: one ``GalleryMatch`` or ``None`` per row of ``embeddings``.
+
+        Exact searches score every query in a single matrix product; with an
+        active IVF index each query probes its own lists.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1) if len(embeddings) else np.zeros((0, self.dimension), dtype=np.float32)
+        if not len(queries) or not len(self):
+            return [None] * len(queries)
+        if person_type is None and self.index is not None and self.index.nprobe > 0:
+            return [self.best_match(query, threshold=threshold) for query in queries]
+        if queries.shape[1] != self.dimension:
+            raise ValueError(f'Embeddings have {queries.shape[1]} dimensions, gallery expects {self.dimension}')
+        if person_type is None:
+            rows = np.arange(len(self))
+            matrix = self.matrix
+            sq_norms = self._sq_norms
+        else:
+            rows, matrix, sq_norms = self._subset(person_type)
+        if not len(rows):
+            return [None] * len(queries)
+        squared = sq_norms[np.newaxis, :] - 2.0 * (queries @ matrix.T) + np.einsum('ij,ij->i', queries, queries)[:, np.newaxis]
+        np.maximum(squared, 0.0, out=squared)
+        nearest = np.argmin(squared, axis=1)
+        distances = np.sqrt(squared[np.arange(len(queries)), nearest])
+        results = []
+        for column, distance in zip(nearest, distances):
+            row = rows[column]
+            results.append(GalleryMatch(self.ids[row], self.names[row], self.types[row], float(distance)) if distance < threshold else None)
+        return results
+
+
+def gallery_path_for(cache_file):
+    """Return the binary gallery path that sits beside the pickle cache."""
+    return os.path.join(os.path.dirname(os.path.abspath(cache_file)), GALLERY_FILENAME)
+
+
+def index_path_for(cache_file):
+    """Return the IVF index path that sits beside the pickle cache."""
+    return os.path.join(os.path.dirname(os.path.abspath(cache_file)), INDEX_FILENAME)
+
+
+def _attach_index(gallery, cache_file):
+    """Attach the IVF index when one was built for exactly this gallery."""
+    index_file = index_path_for(cache_file)
+    if gallery.labels_crc is None or not os.path.exists(index_file):
+        return gallery
+    try:
+        gallery.index = IVFIndex.open(index_file, len(gallery), gallery.labels_crc)
+    except (OSError, ValueError):
+        gallery.index = None
+    return gallery
+
+
+def load_face_gallery(cache_file):
+    """Load the gallery for ``cache_file``, preferring an up-to-date binary file.
+
+    Falls back to the legacy pickle when the binary file is missing, older
+    than the pickle, or unreadable, and then tries to write a fresh binary
+    copy so the next load can be memory-mapped.
+    """
+    gallery_file = gallery_path_for(cache_file)
+    pickle_exists = os.path.exists(cache_file)
+    if os.path.exists(gallery_file):
+        try:
+            if not pickle_exists or os.path.getmtime(gallery_file) >= os.path.getmtime(cache_file):
+                return _attach_index(FaceGallery.open(gallery_file), cache_file)
+        except (OSError, ValueError):
+            pass
+    if not pickle_exists:
+        return FaceGallery.empty()
+    with open(cache_file, 'rb') as handle:
+        face_data = pickle.load(handle)
+    gallery = FaceGallery.from_face_data(face_data)
+    try:
+        gallery.save(gallery_file)
+    except OSError:
+        pass
+    return _attach_index(gallery, cache_file)
@@ -0,0 +1,40 @@
+"""Crop-and-embed pipeline for faces already located by the Haar cascade.
+
+The scanners detect faces with ``detectMultiScale`` to draw boxes and gate
+recognition. Handing the whole frame to ``DeepFace.represent`` with an
+``opencv`` detector repeated that detection inside DeepFace, so instead each
+box is cropped with a margin, levelled using the eye cascade, cut back to
+the box and embedded without a second detection. All faces of a frame go
+through the configured :mod:`embedding_backend` in one batched forward pass.
+The cropping itself lives in :mod:`embedding_backend` so that galleries built
+by the local-model backends are aligned the same way.
+"""
+
+from embedding_backend import FACE_CROP_MARGIN, crop_face, get_backend
+from face_gallery import normalize_embedding
+
+MAX_FACES_PER_BATCH = 6
+
+
+def embed_face(crop, backend=None):
+    """Embed one prepared crop; returns a unit vector or ``None``."""
+    return embed_crops([crop], backend)[0]
+
+
+def embed_crops(crops, backend=None):
+    """Embed several prepared crops in one batched forward pass; returns unit vectors (or ``None``) in order."""
+    if not crops:
+        return []
+    backend = backend or get_backend()
+    return [normalize_embedding(embedding) if embedding is not None else None for embedding in backend.embed_crops(crops)]
+
+
+def embed_boxes(frame, boxes, margin=FACE_CROP_MARGIN, max_faces=MAX_FACES_PER_BATCH, backend=None):
+    """Return ``(box, embedding)`` pairs for up to ``max_faces`` boxes that yield a usable crop."""
+    prepared = []
+    for box in list(boxes)[:max_faces]:
+        crop = crop_face(frame, box, margin)
+        if crop is not None:
+            prepared.append((tuple(int(value) for value in box), crop))
+    embeddings = embed_crops([crop for _box, crop in prepared], backend)
+    return [(box, embedding) for (box, _crop), embedding in zip(prepared, embeddings) if embedding is not None]
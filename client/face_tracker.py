@@ -0,0 +1,133 @@
+"""Lightweight IoU/centroid tracker for Haar face boxes.
+
+Each face that stays in view keeps a track ID across frames, so the scanners
+embed a face when its track first appears and then only every
+``reverify_every`` frames, reusing the cached identity in between.
+"""
+
+import itertools
+import time
+
+DEFAULT_IOU_THRESHOLD = 0.3
+DEFAULT_CENTROID_RATIO = 0.5
+DEFAULT_MAX_MISSED = 5
+DEFAULT_MAX_GAP_SECONDS = 1.5
+DEFAULT_REVERIFY_EVERY = 15
+
+
+def box_iou(first, second):
+    """Intersection-over-union of two ``(x, y, w, h)`` boxes."""
+    ax, ay, aw, ah = first
+    bx, by, bw, bh = second
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    intersection = inter_w * inter_h
+    return intersection / float(aw * ah + bw * bh - intersection)
+
+
+def _centroid_distance(first, second):
+    """Centroid distance relative to the larger box width."""
+    ax, ay, aw, ah = first
+    bx, by, bw, bh = second
+    dx = ax + aw / 2.0 - (bx + bw / 2.0)
+    dy = ay + ah / 2.0 - (by + bh / 2.0)
+    return (dx * dx + dy * dy) ** 0.5 / float(max(aw, bw, 1))
+
+
+class FaceTrack:
+    """One face followed across frames, with the identity last embedded for it."""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.missed = 0
+        self.frames_since_embed = None
+        self.identity = None
+        self.announced = None
+
+    def needs_embedding(self, reverify_every=DEFAULT_REVERIFY_EVERY):
+        """True for a new track or one whose cached identity is due for re-verification."""
+        return self.frames_since_embed is None or self.frames_since_embed >= reverify_every
+
+    def remember(self, identity):
+        """Cache the identity produced by a fresh embedding of this track."""
+        self.identity = identity
+        self.frames_since_embed = 0
+
+    def postpone(self):
+        """Restart the re-verification countdown without embedding again."""
+        self.frames_since_embed = 0
+
+
+class FaceTracker:
+    """Associates each frame's boxes with existing tracks by IoU, then by centroid distance."""
+
+    def __init__(self, iou_threshold=DEFAULT_IOU_THRESHOLD, centroid_ratio=DEFAULT_CENTROID_RATIO, max_missed=DEFAULT_MAX_MISSED, max_gap=DEFAULT_MAX_GAP_SECONDS, reverify_every=DEFAULT_REVERIFY_EVERY):
+        self.iou_threshold = iou_threshold
+        self.centroid_ratio = centroid_ratio
+        self.max_missed = max_missed
+        self.max_gap = max_gap
+        self.reverify_every = reverify_every
+        self.tracks = {}
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = {}
+
+    def update(self, boxes, now=None):
+        """Match ``boxes`` to tracks and return the track of each box, in box order."""
+        now = time.time() if now is None else now
+        for track_id in [track_id for track_id, track in self.tracks.items() if now - track.last_seen > self.max_gap]:
+            del self.tracks[track_id]
+        boxes = [tuple(int(value) for value in box) for box in boxes]
+        assigned = {}
+        free_tracks = set(self.tracks)
+        pairs = sorted(((box_iou(self.tracks[track_id].box, box), index, track_id) for index, box in enumerate(boxes) for track_id in free_tracks), reverse=True)
+        for score, index, track_id in pairs:
+            if score < self.iou_threshold:
+                break
+            if index in assigned or track_id not in free_tracks:
+                continue
+            assigned[index] = track_id
+            free_tracks.discard(track_id)
+        pairs = sorted(((_centroid_distance(self.tracks[track_id].box, box), index, track_id) for index, box in enumerate(boxes) if index not in assigned for track_id in free_tracks))
+        for distance, index, track_id in pairs:
+            if distance > self.centroid_ratio:
+                break
+            if index in assigned or track_id not in free_tracks:
+                continue
+            assigned[index] = track_id
+            free_tracks.discard(track_id)
+        result = []
+        for index, box in enumerate(boxes):
+            track_id = assigned.get(index)
+            if track_id is None:
+                track = FaceTrack(next(self._ids), box, now)
+                self.tracks[track.track_id] = track
+            else:
+                track = self.tracks[track_id]
+                track.box = box
+                track.last_seen = now
+                track.missed = 0
+                if track.frames_since_embed is not None:
+                    track.frames_since_embed += 1
+            result.append(track)
+        for track_id in free_tracks:
+            track = self.tracks[track_id]
+            track.missed += 1
+            if track.missed > self.max_missed:
+                del self.tracks[track_id]
+        return result
+
+    def hold(self, now=None):
+        """Keep every track alive through frames skipped because nothing moved."""
+        now = time.time() if now is None else now
+        for track in self.tracks.values():
+            track.last_seen = now
+
+    def needs_embedding(self, track):
+        return track.needs_embedding(self.reverify_every)
@@ -4,35 +4,48 @@ os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox
-import cv2
 import numpy as np
-import pickle
 import sys
 import threading
 import time
+from collections import deque
 from datetime import datetime
 import pytz
-from PIL import Image, ImageTk
-from deepface import DeepFace
 import requests
-import json
 import warnings
 from instructor_console import InstructorConsoleView
 from ui_utils import bring_window_to_front
+from face_cache_sync import apply_cache_delta, cache_is_current, download_cache, fetch_cache_meta, read_sync_state
+from inference_worker import acquire_inference_worker, release_inference_worker
+from face_detector import FaceDetector, face_cascade
+from recognition_engine import RecognitionEngine
+from recognition_scheduler import RecognitionScheduler
+from camera_capture import acquire_camera, release_camera
+from preview_renderer import PreviewRenderer
+from latency_metrics import METRICS, record as record_latency, start_metrics_reporter, timed
+from face_gallery import FaceGallery, load_face_gallery, PERSON_TYPE_INSTRUCTOR, PERSON_TYPE_STUDENT, DEFAULT_MATCH_THRESHOLD, distance_to_confidence
 from server import SERVER_URL as BACKEND_URL, API_KEY
+from api_client import get_api_client
+from attendance_journal import KIND_INSTRUCTOR_ATTENDANCE, KIND_INSTRUCTOR_CHECKOUT, KIND_STUDENT_ATTENDANCE, get_journal_flusher
+from live_events import GalleryGenerationWatch, get_live_events
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 warnings.filterwarnings('ignore', category=UserWarning, module='tensorflow')
 warnings.filterwarnings('ignore', category=DeprecationWarning, module='tensorflow')
 ctk.set_appearance_mode('light')
 ctk.set_default_color_theme('green')
 HEADERS = {'X-API-Key': API_KEY, 'Content-Type': 'application/json'}
+ROSTER_REFRESH_SECONDS = 60.0
+ROSTER_MATCH_MARGIN = 0.05
+ROSTER_CHECK_CANDIDATES = 5
+DIAGNOSTICS_HOTKEY = '<Control-Shift-KeyPress-D>'
+DIAGNOSTICS_REFRESH_MS = 1000
 
 class FacialRecognitionApp:
 
     def fetch_default_class_id(self):
         """Fetch the first available class ID from the API"""
         try:
-            response = requests.get(f'{BACKEND_URL}/classes/api/list', headers=HEADERS, verify=False, timeout=10)
+            response = get_api_client().class_list()
             if response.status_code == 200:
                 classes = response.json()
                 if classes and len(classes) > 0:
@@ -47,7 +60,7 @@ class FacialRecognitionApp:
     def fetch_class_session_info(self):
         """Fetch class information to get class details"""
         try:
-            response = requests.get(f'{BACKEND_URL}/classes/api/list', headers=HEADERS, verify=False, timeout=10)
+            response = get_api_client().class_list()
             if response.status_code == 200:
                 classes = response.json()
                 for cls in classes:
@@ -93,6 +106,44 @@ class FacialRecognitionApp:
         self.primary_instructor_id = _to_int(primary_raw)
         self.substitute_instructor_id = _to_int(substitute_raw)
 
+    @timed('http.class_roster')
+    def fetch_class_roster(self):
+        """Fetch the enrolled students and assigned instructors of the active class."""
+        self.roster_checked_at = time.time()
+        if self.class_id is None:
+            return
+        try:
+            response = get_api_client().class_roster(self.class_id)
+            if response.status_code != 200:
+                return
+            data = response.json()
+            if not data.get('success'):
+                return
+        except Exception as e:
+            return
+        roster = {(PERSON_TYPE_STUDENT, str(student_id)) for student_id in data.get('student_ids') or []}
+        roster.update(((PERSON_TYPE_INSTRUCTOR, str(instructor_id)) for instructor_id in data.get('instructor_ids') or []))
+        with self.gui_lock:
+            if roster != self.class_roster:
+                self.class_roster = roster
+                self._rebuild_class_gallery()
+
+    def _rebuild_class_gallery(self):
+        """Slice the class candidates out of the full gallery; ``None`` means match everyone."""
+        if self.class_roster is None:
+            self.class_gallery = None
+        else:
+            self.class_gallery = self.gallery.subset(self.class_roster)
+
+    def _roster_rejection(self, person_type, person_id):
+        """Return the API-style error for a person outside the known roster, else ``None``."""
+        roster = self.class_roster
+        if roster is None or (person_type, str(person_id)) in roster:
+            return None
+        if person_type == PERSON_TYPE_INSTRUCTOR:
+            return (False, 'not_assigned_to_class', 'Instructor is not assigned to this class')
+        return (False, 'not_enrolled_in_class', 'Student is not enrolled in this class')
+
     def __init__(self, root, class_id=None, session_id=None, room_number=None, embedded=False, on_exit=None, on_logout=None, acting_instructor_id=None, acting_instructor_role='primary'):
         self.root = root
         self.embedded = embedded
@@ -120,6 +171,9 @@ class FacialRecognitionApp:
         self.room_number = room_number
         self.primary_instructor_id = None
         self.substitute_instructor_id = None
+        self.class_roster = None
+        self.class_gallery = None
+        self.roster_checked_at = 0.0
         if hasattr(self.root, 'title') and (not self.embedded):
             self.root.title('Facial Recognition Scanner')
         else:
@@ -130,91 +184,151 @@ class FacialRecognitionApp:
             except Exception:
                 pass
         self.load_embeddings()
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
+        self.camera = acquire_camera()
+        if self.camera is None:
             messagebox.showerror('Camera Error', 'Could not open camera device')
             raise RuntimeError('Could not open camera device')
-        self.test_camera_and_detection()
-        if self.class_id is None:
-            self.class_id = self.fetch_default_class_id()
+        try:
+            self.test_camera_and_detection()
             if self.class_id is None:
-                messagebox.showerror('Configuration Error', 'No class ID available. Please provide a class ID or ensure classes exist in the system.')
-                raise RuntimeError('No class ID available for facial recognition')
-        self.is_recognizing = False
-        self.recognized_person = None
-        self.recognized_person_id = None
-        self.recognized_type = None
-        self.confidence = 0.0
-        self.current_frame = None
-        self.face_count = 0
-        self.attendance_marked = False
-        self.countdown_active = False
-        self.auto_reset_timer = None
-        self.already_marked_ids = set()
-        self.awaiting_console_auth = False
-        self.console_redirect_job = None
-        self.console_countdown_remaining = None
-        self.console_launch_target = (None, None)
-        self.console_modal = None
-        self.console_auth_timer = None
-        self.console_auth_seconds = None
-        self.session_ended = False
-        self.class_code = None
-        self.class_name = None
-        self.class_schedule = None
-        if not self.room_number:
-            self.room_number = 'Unknown'
-        self.fetch_class_session_info()
-        self.camera_lock = threading.Lock()
-        self.gui_lock = threading.Lock()
-        self.camera_image_id = None
-        self.camera_photo = None
-        self.camera_paused = False
-        self.detected_faces = []
-        self.face_rectangles = []
-        self.create_widgets()
-        self.last_cache_mtime = None
-        self.update_check_interval = 5.0
-        self._try_download_cache_on_startup()
-        self._update_cache_mtime()
-        self.camera_thread = threading.Thread(target=self.camera_loop, daemon=True)
-        self.camera_thread.start()
-        self.recognition_thread = threading.Thread(target=self.recognition_loop, daemon=True)
-        self.recognition_thread.start()
-        self.update_check_thread = threading.Thread(target=self._check_for_updates_loop, daemon=True)
-        self.update_check_thread.start()
-
-    def update_camera_display(self, frame):
-        """Update camera display in main thread to prevent flickering"""
+                self.class_id = self.fetch_default_class_id()
+                if self.class_id is None:
+                    messagebox.showerror('Configuration Error', 'No class ID available. Please provide a class ID or ensure classes exist in the system.')
+                    raise RuntimeError('No class ID available for facial recognition')
+            self.is_recognizing = False
+            self.recognition_queue = deque()
+            self.recognized_person = None
+            self.recognized_person_id = None
+            self.recognized_type = None
+            self.confidence = 0.0
+            self.face_count = 0
+            self.attendance_marked = False
+            self.countdown_active = False
+            self.auto_reset_timer = None
+            self.already_marked_ids = set()
+            self.awaiting_console_auth = False
+            self.console_redirect_job = None
+            self.console_countdown_remaining = None
+            self.console_launch_target = (None, None)
+            self.console_modal = None
+            self.console_auth_timer = None
+            self.console_auth_seconds = None
+            self.session_ended = False
+            self.class_code = None
+            self.class_name = None
+            self.class_schedule = None
+            if not self.room_number:
+                self.room_number = 'Unknown'
+            self.fetch_class_session_info()
+            self.camera_lock = threading.Lock()
+            self.gui_lock = threading.Lock()
+            self.fetch_class_roster()
+            self.camera_image_id = None
+            self.camera_photo = None
+            self.camera_paused = False
+            self.display_pending = False
+            self.preview = PreviewRenderer()
+            self.detected_faces = []
+            self.scheduler = RecognitionScheduler()
+            self.engine = RecognitionEngine(embed=lambda frame, boxes: self.inference.embed(frame, boxes), match=self.compare_embeddings_batch, is_ready=lambda: getattr(self, 'inference', None) is not None and self.inference.ready)
+            self.create_widgets()
+            self.last_cache_mtime = None
+            self.update_check_interval = 5.0
+            self.gallery_watch = GalleryGenerationWatch(get_live_events())
+            self._try_download_cache_on_startup()
+            self._update_cache_mtime()
+            self.inference = acquire_inference_worker()
+            self.camera_thread = threading.Thread(target=self.camera_loop, daemon=True)
+            self.camera_thread.start()
+            self.recognition_thread = threading.Thread(target=self.recognition_loop, daemon=True)
+            self.recognition_thread.start()
+            self.update_check_thread = threading.Thread(target=self._check_for_updates_loop, daemon=True)
+            self.update_check_thread.start()
+            self.diagnostics_visible = False
+            self.diagnostics_job = None
+            try:
+                self.root.winfo_toplevel().bind(DIAGNOSTICS_HOTKEY, self.toggle_diagnostics_overlay, add='+')
+            except Exception:
+                pass
+            start_metrics_reporter(BACKEND_URL, HEADERS, room=self.room_number)
+            get_journal_flusher()
+        except Exception:
+            self._release_partial_init()
+            raise
+
+    def _release_partial_init(self):
+        """Undo what a failed constructor already acquired: camera, inference worker and gallery watch."""
+        self.running = False
+        if getattr(self, 'gallery_watch', None) is not None:
+            self.gallery_watch.close()
+            self.gallery_watch = None
+        if getattr(self, 'inference', None) is not None:
+            self.inference = None
+            release_inference_worker()
+        if getattr(self, 'camera', None) is not None:
+            self.camera = None
+            release_camera()
+
+    def toggle_diagnostics_overlay(self, event=None):
+        """Show or hide the per-stage latency table over the camera preview"""
+        if self._shutdown:
+            return
+        self.diagnostics_visible = not self.diagnostics_visible
+        if self.diagnostics_visible:
+            self._refresh_diagnostics_overlay()
+        else:
+            if self.diagnostics_job:
+                try:
+                    self.root.after_cancel(self.diagnostics_job)
+                except Exception:
+                    pass
+                self.diagnostics_job = None
+            self.camera_canvas.delete('diagnostics')
+
+    def _refresh_diagnostics_overlay(self):
+        self.diagnostics_job = None
+        if not self.diagnostics_visible or self._shutdown:
+            return
+        try:
+            self.camera_canvas.delete('diagnostics')
+            flusher = get_journal_flusher()
+            text = '\n'.join(METRICS.format_lines() + [f"journal pending={flusher.journal.pending_count()} {('online' if flusher.online else 'offline')}"])
+            text_id = self.camera_canvas.create_text(12, 12, anchor=tk.NW, text=text, fill='#00ff00', font=('Courier', 10), tags=('diagnostics',))
+            left, top, right, bottom = self.camera_canvas.bbox(text_id)
+            background_id = self.camera_canvas.create_rectangle(left - 6, top - 6, right + 6, bottom + 6, fill='#000000', outline='#00ff00', tags=('diagnostics',))
+            self.camera_canvas.tag_lower(background_id, text_id)
+            self.camera_canvas.tag_raise('diagnostics')
+            self.camera_canvas.tag_raise(text_id)
+        except Exception:
+            pass
+        self.diagnostics_job = self.root.after(DIAGNOSTICS_REFRESH_MS, self._refresh_diagnostics_overlay)
+
+    def _display_lease(self, lease, scheduled_at=None):
+        """Show a leased camera frame on the Tk thread and hand the slot back"""
+        try:
+            self.update_camera_display(lease.frame, scheduled_at)
+        finally:
+            lease.release()
+            self.display_pending = False
+
+    def update_camera_display(self, frame, scheduled_at=None):
+        """Render the frame and its face boxes into the reused preview image"""
         try:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            img.thumbnail((640, 480))
-            new_photo = ImageTk.PhotoImage(image=img)
             canvas_width = self.camera_canvas.winfo_width()
             canvas_height = self.camera_canvas.winfo_height()
             if canvas_width > 1 and canvas_height > 1:
-                if self.camera_image_id:
-                    self.camera_canvas.delete(self.camera_image_id)
-                for rect_id in self.face_rectangles:
-                    self.camera_canvas.delete(rect_id)
-                self.face_rectangles = []
-                img_width, img_height = img.size
-                x = (canvas_width - img_width) // 2
-                y = (canvas_height - img_height) // 2
-                self.camera_image_id = self.camera_canvas.create_image(x, y, anchor=tk.NW, image=new_photo)
                 with self.camera_lock:
-                    detected_faces = self.detected_faces.copy()
-                scale_x = img_width / frame.shape[1]
-                scale_y = img_height / frame.shape[0]
-                for face_x, face_y, face_w, face_h in detected_faces:
-                    scaled_x = int(face_x * scale_x) + x
-                    scaled_y = int(face_y * scale_y) + y
-                    scaled_w = int(face_w * scale_x)
-                    scaled_h = int(face_h * scale_y)
-                    rect_id = self.camera_canvas.create_rectangle(scaled_x, scaled_y, scaled_x + scaled_w, scaled_y + scaled_h, outline='#00ff00', width=3)
-                    self.face_rectangles.append(rect_id)
-                self.camera_photo = new_photo
+                    detected_faces = list(self.detected_faces)
+                photo, created = self.preview.render(frame, (canvas_width, canvas_height), detected_faces, scheduled_at)
+                x = (canvas_width - photo.width()) // 2
+                y = (canvas_height - photo.height()) // 2
+                if self.camera_image_id is None:
+                    self.camera_image_id = self.camera_canvas.create_image(x, y, anchor=tk.NW, image=photo)
+                else:
+                    self.camera_canvas.coords(self.camera_image_id, x, y)
+                    if created:
+                        self.camera_canvas.itemconfigure(self.camera_image_id, image=photo)
+                self.camera_photo = photo
         except Exception as e:
             pass
 
@@ -225,6 +339,8 @@ class FacialRecognitionApp:
                 self.recognition_status.config(text=f'🔍 Face detected - Processing {face_count} face(s)...')
             elif status_type == 'no_faces':
                 self.recognition_status.config(text='📷 No faces detected')
+            elif status_type == 'warming':
+                self.recognition_status.config(text='⏳ Face model warming up - please wait...')
             elif status_type == 'error':
                 self.recognition_status.config(text=f'⚠️ Recognition error: {error_msg}...')
         except:
@@ -371,6 +487,8 @@ class FacialRecognitionApp:
     def begin_console_authentication(self):
         """Switch the scanner into instructor authentication mode."""
         self.awaiting_console_auth = True
+        with self.gui_lock:
+            self.recognition_queue.clear()
         self.recognition_status.configure(text='Awaiting instructor authentication')
         self.person_label.configure(text='Instructor authentication mode', text_color='#000000')
         self.id_label.configure(text='Scan authorized instructor', text_color='#000000')
@@ -385,23 +503,11 @@ class FacialRecognitionApp:
         """Try to download the latest cache file on startup if it doesn't exist or is outdated."""
         cache_file = self._get_cache_file_path()
         if not os.path.exists(cache_file):
-            if self._download_cache_file():
-                pass
+            self._download_cache_file()
             return
-        try:
-            response = requests.get(f'{BACKEND_URL}/api/face-encodings/meta', headers=HEADERS, verify=False, timeout=3)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    server_mtime_str = data.get('mtime')
-                    if server_mtime_str:
-                        server_mtime = datetime.fromisoformat(server_mtime_str.replace('Z', '+00:00')).timestamp()
-                        local_mtime = os.path.getmtime(cache_file)
-                        if server_mtime > local_mtime:
-                            if self._download_cache_file():
-                                pass
-        except Exception as e:
-            pass
+        meta = fetch_cache_meta(BACKEND_URL, HEADERS)
+        if meta is not None and (not cache_is_current(cache_file, meta)):
+            self._download_cache_file()
 
     def _update_cache_mtime(self):
         """Update the last known cache file modification time."""
@@ -415,59 +521,39 @@ class FacialRecognitionApp:
             self.last_cache_mtime = None
 
     def _check_for_updates_loop(self):
-        """Background thread that periodically checks for cache file updates."""
+        """Background thread that checks for cache updates, woken early by gallery events."""
         while self.running:
             try:
-                try:
-                    response = requests.get(f'{BACKEND_URL}/api/face-encodings/meta', headers=HEADERS, verify=False, timeout=3)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('success'):
-                            server_mtime_str = data.get('mtime')
-                            if server_mtime_str:
-                                server_mtime = datetime.fromisoformat(server_mtime_str.replace('Z', '+00:00')).timestamp()
-                                if self.last_cache_mtime is None or server_mtime > self.last_cache_mtime:
-                                    self._reload_embeddings()
-                                    self.last_cache_mtime = server_mtime
-                except Exception as api_error:
-                    cache_file = self._get_cache_file_path()
-                    if os.path.exists(cache_file):
-                        try:
-                            current_mtime = os.path.getmtime(cache_file)
-                            if self.last_cache_mtime is None or current_mtime > self.last_cache_mtime:
-                                self._reload_embeddings()
-                                self.last_cache_mtime = current_mtime
-                        except Exception:
-                            pass
+                cache_file = self._get_cache_file_path()
+                generation = self.gallery_watch.remote_generation(lambda: fetch_cache_meta(BACKEND_URL, HEADERS))
+                if generation is not None and generation != self.gallery_generation:
+                    if not self._apply_gallery_delta():
+                        self._reload_embeddings()
+                elif os.path.exists(cache_file):
+                    current_mtime = os.path.getmtime(cache_file)
+                    if self.last_cache_mtime is None or current_mtime > self.last_cache_mtime:
+                        self._reload_embeddings()
             except Exception as e:
                 pass
-            time.sleep(self.update_check_interval)
+            if time.time() - self.roster_checked_at >= ROSTER_REFRESH_SECONDS:
+                self.fetch_class_roster()
+            self.gallery_watch.wait(self.update_check_interval)
 
     def _download_cache_file(self):
-        """Download the latest cache file from the server."""
-        cache_file = self._get_cache_file_path()
-        cache_dir = os.path.dirname(cache_file)
-        if cache_dir:
-            os.makedirs(cache_dir, exist_ok=True)
-        temp_path = cache_file + '.tmp'
-        try:
-            response = requests.get(f'{BACKEND_URL}/api/face-encodings', headers=HEADERS, verify=False, timeout=30, stream=True)
-            if response.status_code != 200:
-                return False
-            with open(temp_path, 'wb') as temp_file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        temp_file.write(chunk)
-            os.replace(temp_path, cache_file)
-            return True
-        except Exception as e:
+        """Download the latest cache file from the server unless it is unchanged."""
+        return download_cache(BACKEND_URL, HEADERS, self._get_cache_file_path())
+
+    def _apply_gallery_delta(self):
+        """Patch the in-memory gallery from the server change journal instead of a full reload."""
+        result = apply_cache_delta(BACKEND_URL, HEADERS, self.gallery, self.gallery_generation, cache_file=self._get_cache_file_path())
+        if result is None:
             return False
-        finally:
-            if os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+        gallery, generation = result
+        with self.gui_lock:
+            self.gallery = gallery
+            self.gallery_generation = generation
+            self._rebuild_class_gallery()
+        return True
 
     def _reload_embeddings(self):
         """Download and reload embeddings from cache file when update is detected."""
@@ -484,39 +570,14 @@ class FacialRecognitionApp:
             pass
 
     def load_embeddings(self):
-        """Load face embeddings from pickle file"""
+        """Load face embeddings from the binary gallery (or legacy pickle)"""
         cache_file = self._get_cache_file_path()
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'rb') as f:
-                    face_data = pickle.load(f)
-                self.student_embeddings = face_data.get('student_embeddings', [])
-                self.student_names = face_data.get('student_names', [])
-                self.student_ids = face_data.get('student_ids', [])
-                self.instructor_embeddings = face_data.get('instructor_embeddings', [])
-                self.instructor_names = face_data.get('instructor_names', [])
-                self.instructor_ids = face_data.get('instructor_ids', [])
-
-                def normalize_embedding(emb):
-                    emb_array = np.array(emb)
-                    norm = np.linalg.norm(emb_array)
-                    return emb_array / norm if norm > 0 else emb_array
-                self.student_embeddings = [normalize_embedding(emb) for emb in self.student_embeddings]
-                self.instructor_embeddings = [normalize_embedding(emb) for emb in self.instructor_embeddings]
-            except Exception as e:
-                self.student_embeddings = []
-                self.student_names = []
-                self.student_ids = []
-                self.instructor_embeddings = []
-                self.instructor_names = []
-                self.instructor_ids = []
-        else:
-            self.student_embeddings = []
-            self.student_names = []
-            self.student_ids = []
-            self.instructor_embeddings = []
-            self.instructor_names = []
-            self.instructor_ids = []
+        try:
+            self.gallery = load_face_gallery(cache_file)
+        except Exception as e:
+            self.gallery = FaceGallery.empty()
+        self.gallery_generation = read_sync_state(cache_file).get('generation')
+        self._rebuild_class_gallery()
 
     def create_widgets(self):
         """Create the GUI widgets"""
@@ -555,126 +616,139 @@ class FacialRecognitionApp:
         self.attendance_label = build_detail_row('Attendance', 'Not Yet Marked')
 
     def camera_loop(self):
-        """Camera capture loop running in separate thread"""
-        last_update = 0
-        update_interval = 1 / 30
+        """Preview loop: hand each new captured frame to the Tk thread, one at a time"""
+        last_seq = 0
+        camera = self.camera
         while self.running:
-            current_time = time.time()
-            if current_time - last_update < update_interval:
-                time.sleep(0.01)
+            lease = camera.read_latest(after_seq=last_seq, timeout=0.5)
+            if lease is None:
                 continue
-            ret, frame = self.cap.read()
-            if ret:
-                with self.camera_lock:
-                    self.current_frame = frame.copy()
-                    camera_paused = self.camera_paused
-                if not camera_paused:
-                    self.root.after(0, lambda f=frame: self.update_camera_display(f))
-            else:
-                pass
-            last_update = current_time
-            time.sleep(0.01)
+            last_seq = lease.seq
+            with self.camera_lock:
+                camera_paused = self.camera_paused
+            now = time.time()
+            if camera_paused or self.display_pending or (not self.preview.due(now)):
+                lease.release()
+                continue
+            self.display_pending = True
+            try:
+                self.root.after(0, lambda item=lease, queued=now: self._display_lease(item, queued))
+            except Exception:
+                lease.release()
+                self.display_pending = False
 
     def recognition_loop(self):
-        """Face recognition loop running in separate thread"""
+        """Feed camera frames to the recognition engine and reflect its results in the UI"""
         last_gui_update = 0
         gui_update_interval = 0.2
+        last_seq = 0
+        camera = self.camera
         while self.running:
+            lease = camera.read_latest(after_seq=last_seq, timeout=0.5)
+            if lease is None:
+                continue
+            last_seq = lease.seq
             current_time = time.time()
+            work_started = time.perf_counter()
+            record_latency('capture.frame_age', max(0.0, current_time - lease.timestamp))
             with self.camera_lock:
-                frame = self.current_frame.copy() if self.current_frame is not None else None
                 camera_paused = self.camera_paused
-            if frame is not None and (not camera_paused):
-                try:
-                    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-                    if face_cascade.empty():
-                        continue
-                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    faces_coords = face_cascade.detectMultiScale(gray, 1.3, 5)
-                    detected_faces = []
-                    for x, y, w, h in faces_coords:
-                        detected_faces.append((x, y, w, h))
-                    with self.camera_lock:
-                        self.detected_faces = detected_faces
-                    if current_time - last_gui_update > gui_update_interval:
-                        if detected_faces:
-                            face_count = len(detected_faces)
-                            self.root.after(0, lambda: self.update_recognition_status(face_count, 'processing'))
-                        else:
-                            self.root.after(0, lambda: self.update_recognition_status(0, 'no_faces'))
-                        last_gui_update = current_time
+            result = None
+            try:
+                result = self.engine.process(lease.frame, current_time, paused=camera_paused, single=self.awaiting_console_auth, reannounce=self.awaiting_console_auth)
+                if result.skipped or camera_paused:
+                    continue
+                detected_faces = result.faces
+                with self.camera_lock:
+                    self.detected_faces = detected_faces
+                if current_time - last_gui_update > gui_update_interval:
                     if detected_faces:
-                        try:
-                            faces = DeepFace.represent(img_path=frame, model_name='Facenet512', detector_backend='opencv', enforce_detection=False)
-                            if faces:
-                                for face in faces:
-                                    embedding = np.array(face['embedding'])
-                                    embedding = self.normalize_embedding(embedding)
-                                    recognized, person_type, confidence, person_id = self.compare_embeddings(embedding)
-                                    with self.camera_lock:
-                                        self.camera_paused = True
-                                    with self.gui_lock:
-                                        if recognized:
-                                            self.is_recognizing = True
-                                            self.recognized_person = recognized
-                                            self.recognized_person_id = person_id
-                                            self.recognized_type = person_type
-                                            self.confidence = confidence
-                                        else:
-                                            self.is_recognizing = True
-                                            self.recognized_person = None
-                                            self.recognized_person_id = None
-                                            self.recognized_type = None
-                                            self.confidence = 0.0
-                                    self.root.after(0, self.show_recognition_result)
-                                    break
-                        except Exception as e:
-                            pass
-                except Exception as e:
-                    if current_time - last_gui_update > gui_update_interval:
-                        self.root.after(0, lambda: self.update_recognition_status(0, 'error', str(e)[:50]))
-                        last_gui_update = current_time
-            time.sleep(0.1)
+                        face_count = len(detected_faces)
+                        self.root.after(0, lambda: self.update_recognition_status(face_count, 'processing'))
+                    else:
+                        self.root.after(0, lambda: self.update_recognition_status(0, 'no_faces'))
+                    last_gui_update = current_time
+                if result.warming:
+                    self.root.after(0, lambda: self.update_recognition_status(0, 'warming'))
+                if result.identities:
+                    with self.camera_lock:
+                        self.camera_paused = True
+                    with self.gui_lock:
+                        self.recognition_queue.extend(result.identities)
+                        show_now = not self.is_recognizing
+                        self.is_recognizing = True
+                    if show_now:
+                        self.root.after(0, self._show_next_recognition)
+            except Exception as e:
+                if current_time - last_gui_update > gui_update_interval:
+                    self.root.after(0, lambda: self.update_recognition_status(0, 'error', str(e)[:50]))
+                    last_gui_update = current_time
+            finally:
+                lease.release()
+                idle = result is None or result.skipped or result.warming or camera_paused or (not result.faces)
+                self.scheduler.pause(time.perf_counter() - work_started, idle=idle, new_track=result is not None and result.new_tracks > 0, running=lambda: self.running)
+
+    def compare_embeddings_batch(self, embeddings):
+        """Batched compare_embeddings: class roster first, full gallery for the misses"""
+        if not embeddings:
+            return []
+        matches = [None] * len(embeddings)
+        class_gallery = self.class_gallery
+        roster = self.class_roster
+        if roster is not None and class_gallery is not None and len(class_gallery):
+            hits = class_gallery.best_matches(embeddings, threshold=DEFAULT_MATCH_THRESHOLD)
+        else:
+            hits = [None] * len(embeddings)
+        missing = [index for index, hit in enumerate(hits) if hit is None]
+        for index, hit in enumerate(hits):
+            if hit is not None:
+                matches[index] = self._confirm_roster_match(embeddings[index], hit, roster)
+        if missing:
+            for index, match in zip(missing, self.gallery.best_matches([embeddings[index] for index in missing], threshold=DEFAULT_MATCH_THRESHOLD)):
+                matches[index] = match
+        return [self._match_result(match) for match in matches]
 
     def compare_embeddings(self, embedding):
-        """Compare embedding with stored embeddings"""
-        min_distance = float('inf')
-        recognized_person = None
-        person_type = None
-        person_id = None
-        for i, student_emb in enumerate(self.student_embeddings):
-            distance = np.linalg.norm(embedding - student_emb)
-            if distance < min_distance:
-                min_distance = distance
-                recognized_person = self.student_names[i]
-                person_type = 'Student'
-                person_id = self.student_ids[i]
-        for i, instructor_emb in enumerate(self.instructor_embeddings):
-            distance = np.linalg.norm(embedding - instructor_emb)
-            if distance < min_distance:
-                min_distance = distance
-                recognized_person = self.instructor_names[i]
-                person_type = 'Instructor'
-                person_id = self.instructor_ids[i]
-        threshold = 0.6
-        if min_distance < threshold:
-            confidence = (1 - min_distance) * 100
-            return (recognized_person, person_type, confidence, person_id)
-        return (None, None, 0, None)
+        """Compare embedding with the class roster first, then the full gallery"""
+        class_gallery = self.class_gallery
+        roster = self.class_roster
+        if roster is not None and class_gallery is not None and len(class_gallery):
+            hit = class_gallery.best_match(embedding, threshold=DEFAULT_MATCH_THRESHOLD)
+            if hit is not None:
+                return self._match_result(self._confirm_roster_match(embedding, hit, roster))
+        return self._match_result(self.gallery.best_match(embedding, threshold=DEFAULT_MATCH_THRESHOLD))
+
+    @staticmethod
+    def _match_result(match):
+        if match is None:
+            return (None, None, 0, None)
+        return (match.name, match.person_type, distance_to_confidence(match.distance), match.person_id)
+
+    def _confirm_roster_match(self, embedding, hit, roster):
+        """Keep a roster ``hit`` only if it beats everyone outside the roster by ``ROSTER_MATCH_MARGIN``.
+
+        Otherwise the face is treated as not enrolled: the outsider is
+        returned when it is itself a match, so the scan reports "not enrolled"
+        instead of marking the wrong student, and ``None`` (unknown) when not.
+        """
+        outsider = next((candidate for candidate in self.match_candidates(embedding, k=ROSTER_CHECK_CANDIDATES) if (str(candidate.person_type), str(candidate.person_id)) not in roster), None)
+        if outsider is None or hit.distance + ROSTER_MATCH_MARGIN <= outsider.distance:
+            return hit
+        return outsider if outsider.distance < DEFAULT_MATCH_THRESHOLD else None
+
+    def match_candidates(self, embedding, k=3):
+        """Return the top-k gallery candidates with distances for margin checks"""
+        return self.gallery.match(embedding, k=k)
 
     def test_camera_and_detection(self):
         """Test camera and face detection on startup"""
-        if not self.cap.isOpened():
-            return
-        ret, frame = self.cap.read()
-        if not ret:
+        frame = self.camera.read_copy(timeout=2.0)
+        if frame is None:
             return
         try:
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            if face_cascade.empty():
+            if face_cascade().empty():
                 return
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+            faces = FaceDetector().detect(frame)
         except Exception as e:
             pass
 
@@ -684,18 +758,17 @@ class FacialRecognitionApp:
         norm = np.linalg.norm(emb_array)
         return emb_array / norm if norm > 0 else emb_array
 
+    @timed('http.check_attendance')
     def check_attendance_status(self, person_id, person_type):
         """Check if person already has attendance marked for today"""
         try:
             if not person_id or not self.session_id:
                 return (False, 'Unknown')
             if person_type == 'Student':
-                url = f'{BACKEND_URL}/api/attendance/check'
                 data = {'student_id': person_id, 'class_session_id': self.session_id}
             else:
-                url = f'{BACKEND_URL}/api/attendance/check/instructor'
                 data = {'instructor_id': person_id, 'class_session_id': self.session_id}
-            response = requests.post(url, json=data, headers=HEADERS, verify=False, timeout=5)
+            response = get_api_client().attendance_check(data, person_type)
             if response.status_code == 200:
                 result = response.json()
                 has_attendance = result.get('has_attendance', False)
@@ -706,6 +779,21 @@ class FacialRecognitionApp:
         except Exception as e:
             return (False, 'Unknown')
 
+    def _show_next_recognition(self):
+        """Load the next queued recognition result and display it"""
+        with self.gui_lock:
+            if not self.recognition_queue:
+                return
+            recognized, person_type, confidence, person_id = self.recognition_queue.popleft()
+            self.is_recognizing = True
+            self.recognized_person = recognized
+            self.recognized_person_id = person_id if recognized else None
+            self.recognized_type = person_type if recognized else None
+            self.confidence = confidence if recognized else 0.0
+        with self.camera_lock:
+            self.camera_paused = True
+        self.show_recognition_result()
+
     def show_recognition_result(self):
         """Update GUI with recognition result and automatically mark attendance"""
         try:
@@ -856,9 +944,6 @@ class FacialRecognitionApp:
             with self.camera_lock:
                 self.camera_paused = False
                 self.detected_faces = []
-            for rect_id in self.face_rectangles:
-                self.camera_canvas.delete(rect_id)
-            self.face_rectangles = []
             if reset_fields:
                 self.recognition_status.configure(text='Ready to scan face')
                 self.person_label.configure(text='')
@@ -869,6 +954,7 @@ class FacialRecognitionApp:
         except Exception as e:
             pass
 
+    @timed('attendance.auto_record_time_in')
     def auto_record_time_in(self):
         """Automatically record time-in for recognized person without confirmation"""
         if self.recognized_person:
@@ -891,6 +977,9 @@ class FacialRecognitionApp:
                 if error_type == 'already_recorded':
                     self.attendance_label.configure(text='✅ Already In', text_color='#28a745')
                     self.recognition_status.configure(text='Already in for this class session')
+                elif error_type == 'queued_offline':
+                    self.attendance_label.configure(text='✅ Saved Offline', text_color='#28a745')
+                    self.recognition_status.configure(text='Attendance saved; it will sync when the server is reachable')
                 else:
                     self.attendance_label.configure(text='✅ Marked Successfully', text_color='#28a745')
                     self.recognition_status.configure(text='Attendance recorded successfully')
@@ -924,6 +1013,9 @@ class FacialRecognitionApp:
                 if error_type == 'already_recorded':
                     status_msg = 'ℹ️ Already In'
                     detail_msg = f'{icon} {self.recognized_person} already has attendance recorded today\n🆔 ID: {self.recognized_person_id}\n📚 Class: {self.class_code}\n🏫 Room: {self.room_number}\n📊 Confidence: {self.confidence:.1f}%\n🕒 Timestamp: {timestamp}\n💾 Record already exists in database'
+                elif error_type == 'queued_offline':
+                    status_msg = '✅ Time-In Saved Offline'
+                    detail_msg = f'{icon} Time-In saved for {self.recognized_type} {self.recognized_person}\n🆔 ID: {self.recognized_person_id}\n📚 Class: {self.class_code}\n🏫 Room: {self.room_number}\n📊 Confidence: {self.confidence:.1f}%\n🕒 Timestamp: {timestamp}\n💾 Will sync to database when the server is reachable'
                 else:
                     status_msg = '✅ Time-In Recorded Successfully'
                     detail_msg = f'{icon} Time-In recorded for {self.recognized_type} {self.recognized_person}\n🆔 ID: {self.recognized_person_id}\n📚 Class: {self.class_code}\n🏫 Room: {self.room_number}\n📊 Confidence: {self.confidence:.1f}%\n🕒 Timestamp: {timestamp}\n💾 Synced to database'
@@ -942,20 +1034,24 @@ class FacialRecognitionApp:
             messagebox.showinfo(status_msg, detail_msg)
             self.cancel_recognition()
 
+    @timed('http.send_attendance')
     def send_attendance_to_api(self, attendance_data):
         """Send attendance record to backend API"""
         try:
             person_type = attendance_data['person_type']
             person_id = attendance_data['person_id']
+            rejection = self._roster_rejection(person_type, person_id)
+            if rejection is not None:
+                return rejection
             if person_type == 'Student':
-                api_endpoint = f'{BACKEND_URL}/api/attendance/record'
+                kind = KIND_STUDENT_ATTENDANCE
                 person_name = attendance_data['person_name']
                 name_parts = person_name.split()
                 first_name = name_parts[0] if name_parts else ''
                 last_name = ' '.join(name_parts[1:]) if len(name_parts) > 1 else ''
                 payload = {'student_id': person_id, 'first_name': first_name, 'last_name': last_name, 'class_id': self.class_id, 'confidence': attendance_data['confidence'], 'method': attendance_data['method'], 'status': attendance_data['status']}
             elif person_type == 'Instructor':
-                api_endpoint = f'{BACKEND_URL}/api/instructor-attendance'
+                kind = KIND_INSTRUCTOR_ATTENDANCE
                 proxy_instructor_id = None
                 recorded_instructor_id = person_id
                 try:
@@ -970,7 +1066,9 @@ class FacialRecognitionApp:
                     payload['proxy_instructor_id'] = proxy_instructor_id
             else:
                 return False
-            response = requests.post(api_endpoint, json=payload, headers=HEADERS, verify=False, timeout=10)
+            _key, response = get_journal_flusher().submit(kind, payload)
+            if response is None:
+                return (True, 'queued_offline', f"Attendance for {attendance_data['person_name']} saved on this kiosk; it will sync when the server is reachable")
             if response.status_code == 201:
                 return (True, None, None)
             elif response.status_code == 200:
@@ -997,11 +1095,11 @@ class FacialRecognitionApp:
             return (False, 'unknown_error', str(e))
 
     def start_auto_reset_countdown(self):
-        """Start 3-second countdown before auto-reset"""
+        """Start 3-second countdown before auto-reset (1 second while a group is queued)"""
         if self.countdown_active or not self.running:
             return
         self.countdown_active = True
-        self.countdown_auto_reset(3)
+        self.countdown_auto_reset(1 if self.recognition_queue else 3)
 
     def countdown_auto_reset(self, seconds_left):
         """Countdown timer for auto-reset"""
@@ -1014,6 +1112,8 @@ class FacialRecognitionApp:
         else:
             self.countdown_active = False
             self.cancel_recognition()
+            if self.recognition_queue:
+                self._show_next_recognition()
 
     def cancel_countdown(self):
         """Cancel the auto-reset countdown"""
@@ -1059,14 +1159,24 @@ class FacialRecognitionApp:
             return
         self._shutdown = True
         self.running = False
+        if getattr(self, 'gallery_watch', None) is not None:
+            self.gallery_watch.close()
         self.cancel_countdown()
         self.cancel_console_timer()
         self.cancel_console_auth_timer()
-        if hasattr(self, 'cap') and self.cap:
+        if getattr(self, 'diagnostics_job', None):
             try:
-                self.cap.release()
+                self.root.after_cancel(self.diagnostics_job)
             except Exception:
                 pass
+            self.diagnostics_job = None
+        self.diagnostics_visible = False
+        if getattr(self, 'camera', None) is not None:
+            self.camera = None
+            release_camera()
+        if getattr(self, 'inference', None) is not None:
+            self.inference = None
+            release_inference_worker()
         if destroy_root:
             try:
                 self.root.destroy()
@@ -1125,7 +1235,7 @@ class FacialRecognitionApp:
         if self.awaiting_console_auth:
             messagebox.showinfo('Instructor Console', "Awaiting instructor authentication. Please scan the instructor's face.")
             return
-        if not self.instructor_embeddings:
+        if not self.gallery.count(PERSON_TYPE_INSTRUCTOR):
             messagebox.showerror('Instructor Console', 'No instructor facial data available for authentication.')
             return
         self.show_console_confirmation_modal()
@@ -1152,7 +1262,7 @@ class FacialRecognitionApp:
                 try:
                     instructor_id = self.acting_instructor_id
                     if instructor_id is None:
-                        classes_response = requests.get(f'{BACKEND_URL}/classes/api/list', headers=HEADERS, verify=False, timeout=10)
+                        classes_response = get_api_client().class_list()
                         if classes_response.status_code == 200:
                             classes = classes_response.json()
                             try:
@@ -1174,8 +1284,10 @@ class FacialRecognitionApp:
                         checkout_data = {'instructor_id': instructor_id, 'class_id': self.class_id}
                         if self.session_id:
                             checkout_data['class_session_id'] = self.session_id
-                        checkout_response = requests.post(f'{BACKEND_URL}/api/checkout/instructor', json=checkout_data, headers=HEADERS, verify=False, timeout=10)
-                        if checkout_response.status_code != 200:
+                        _key, checkout_response = get_journal_flusher().submit(KIND_INSTRUCTOR_CHECKOUT, checkout_data)
+                        if checkout_response is None:
+                            messagebox.showinfo('Class Ended Offline', 'The server could not be reached. The class end was saved on this kiosk and will be sent automatically when the server is reachable.')
+                        elif checkout_response.status_code != 200:
                             try:
                                 error_payload = checkout_response.json()
                             except ValueError:
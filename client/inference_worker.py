@@ -0,0 +1,213 @@
+"""Out-of-process face embedding worker shared by the kiosk scanners.
+
+TensorFlow inference on a thread of the Tk process competes with the UI for
+the GIL, so the preview stutters during every embedding. The worker process
+owns the Facenet512 model instead. Frames travel through one shared-memory
+buffer, requests and results through queues. Calls are serialized, so the
+buffer is never rewritten while the worker is reading it.
+
+Scanners call :func:`acquire_inference_worker` when they open and
+:func:`release_inference_worker` from their ``shutdown()``/``close()``. The
+worker stops when the last holder releases it. The kiosk shell holds its own
+reference, so the model stays loaded while users move between screens.
+
+The embedding backend (DeepFace/TensorFlow by default) is imported only inside
+the worker. The worker warms up as soon as it starts, loading Facenet512 and
+embedding one dummy face while the kiosk UI is already interactive. Scanners
+check :attr:`InferenceWorker.ready` and show "model warming" until then.
+"""
+
+import itertools
+import multiprocessing
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+DEFAULT_FRAME_CAPACITY = 1920 * 1080 * 3
+DEFAULT_REQUEST_TIMEOUT = 60.0
+STOP_TIMEOUT = 5.0
+WARMUP_FRAME_SIZE = 160
+
+
+class InferenceWorkerError(RuntimeError):
+    """Raised when the worker process fails, dies or does not answer in time."""
+
+
+def embedding_available():
+    """True when the configured embedding backend can run here, checked without importing TensorFlow."""
+    from embedding_backend import backend_available
+    return backend_available()
+
+
+def _warm_up():
+    """Load the model and run one dummy inference so the first real scan is not slow."""
+    from face_pipeline import embed_boxes
+    frame = np.zeros((WARMUP_FRAME_SIZE, WARMUP_FRAME_SIZE, 3), dtype=np.uint8)
+    embed_boxes(frame, [(0, 0, WARMUP_FRAME_SIZE, WARMUP_FRAME_SIZE)], margin=0.0)
+
+
+def _worker_main(shm_name, request_queue, result_queue, ready_event):
+    """Worker process entry point: embed face boxes of frames placed in shared memory."""
+    try:
+        _warm_up()
+    except Exception:
+        pass
+    finally:
+        ready_event.set()
+    from face_pipeline import FACE_CROP_MARGIN, embed_boxes
+    frame_buffer = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            request = request_queue.get()
+            if request is None:
+                break
+            request_id, shape, boxes, margin = request
+            try:
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=frame_buffer.buf)
+                faces = embed_boxes(frame, boxes, margin=FACE_CROP_MARGIN if margin is None else margin)
+                del frame
+                result_queue.put((request_id, True, faces))
+            except Exception as exc:
+                result_queue.put((request_id, False, str(exc)))
+    finally:
+        frame_buffer.close()
+
+
+class InferenceWorker:
+    """Handle on one embedding worker process and its shared frame buffer."""
+
+    def __init__(self, frame_capacity=DEFAULT_FRAME_CAPACITY, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+        self.frame_capacity = frame_capacity
+        self.request_timeout = request_timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._call_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._process = None
+        self._frame_buffer = None
+        self._requests = None
+        self._results = None
+        self._ready = None
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def ready(self):
+        """True once the running worker finished loading and warming up the model."""
+        return self.running and self._ready is not None and self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready is not None and self._ready.wait(timeout)
+
+    def start(self):
+        """Create the shared buffer and spawn the worker; a no-op while it is running."""
+        if self.running:
+            return
+        self._cleanup()
+        self._frame_buffer = shared_memory.SharedMemory(create=True, size=self.frame_capacity)
+        self._requests = self._context.Queue()
+        self._results = self._context.Queue()
+        self._ready = self._context.Event()
+        self._process = self._context.Process(target=_worker_main, args=(self._frame_buffer.name, self._requests, self._results, self._ready), name='face-inference-worker', daemon=True)
+        self._process.start()
+
+    def stop(self):
+        """Ask the worker to exit, terminate it if it does not, and free the shared buffer."""
+        process = self._process
+        if process is not None and process.is_alive():
+            try:
+                self._requests.put(None)
+            except Exception:
+                pass
+            process.join(STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join(STOP_TIMEOUT)
+        self._cleanup()
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def _cleanup(self):
+        for channel in (self._requests, self._results):
+            if channel is not None:
+                try:
+                    channel.close()
+                    channel.join_thread()
+                except Exception:
+                    pass
+        if self._frame_buffer is not None:
+            try:
+                self._frame_buffer.close()
+                self._frame_buffer.unlink()
+            except Exception:
+                pass
+        self._process = None
+        self._frame_buffer = None
+        self._requests = None
+        self._results = None
+        self._ready = None
+
+    def embed(self, frame, boxes, margin=None, timeout=None):
+        """Embed ``boxes`` of ``frame`` in the worker; returns ``[(box, embedding), ...]``.
+
+        Restarts a dead worker transparently. A worker that fails to answer
+        within ``timeout`` is restarted and :class:`InferenceWorkerError` raised.
+        """
+        boxes = [tuple(int(value) for value in box) for box in boxes]
+        if not boxes:
+            return []
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        with self._call_lock:
+            if frame.nbytes > self.frame_capacity:
+                self.frame_capacity = frame.nbytes
+                self.stop()
+            if not self.running:
+                self.start()
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=self._frame_buffer.buf)[...] = frame
+            request_id = next(self._request_ids)
+            self._requests.put((request_id, frame.shape, boxes, margin))
+            wait = self.request_timeout if timeout is None else timeout
+            while True:
+                try:
+                    result_id, ok, payload = self._results.get(timeout=wait)
+                except queue.Empty:
+                    self.restart()
+                    raise InferenceWorkerError('Inference worker did not respond in time')
+                if result_id == request_id:
+                    break
+            if not ok:
+                raise InferenceWorkerError(payload)
+            return payload
+
+
+_shared_worker = None
+_shared_holders = 0
+_shared_lock = threading.Lock()
+
+
+def acquire_inference_worker():
+    """Return the process-wide worker, starting it for the first holder."""
+    global _shared_worker, _shared_holders
+    with _shared_lock:
+        if _shared_worker is None:
+            _shared_worker = InferenceWorker()
+        _shared_holders += 1
+        _shared_worker.start()
+        return _shared_worker
+
+
+def release_inference_worker():
+    """Drop one hold on the shared worker and stop it when nobody holds it any more."""
+    global _shared_worker, _shared_holders
+    with _shared_lock:
+        if _shared_holders <= 0:
+            return
+        _shared_holders -= 1
+        if _shared_holders == 0 and _shared_worker is not None:
+            _shared_worker.stop()
+            _shared_worker = None
@@ -0,0 +1,154 @@
+"""Per-stage latency spans for the kiosk recognition pipeline.
+
+Code times a stage with ``with span('detect'):``, with the :func:`timed`
+decorator, or by passing a measured duration to :func:`record`. Each stage
+keeps a rolling window of its most recent durations. :meth:`LatencyRecorder.snapshot`
+turns the windows into p50/p95/p99 summaries for the hidden diagnostics
+overlay. :func:`start_metrics_reporter` appends a snapshot to
+``cache/latency_metrics.jsonl`` every ``FRCAS_METRICS_INTERVAL`` seconds.
+When ``FRCAS_METRICS_POST`` is set, the snapshot is also posted to the
+backend's ``/api/kiosk-metrics`` so kiosks in different rooms can be compared.
+"""
+
+import functools
+import json
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+METRICS_WINDOW = int(os.environ.get('FRCAS_METRICS_WINDOW', '512'))
+METRICS_INTERVAL = float(os.environ.get('FRCAS_METRICS_INTERVAL', '60'))
+METRICS_POST_ENABLED = os.environ.get('FRCAS_METRICS_POST', '').strip().lower() in ('1', 'true', 'yes', 'on')
+METRICS_LOG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'cache', 'latency_metrics.jsonl'))
+KIOSK_ID = os.environ.get('FRCAS_CLIENT_ID') or socket.gethostname() or 'kiosk'
+PERCENTILES = (50, 95, 99)
+
+
+def _percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(math.ceil(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class LatencyRecorder:
+    """Thread-safe rolling windows of stage durations, in seconds."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._totals[stage] = self._totals.get(stage, 0) + 1
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def snapshot(self):
+        """Return ``{stage: {'count', 'window', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}}``."""
+        with self._lock:
+            windows = {stage: sorted(samples) for stage, samples in self._samples.items()}
+            totals = dict(self._totals)
+        summary = {}
+        for stage, ordered in sorted(windows.items()):
+            stats = {'count': totals.get(stage, 0), 'window': len(ordered)}
+            for pct in PERCENTILES:
+                stats[f'p{pct}_ms'] = round(_percentile(ordered, pct) * 1000.0, 2)
+            stats['max_ms'] = round(ordered[-1] * 1000.0, 2) if ordered else 0.0
+            summary[stage] = stats
+        return summary
+
+    def report(self, room=None):
+        return {'kiosk_id': KIOSK_ID, 'room': room, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': self.snapshot()}
+
+    def format_lines(self):
+        """Human-readable rows for the diagnostics overlay."""
+        rows = [f"{'stage':<24}{'p50':>9}{'p95':>9}{'p99':>9}{'n':>7}"]
+        for stage, stats in self.snapshot().items():
+            rows.append(f"{stage:<24}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['count']:>7}")
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._totals = {}
+
+
+METRICS = LatencyRecorder()
+record = METRICS.record
+span = METRICS.span
+
+
+def timed(stage):
+    """Decorator that records every call of the wrapped function under ``stage``."""
+
+    def decorate(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def write_metrics_line(report, path=METRICS_LOG_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as handle:
+        handle.write(json.dumps(report) + '\n')
+
+
+def post_metrics(report, server_url, headers, timeout=5):
+    from api_client import get_api_client
+    response = get_api_client(server_url).kiosk_metrics(report, timeout=timeout)
+    return response.status_code == 200
+
+
+_reporter_thread = None
+_reporter_state = {'room': None}
+_reporter_lock = threading.Lock()
+
+
+def _reporter_loop(server_url, headers, interval):
+    while True:
+        time.sleep(interval)
+        report = METRICS.report(_reporter_state['room'])
+        if not report['stages']:
+            continue
+        try:
+            write_metrics_line(report)
+        except OSError:
+            pass
+        if METRICS_POST_ENABLED and server_url:
+            try:
+                post_metrics(report, server_url, headers)
+            except Exception:
+                pass
+
+
+def start_metrics_reporter(server_url=None, headers=None, room=None, interval=METRICS_INTERVAL):
+    """Start the process-wide background reporter once; later calls only update the room label."""
+    global _reporter_thread
+    with _reporter_lock:
+        if room is not None:
+            _reporter_state['room'] = room
+        if _reporter_thread is None and interval > 0:
+            _reporter_thread = threading.Thread(target=_reporter_loop, args=(server_url, headers, interval), name='latency-metrics', daemon=True)
+            _reporter_thread.start()
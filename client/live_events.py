@@ -0,0 +1,182 @@
+"""Kiosk side of the backend's ``/api/events`` Server-Sent Events stream.
+
+One background thread per kiosk process keeps the stream open and hands
+each event to the subscribed callbacks, on that thread. UI code must
+marshal onto the Tk loop itself. The event types are ``session``,
+``view_lock``, ``class`` and ``gallery``. Two more events are generated
+locally or at connect time:
+
+* ``hello`` - sent by the backend when the stream opens. When its
+  ``resync`` flag is set, events were missed and local state should be
+  reloaded once.
+* ``connection`` - raised locally whenever :attr:`LiveEventStream.connected`
+  changes.
+
+While :attr:`LiveEventStream.connected` is true, callers can trust state
+they keep up to date from events instead of polling. When the stream drops
+they go back to their regular polling until it reconnects. Reconnects
+resume from the last event id with jittered backoff. A backend without the
+endpoint is retried only every ``UNSUPPORTED_RETRY_SECONDS``.
+``FRCAS_LIVE_EVENTS=0`` turns the stream off, which leaves every caller
+polling.
+"""
+
+import json
+import os
+import threading
+
+import requests
+
+from api_client import backoff_delay, get_api_client
+
+LIVE_EVENTS_ENABLED = os.environ.get('FRCAS_LIVE_EVENTS', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+RECONNECT_BASE_SECONDS = 1.0
+RECONNECT_CAP_SECONDS = 60.0
+UNSUPPORTED_RETRY_SECONDS = 300.0
+
+
+class LiveEventStream:
+    """Reconnecting SSE reader that fans events out to subscribers."""
+
+    def __init__(self, server_url=None):
+        self.server_url = server_url
+        self.connected = False
+        self.last_event_id = None
+        self._listeners = []
+        self._listeners_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failures = 0
+
+    def subscribe(self, callback):
+        """Call ``callback(event_type, data)`` for every event; returns ``callback``."""
+        with self._listeners_lock:
+            self._listeners.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._listeners_lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='live-events', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _dispatch(self, event_type, data):
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(event_type, data)
+            except Exception:
+                pass
+
+    def _set_connected(self, connected):
+        if self.connected != connected:
+            self.connected = connected
+            self._dispatch('connection', {'connected': connected})
+
+    def _consume(self, response):
+        event_type, data_lines = 'message', []
+        for line in response.iter_lines(decode_unicode=True):
+            if self._stop.is_set():
+                return
+            if line is None:
+                continue
+            if not line:
+                if data_lines:
+                    try:
+                        data = json.loads('\n'.join(data_lines))
+                    except ValueError:
+                        data = None
+                    if event_type == 'hello':
+                        self._failures = 0
+                        self._set_connected(True)
+                    if isinstance(data, dict):
+                        self._dispatch(event_type, data)
+                event_type, data_lines = 'message', []
+                continue
+            if line.startswith(':'):
+                continue
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'event':
+                event_type = value
+            elif field == 'data':
+                data_lines.append(value)
+            elif field == 'id':
+                self.last_event_id = value
+
+    def _run(self):
+        while not self._stop.is_set():
+            delay = None
+            try:
+                with get_api_client(self.server_url).event_stream(self.last_event_id) as response:
+                    if response.status_code in (404, 405):
+                        delay = UNSUPPORTED_RETRY_SECONDS
+                    elif response.status_code == 200:
+                        self._consume(response)
+            except requests.exceptions.RequestException:
+                pass
+            finally:
+                self._set_connected(False)
+            if delay is None:
+                self._failures += 1
+                delay = RECONNECT_BASE_SECONDS + backoff_delay(self._failures, base=RECONNECT_BASE_SECONDS, cap=RECONNECT_CAP_SECONDS)
+            self._stop.wait(delay)
+
+
+class GalleryGenerationWatch:
+    """Face cache generation as announced on the stream, so scanners can skip meta polls."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.generation = None
+        self._changed = threading.Event()
+        stream.subscribe(self._on_event)
+
+    def _on_event(self, event_type, data):
+        if event_type == 'gallery':
+            generation = data.get('generation')
+        elif event_type == 'hello':
+            generation = data.get('gallery_generation')
+        else:
+            return
+        if generation is not None:
+            self.generation = generation
+            self._changed.set()
+
+    def remote_generation(self, fetch_meta):
+        """Latest generation: from the stream while connected, otherwise from ``fetch_meta()``."""
+        if self.stream.connected and self.generation is not None:
+            return self.generation
+        meta = fetch_meta()
+        return meta.get('generation') if meta is not None else None
+
+    def wait(self, timeout):
+        """Sleep up to ``timeout`` seconds, waking early when a new generation is announced."""
+        self._changed.wait(timeout)
+        self._changed.clear()
+
+    def close(self):
+        self.stream.unsubscribe(self._on_event)
+
+
+_stream = None
+_stream_lock = threading.Lock()
+
+
+def get_live_events():
+    """Return the process-wide stream, starting it on first use unless ``FRCAS_LIVE_EVENTS`` is off."""
+    global _stream
+    with _stream_lock:
+        if _stream is None:
+            _stream = LiveEventStream()
+            if LIVE_EVENTS_ENABLED:
+                _stream.start()
+        return _stream
@@ -0,0 +1,68 @@
+"""Cheap motion gate that runs before face detection and embedding.
+
+Consecutive frames are downscaled to grayscale, blurred and differenced. When
+nothing moved for ``hold_seconds`` the scanner skips Haar detection and the
+CNN entirely, so an idle kiosk leaves the CPU to the Tk display thread. The
+last difference mask also tells whether a tracked face region changed, which
+keeps static faces such as posters from being re-embedded.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_GATE_WIDTH = 160
+DEFAULT_PIXEL_THRESHOLD = 18
+DEFAULT_MIN_CHANGED_FRACTION = 0.004
+DEFAULT_REGION_CHANGED_FRACTION = 0.02
+DEFAULT_HOLD_SECONDS = 1.0
+
+
+class MotionGate:
+    """Frame-differencing gate on a small grayscale copy of each frame."""
+
+    def __init__(self, width=DEFAULT_GATE_WIDTH, pixel_threshold=DEFAULT_PIXEL_THRESHOLD, min_changed_fraction=DEFAULT_MIN_CHANGED_FRACTION, hold_seconds=DEFAULT_HOLD_SECONDS):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.hold_seconds = hold_seconds
+        self._previous = None
+        self._mask = None
+        self._scale = 1.0
+        self._last_motion = None
+
+    def reset(self):
+        self._previous = None
+        self._mask = None
+        self._last_motion = None
+
+    def update(self, frame, now=None):
+        """Feed a BGR frame; returns True while motion was seen within ``hold_seconds``."""
+        now = time.time() if now is None else now
+        height, width = frame.shape[:2]
+        self._scale = self.width / float(width)
+        small = cv2.resize(frame, (self.width, max(1, int(round(height * self._scale)))), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        previous = self._previous
+        self._previous = small
+        if previous is None or previous.shape != small.shape:
+            self._mask = None
+            self._last_motion = now
+            return True
+        self._mask = cv2.absdiff(small, previous) > self.pixel_threshold
+        if np.count_nonzero(self._mask) >= self.min_changed_fraction * self._mask.size:
+            self._last_motion = now
+        return self._last_motion is not None and now - self._last_motion <= self.hold_seconds
+
+    def region_changed(self, box, min_fraction=DEFAULT_REGION_CHANGED_FRACTION):
+        """True when enough pixels inside full-resolution ``box`` changed in the last update."""
+        if self._mask is None:
+            return True
+        x, y, w, h = box
+        left = max(0, int(x * self._scale))
+        top = max(0, int(y * self._scale))
+        region = self._mask[top:top + max(1, int(round(h * self._scale))), left:left + max(1, int(round(w * self._scale)))]
+        if not region.size:
+            return False
+        return np.count_nonzero(region) >= min_fraction * region.size
@@ -0,0 +1,89 @@
+"""Camera preview rendering for the kiosk windows.
+
+Building a full-size PIL image and a fresh ``ImageTk.PhotoImage`` for every
+frame churns memory and Tk main-thread time. :class:`PreviewRenderer` instead
+shrinks the BGR frame to the widget with ``cv2.resize``, draws face boxes on
+that small image, converts only the small image to RGB, and pastes it into
+one reused ``PhotoImage``. It also times itself and how late the Tk event loop
+runs its callbacks, and stretches the preview interval when Tk falls behind.
+"""
+
+import time
+
+import cv2
+from PIL import Image, ImageTk
+
+DEFAULT_PREVIEW_FPS = 30.0
+MIN_PREVIEW_FPS = 8.0
+BOX_COLOR_BGR = (0, 255, 0)
+BOX_THICKNESS = 3
+BACKOFF_FACTOR = 1.25
+RECOVER_FACTOR = 0.95
+
+
+class PreviewRenderer:
+    """Renders frames into one reused ``PhotoImage`` at an adaptive frame rate."""
+
+    def __init__(self, max_fps=DEFAULT_PREVIEW_FPS, min_fps=MIN_PREVIEW_FPS, box_color=BOX_COLOR_BGR, box_thickness=BOX_THICKNESS):
+        self.min_interval = 1.0 / max_fps
+        self.max_interval = 1.0 / min_fps
+        self.interval = self.min_interval
+        self.box_color = box_color
+        self.box_thickness = box_thickness
+        self.photo = None
+        self.last_render = 0.0
+
+    def due(self, now=None):
+        """True when the current preview interval has elapsed since the last render."""
+        now = time.time() if now is None else now
+        return now - self.last_render >= self.interval
+
+    def next_delay_ms(self):
+        """Delay in milliseconds for ``after()``-driven preview loops."""
+        return max(1, int(self.interval * 1000))
+
+    def fit_size(self, frame_shape, target_size):
+        """Largest size with the frame's aspect ratio that fits ``target_size``, never upscaling."""
+        height, width = frame_shape[:2]
+        target_w, target_h = target_size
+        scale = min(target_w / float(width), target_h / float(height), 1.0)
+        return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+    def render(self, frame, target_size, boxes=(), scheduled_at=None):
+        """Draw ``frame`` scaled into ``target_size`` with ``boxes`` outlined.
+
+        Returns ``(photo, created)``. ``created`` is True when a new
+        ``PhotoImage`` had to be made, so the widget must be pointed at it.
+        ``scheduled_at`` is when the caller queued this render on the Tk loop.
+        """
+        started = time.time()
+        size = self.fit_size(frame.shape, target_size)
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if boxes:
+            scale_x = size[0] / float(frame.shape[1])
+            scale_y = size[1] / float(frame.shape[0])
+            for x, y, w, h in boxes:
+                cv2.rectangle(small, (int(x * scale_x), int(y * scale_y)), (int((x + w) * scale_x), int((y + h) * scale_y)), self.box_color, self.box_thickness)
+        image = Image.fromarray(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+        created = self.photo is None or (self.photo.width(), self.photo.height()) != size
+        if created:
+            self.photo = ImageTk.PhotoImage(image=image)
+        else:
+            self.photo.paste(image)
+        finished = time.time()
+        lateness = started - scheduled_at if scheduled_at is not None else 0.0
+        self._adapt(finished - started + max(0.0, lateness))
+        self.last_render = finished
+        return (self.photo, created)
+
+    def _adapt(self, load):
+        """Back off when rendering plus Tk lateness eats half the interval; recover slowly otherwise."""
+        if load > self.interval * 0.5:
+            self.interval = min(self.max_interval, self.interval * BACKOFF_FACTOR)
+        elif load < self.interval * 0.2:
+            self.interval = max(self.min_interval, self.interval * RECOVER_FACTOR)
+
+    def reset(self):
+        self.photo = None
+        self.interval = self.min_interval
+        self.last_render = 0.0
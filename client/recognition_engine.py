@@ -0,0 +1,134 @@
+"""Headless capture → detect → embed → match pipeline.
+
+:class:`RecognitionEngine` does the per-frame work of the attendance scanner
+and does not depend on Tk. It runs the motion gate, Haar detection and face
+tracking, embeds the tracks that need it and matches the embeddings against
+the gallery. It returns what to announce. ``FacialRecognitionApp`` drives it
+from its recognition thread and handles all widget updates.
+``benchmark_recognition.py`` drives it from recorded images or video.
+
+The engine records each stage's wall time to the shared latency metrics and
+the stage's thread CPU time to :attr:`RecognitionEngine.cpu_seconds`.
+"""
+
+import time
+from contextlib import contextmanager
+
+from face_detector import FaceDetector
+from face_tracker import FaceTracker
+from latency_metrics import record as record_latency
+from motion_gate import MotionGate
+
+
+class EngineFrame:
+    """Outcome of :meth:`RecognitionEngine.process` for one frame."""
+
+    def __init__(self):
+        self.skipped = False
+        self.faces = []
+        self.tracks = []
+        self.warming = False
+        self.embedded = 0
+        self.new_tracks = 0
+        self.identities = []
+        self.error = None
+
+
+class RecognitionEngine:
+    """Per-frame face recognition with no UI.
+
+    ``embed(frame, boxes)`` returns ``[(box, embedding), ...]``, and
+    ``match(embeddings)`` returns one ``(name, person_type, confidence,
+    person_id)`` tuple per embedding. ``is_ready()`` tells whether the embedder
+    can take work yet.
+    """
+
+    def __init__(self, embed, match, is_ready=None, tracker=None, motion_gate=None, detector=None):
+        self.embed = embed
+        self.match = match
+        self.is_ready = is_ready or (lambda: True)
+        self.detector = detector or FaceDetector()
+        self.tracker = tracker or FaceTracker()
+        self.motion_gate = motion_gate or MotionGate()
+        self.cpu_seconds = {}
+
+    @contextmanager
+    def _stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            record_latency(name, time.perf_counter() - wall)
+            self.cpu_seconds[name] = self.cpu_seconds.get(name, 0.0) + time.thread_time() - cpu
+
+    def reset(self):
+        self.tracker.reset()
+        self.motion_gate.reset()
+
+    def detect(self, frame):
+        """Full-resolution Haar face boxes of ``frame`` as ``(x, y, w, h)`` tuples."""
+        return self.detector.detect(frame)
+
+    def process(self, frame, now=None, paused=False, single=False, reannounce=False):
+        """Run one frame through the pipeline.
+
+        ``paused`` keeps tracking without embedding, as the scanner does while
+        a result is on screen. ``single`` embeds only the largest face.
+        ``reannounce`` reports identities even when their track already
+        announced them.
+        """
+        now = time.time() if now is None else now
+        result = EngineFrame()
+        with self._stage('motion_gate'):
+            moving = self.motion_gate.update(frame, now)
+        if not moving:
+            self.tracker.hold(now)
+            result.skipped = True
+            return result
+        started = time.perf_counter()
+        try:
+            with self._stage('detect'):
+                result.faces = self.detect(frame)
+            result.tracks = self.tracker.update(result.faces, now)
+            result.new_tracks = sum((1 for track in result.tracks if track.first_seen == now))
+            if paused or not result.tracks:
+                return result
+            try:
+                self._recognize(frame, result, single, reannounce)
+            except Exception as exc:
+                result.error = exc
+            return result
+        finally:
+            record_latency('recognition.frame', time.perf_counter() - started)
+
+    def _recognize(self, frame, result, single, reannounce):
+        tracks = sorted(result.tracks, key=lambda item: item.box[2] * item.box[3], reverse=True)
+        if single:
+            tracks = tracks[:1]
+        pending = {}
+        for track in tracks:
+            if not self.tracker.needs_embedding(track):
+                continue
+            if track.frames_since_embed is not None and (not self.motion_gate.region_changed(track.box)):
+                track.postpone()
+                continue
+            pending[track.box] = track
+        if pending and (not self.is_ready()):
+            result.warming = True
+            pending = {}
+        if pending:
+            with self._stage('embed'):
+                faces = self.embed(frame, list(pending))
+            with self._stage('match'):
+                identities = self.match([embedding for _box, embedding in faces])
+            result.embedded = len(faces)
+            for (box, _embedding), identity in zip(faces, identities):
+                pending[box].remember(identity)
+        for track in tracks:
+            if track.identity is None:
+                continue
+            announce_key = (track.identity[1], track.identity[3])
+            if announce_key != track.announced or reannounce:
+                track.announced = announce_key
+                result.identities.append(track.identity)
@@ -0,0 +1,93 @@
+"""Adaptive pacing for the scanners' recognition threads.
+
+Fixed sleeps overload weak mini-PCs and waste responsiveness on desktops. The
+:class:`RecognitionScheduler` instead sleeps long enough that recognition
+work stays within ``FRCAS_RECOGNITION_CPU_BUDGET``, the fraction of wall time
+the loop may spend detecting and embedding. Work time includes waiting on the
+inference worker, so the worker's CPU is covered too. Every few seconds the
+scheduler also samples this process's CPU share of the machine. While that
+share is above ``FRCAS_MAX_PROCESS_LOAD`` it stretches the delay further.
+
+A new face track boosts the rate for ``boost_seconds`` so the first
+recognition is quick. An idle scene (motion gate closed or no faces) backs off
+to ``idle_interval``.
+"""
+
+import os
+import time
+
+CPU_BUDGET = float(os.environ.get('FRCAS_RECOGNITION_CPU_BUDGET', '0.5'))
+MAX_PROCESS_LOAD = float(os.environ.get('FRCAS_MAX_PROCESS_LOAD', '0.75'))
+MIN_INTERVAL = 0.02
+MAX_INTERVAL = 1.0
+IDLE_INTERVAL = 0.4
+BOOST_SECONDS = 2.0
+COST_SMOOTHING = 0.3
+LOAD_SAMPLE_SECONDS = 2.0
+MAX_LOAD_PENALTY = 4.0
+
+
+class RecognitionScheduler:
+    """Turns the cost of each loop iteration into the sleep before the next one."""
+
+    def __init__(self, cpu_budget=CPU_BUDGET, max_process_load=MAX_PROCESS_LOAD, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, idle_interval=IDLE_INTERVAL, boost_seconds=BOOST_SECONDS):
+        self.cpu_budget = min(1.0, max(0.05, cpu_budget))
+        self.max_process_load = max_process_load
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval
+        self.boost_seconds = boost_seconds
+        self.cost = None
+        self.load_penalty = 1.0
+        self.boost_until = 0.0
+        self.last_delay = min_interval
+        self._cpu_count = os.cpu_count() or 1
+        self._load_wall = time.perf_counter()
+        self._load_cpu = time.process_time()
+
+    def boost(self, now=None):
+        """Run at the fastest budget-free rate for a little while, e.g. when a new face appears."""
+        now = time.time() if now is None else now
+        self.boost_until = now + self.boost_seconds
+
+    def _sample_load(self):
+        wall = time.perf_counter()
+        elapsed = wall - self._load_wall
+        if elapsed < LOAD_SAMPLE_SECONDS:
+            return
+        cpu = time.process_time()
+        share = (cpu - self._load_cpu) / (elapsed * self._cpu_count)
+        self._load_wall = wall
+        self._load_cpu = cpu
+        if share > self.max_process_load:
+            self.load_penalty = min(MAX_LOAD_PENALTY, self.load_penalty * 1.5)
+        else:
+            self.load_penalty = max(1.0, self.load_penalty * 0.8)
+
+    def next_delay(self, work_seconds, idle=False, new_track=False, now=None):
+        """Seconds to sleep after an iteration whose work took ``work_seconds``."""
+        now = time.time() if now is None else now
+        work_seconds = max(0.0, work_seconds)
+        self.cost = work_seconds if self.cost is None else (1 - COST_SMOOTHING) * self.cost + COST_SMOOTHING * work_seconds
+        self._sample_load()
+        if new_track:
+            self.boost(now)
+        if now < self.boost_until:
+            delay = self.min_interval
+        elif idle:
+            delay = max(self.idle_interval, self.cost * (1.0 - self.cpu_budget) / self.cpu_budget)
+        else:
+            delay = self.cost * (1.0 - self.cpu_budget) / self.cpu_budget
+        delay = min(self.max_interval, max(self.min_interval, delay * self.load_penalty))
+        self.last_delay = delay
+        return delay
+
+    def pause(self, work_seconds, idle=False, new_track=False, running=None):
+        """Sleep for :meth:`next_delay`; ``running`` is polled so shutdown is not held up."""
+        delay = self.next_delay(work_seconds, idle=idle, new_track=new_track)
+        deadline = time.perf_counter() + delay
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or (running is not None and not running()):
+                return
+            time.sleep(min(remaining, 0.1))
@@ -0,0 +1,123 @@
+import requests
+
+import attendance_journal as aj
+from attendance_journal import KIND_INSTRUCTOR_CHECKOUT, KIND_STUDENT_ATTENDANCE, STATE_DELIVERED, STATE_PENDING, STATE_REJECTED, AttendanceJournal, JournalFlusher, outcome_for_status, retry_delay
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, body=None, text=''):
+        self.status_code = status_code
+        self.ok = 200 <= status_code < 400
+        self.text = text
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError('no JSON body')
+        return self._body
+
+
+class FakeClient:
+    """Answers each call with the next queued response, or raises it when it is an exception."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def _answer(self, name, payload):
+        self.calls.append((name, payload))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def record_student_attendance(self, payload, headers=None):
+        return self._answer('student', payload)
+
+    def instructor_checkout(self, payload, headers=None):
+        return self._answer('checkout', payload)
+
+    def record_attendance_batch(self, items):
+        return self._answer('batch', items)
+
+
+def make_flusher(tmp_path, monkeypatch, *responses):
+    client = FakeClient(*responses)
+    monkeypatch.setattr(aj, 'get_api_client', lambda server_url=None: client)
+    return JournalFlusher(AttendanceJournal(str(tmp_path / 'journal.sqlite3'))), client
+
+
+def test_outcome_for_status():
+    assert outcome_for_status(201) == STATE_DELIVERED
+    assert outcome_for_status(409) == STATE_DELIVERED
+    assert outcome_for_status(400) == STATE_REJECTED
+    assert outcome_for_status(422) == STATE_REJECTED
+    assert outcome_for_status(429) == STATE_PENDING
+    assert outcome_for_status(503) == STATE_PENDING
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert retry_delay(0) == aj.RETRY_BASE_SECONDS
+    assert retry_delay(1) == aj.RETRY_BASE_SECONDS * 2
+    assert retry_delay(-5) == aj.RETRY_BASE_SECONDS
+    assert retry_delay(10 ** 6) == aj.RETRY_CAP_SECONDS
+
+
+def test_journal_state_machine(tmp_path):
+    journal = AttendanceJournal(str(tmp_path / 'journal.sqlite3'))
+    first = journal.append(KIND_STUDENT_ATTENDANCE, {'student_id': 'S1'})
+    second = journal.append(KIND_STUDENT_ATTENDANCE, {'student_id': 'S2'})
+    assert journal.append(KIND_STUDENT_ATTENDANCE, {'student_id': 'S1'}, key=first) == first
+    assert [entry['idempotency_key'] for entry in journal.due(now=0)] == [first, second]
+    assert journal.entry(first)['payload']['idempotency_key'] == first
+
+    journal.settle(first, STATE_PENDING, status_code=503, now=100)
+    assert [entry['idempotency_key'] for entry in journal.due(now=100)] == [second]
+    assert [entry['idempotency_key'] for entry in journal.due(now=100 + retry_delay(0))] == [first, second]
+
+    journal.settle(first, STATE_DELIVERED, status_code=201, now=200)
+    journal.settle(second, STATE_REJECTED, status_code=400, error='bad', now=200)
+    assert journal.pending_count() == 0
+    assert journal.entry(first)['attempts'] == 2
+    journal.prune(older_than=50, now=240)
+    assert journal.entry(second) is not None
+    journal.prune(older_than=50, now=260)
+    assert journal.entry(first) is None and journal.entry(second) is None
+
+
+def test_offline_checkout_rejected_later_is_reported(tmp_path, monkeypatch):
+    flusher, client = make_flusher(tmp_path, monkeypatch, requests.exceptions.ConnectionError('down'), FakeResponse(400, text='Class already ended'))
+    outcomes = []
+    flusher.subscribe(lambda *outcome: outcomes.append(outcome))
+    key, response = flusher.submit(KIND_INSTRUCTOR_CHECKOUT, {'class_id': 7})
+    assert response is None and not flusher.online
+    assert outcomes == []
+    assert flusher.flush() == 1
+    entry, state, status_code, error = outcomes[0]
+    assert entry['idempotency_key'] == key and entry['payload']['class_id'] == 7
+    assert (state, status_code, error) == (STATE_REJECTED, 400, 'Class already ended')
+    assert flusher.journal.entry(key)['state'] == STATE_REJECTED
+
+
+def test_server_error_keeps_entry_pending_with_backoff(tmp_path, monkeypatch):
+    flusher, client = make_flusher(tmp_path, monkeypatch, FakeResponse(503, text='busy'))
+    key, response = flusher.submit(KIND_STUDENT_ATTENDANCE, {'student_id': 'S1'})
+    assert response is None
+    entry = flusher.journal.entry(key)
+    assert entry['state'] == STATE_PENDING and entry['attempts'] == 1
+    assert entry['next_attempt_at'] > entry['created_at']
+    assert flusher.flush() == 0
+    assert len(client.calls) == 1
+
+
+def test_batch_results_settle_each_entry(tmp_path, monkeypatch):
+    results = {'results': [{'index': 0, 'code': 201}, {'index': 1, 'code': 409}, {'index': 2, 'code': 422, 'message': 'No active session'}]}
+    flusher, client = make_flusher(tmp_path, monkeypatch, FakeResponse(207, body=results))
+    outcomes = []
+    flusher.subscribe(lambda *outcome: outcomes.append(outcome))
+    keys = [flusher.journal.append(KIND_STUDENT_ATTENDANCE, {'student_id': f'S{index}'}) for index in range(4)]
+    assert flusher.flush() == 3
+    assert [name for name, _payload in client.calls] == ['batch']
+    assert [flusher.journal.entry(key)['state'] for key in keys] == [STATE_DELIVERED, STATE_DELIVERED, STATE_REJECTED, STATE_PENDING]
+    assert [state for _entry, state, _code, _error in outcomes] == [STATE_DELIVERED, STATE_DELIVERED, STATE_REJECTED]
@@ -0,0 +1,96 @@
+import numpy as np
+
+from face_gallery import PERSON_TYPE_INSTRUCTOR, PERSON_TYPE_STUDENT, FaceGallery, IVFIndex, index_path_for, load_face_gallery, normalize_embedding
+
+
+def clustered_gallery(rows=400, clusters=16, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    matrix = np.vstack([normalize_embedding(centers[i % clusters] + 0.3 * rng.normal(size=dim)) for i in range(rows)])
+    ids = [f'P{i}' for i in range(rows)]
+    types = [PERSON_TYPE_INSTRUCTOR if i % 10 == 0 else PERSON_TYPE_STUDENT for i in range(rows)]
+    return FaceGallery(matrix, ids, [f'Person {i}' for i in range(rows)], types), rng
+
+
+def build_index(gallery, nlist, nprobe):
+    centroids = np.vstack([normalize_embedding(gallery.matrix[i::nlist].mean(axis=0)) for i in range(nlist)])
+    lists = np.argmax(gallery.matrix @ centroids.T, axis=1)
+    order = np.argsort(lists, kind='stable').astype(np.int32)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(lists, minlength=nlist), out=offsets[1:])
+    return IVFIndex(centroids, offsets, order, nprobe=nprobe)
+
+
+def noisy_queries(gallery, rng, count=50, noise=0.05):
+    picks = rng.choice(len(gallery), size=count, replace=False)
+    return np.vstack([normalize_embedding(gallery.matrix[i] + noise * rng.normal(size=gallery.dimension)) for i in picks])
+
+
+def test_best_matches_agrees_with_best_match():
+    gallery, rng = clustered_gallery()
+    queries = noisy_queries(gallery, rng)
+    for person_type in (None, PERSON_TYPE_STUDENT, PERSON_TYPE_INSTRUCTOR):
+        batched = gallery.best_matches(queries, threshold=2.0, person_type=person_type)
+        single = [gallery.best_match(query, threshold=2.0, person_type=person_type) for query in queries]
+        assert [hit.person_id for hit in batched] == [hit.person_id for hit in single]
+        assert np.allclose([hit.distance for hit in batched], [hit.distance for hit in single], atol=1e-5)
+    assert gallery.best_matches(np.zeros((0, gallery.dimension))) == []
+
+
+def test_best_matches_applies_threshold():
+    gallery, rng = clustered_gallery()
+    known = gallery.matrix[3]
+    stranger = normalize_embedding(rng.normal(size=gallery.dimension))
+    hits = gallery.best_matches(np.vstack([known, stranger]), threshold=0.1)
+    assert hits[0].person_id == 'P3' and hits[0].distance < 1e-3
+    assert hits[1] is None
+
+
+def test_ivf_search_recalls_exact_neighbours():
+    gallery, rng = clustered_gallery()
+    queries = noisy_queries(gallery, rng)
+    exact = [gallery.best_match(query, threshold=2.0, exact=True).person_id for query in queries]
+    gallery.index = build_index(gallery, nlist=16, nprobe=4)
+    approximate = [hit.person_id if hit else None for hit in gallery.best_matches(queries, threshold=2.0)]
+    assert sum(a == b for a, b in zip(approximate, exact)) >= 0.95 * len(exact)
+    gallery.index.nprobe = gallery.index.nlist
+    assert [hit.person_id for hit in gallery.best_matches(queries, threshold=2.0)] == exact
+
+
+def test_zero_nprobe_disables_the_index():
+    gallery, rng = clustered_gallery()
+    gallery.index = build_index(gallery, nlist=16, nprobe=0)
+    rows, _ = gallery.distances(gallery.matrix[0])
+    assert len(rows) == len(gallery)
+
+
+def test_apply_delta_replaces_and_removes_people():
+    gallery, rng = clustered_gallery(rows=40)
+    gallery.index = build_index(gallery, nlist=4, nprobe=4)
+    replacement = normalize_embedding(rng.normal(size=gallery.dimension))
+    updated = gallery.apply_delta([{'person_type': PERSON_TYPE_STUDENT, 'person_id': 'P1', 'name': 'Renamed', 'embeddings': [replacement, replacement]}], [{'person_type': PERSON_TYPE_STUDENT, 'person_id': 'P2'}])
+    assert len(gallery) == 40 and len(updated) == 40 - 2 + 2
+    assert 'P2' not in set(updated.ids)
+    assert list(updated.names[updated.ids == 'P1']) == ['Renamed', 'Renamed']
+    assert updated.index is not None and len(updated.index.order) == len(updated)
+    assert updated.best_match(replacement, threshold=0.1).person_id == 'P1'
+
+
+def test_subset_keeps_requested_people():
+    gallery, _ = clustered_gallery(rows=40)
+    roster = gallery.subset([(PERSON_TYPE_STUDENT, 'P1'), (PERSON_TYPE_STUDENT, 'P5'), (PERSON_TYPE_STUDENT, 'P10')])
+    assert sorted(roster.ids) == ['P1', 'P5']
+    assert len(gallery.subset([])) == 0
+
+
+def test_saved_gallery_and_index_load_together(tmp_path):
+    gallery, rng = clustered_gallery(rows=60)
+    cache_file = tmp_path / 'face_encodings.pkl'
+    gallery.save(str(tmp_path / 'face_gallery.bin'))
+    build_index(gallery, nlist=4, nprobe=2).save(index_path_for(str(cache_file)), gallery.labels_crc)
+    loaded = load_face_gallery(str(cache_file))
+    assert list(loaded.ids) == list(gallery.ids) and list(loaded.types) == list(gallery.types)
+    assert np.allclose(loaded.matrix, gallery.matrix)
+    assert loaded.index is not None and loaded.index.nlist == 4
+    gallery.apply_delta([], [{'person_type': PERSON_TYPE_STUDENT, 'person_id': 'P1'}]).save(str(tmp_path / 'face_gallery.bin'))
+    assert load_face_gallery(str(cache_file)).index is None